@@ -1,10 +1,24 @@
+import itertools
+import math
+from array import array
+import queue
+import threading
+import time
 import tkinter as tk
+from collections import OrderedDict, deque
+from dataclasses import astuple
 from tkinter import ttk, messagebox
+from concurrent.futures import ThreadPoolExecutor
+from logging.handlers import QueueHandler
 from src.crud_service import (
-    init, crear_proyecto, listar_proyectos, obtener_proyecto,
-    actualizar_proyecto, eliminar_proyecto, simular_proyecto
+    init, crear_proyecto, iterar_proyectos, obtener_proyecto,
+    actualizar_proyecto, eliminar_proyecto, simular_proyecto, simular_lote, guardar_impacto
 )
 import src.logger_base as _log
+from src.metricas import registro as registro_metricas
+from src.tablas import ProjectTable, ImpactoTable
+from src.trazas import en_contexto
+from src.vigilancia import Vigilante
 from src.constants import TIPOS_PROYECTO
 
 log = _log.log
@@ -15,6 +29,62 @@ ACCENT   = "#22c55e"   # green-500
 ACCENT_H = "#16a34a"   # green-600
 MUTED    = "#94a3b8"   # slate-400
 
+# Cada cuánto (ms) el hilo de Tk vacía la cola de resultados de los workers (~60 fps)
+INTERVALO_COLA_MS = 16
+# Simulaciones que pueden correr a la vez en segundo plano
+MAX_SIMULACIONES = 4
+# Filas que se materializan de golpe en la barra lateral; el resto se agrega al hacer scroll
+FILAS_POR_PAGINA = 200
+# Filas que la barra lateral tiene como máximo en el Treeview (una ventana que se corre con el scroll)
+VENTANA_LISTA = 3 * FILAS_POR_PAGINA
+# Espera (ms) tras la última tecla antes de filtrar, y filas revisadas por tick de Tk
+DEBOUNCE_BUSQUEDA_MS = 250
+BUSQUEDA_POR_TICK = 5000
+# Simulaciones especulativas (al seleccionar una fila) que se guardan como máximo, y
+# espera (ms) con la misma fila seleccionada antes de lanzarla (al recorrer con las flechas no se lanza)
+PREFETCH_MAX = 8
+DEBOUNCE_PREFETCH_MS = 400
+# Pestaña Logs: líneas que se conservan y cada cuánto (ms) se vuelcan los registros nuevos
+LOG_MAX_LINEAS = 2000
+LOG_INTERVALO_MS = 100
+NIVELES_LOG = ("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL")
+# Pestaña Métricas: cada cuánto (ms) se refresca mientras está visible
+METRICAS_INTERVALO_MS = 1000
+# Pestaña Lote: refresco del progreso, del gráfico y tamaño de celda del gráfico (nivel de detalle)
+LOTE_INTERVALO_MS = 200
+LOTE_GRAFICO_MS = 1000
+LOTE_CELDA_PX = 3
+# Columnas de la tabla de resultados: (clave, título, ancho)
+COLUMNAS_LOTE = (
+    ("id", "ID", 60), ("nombre", "Nombre", 140), ("tipo", "Tipo", 90),
+    ("riesgo", "Riesgo %", 70), ("aire", "Aire", 60), ("agua", "Agua", 60),
+    ("biodiv", "Biodiv.", 60), ("suelo", "Suelo", 60), ("origen", "Origen", 70),
+)
+# Campo de ProjectTable o ImpactoTable del que sale cada columna de la tabla del lote
+CAMPOS_LOTE = {
+    "id": "id", "nombre": "nombre", "tipo": "tipo", "riesgo": "riesgo_total", "aire": "calidad_aire",
+    "agua": "calidad_agua", "biodiv": "biodiversidad", "suelo": "uso_suelo", "origen": "origen",
+}
+
+
+class _Prefetch:
+    """Simulación lanzada al seleccionar un proyecto, por si luego se pide."""
+
+    def __init__(self, clave: tuple, futuro):
+        self.clave = clave      # Contenido del proyecto cuando se lanzó
+        self.futuro = futuro
+
+
+class _TrabajoSimulacion:
+    """Una simulación lanzada desde la GUI que corre en el pool de workers."""
+
+    def __init__(self, num: int, pid: str):
+        self.num = num
+        self.pid = pid
+        self.cancelado = threading.Event()
+        self.futuro = None
+        self.categoria_en_vivo = None
+
 class App(tk.Tk):
     def __init__(self):
         super().__init__()
@@ -24,8 +94,31 @@ class App(tk.Tk):
         self.minsize(900, 560)
         self._style()
         init()
+        # Las simulaciones corren en segundo plano; los resultados vuelven por esta cola
+        self._pool = ThreadPoolExecutor(max_workers=MAX_SIMULACIONES, thread_name_prefix="sim")
+        self._cola_ui = queue.Queue()
+        self._trabajos = {}
+        self._contador_trabajos = itertools.count(1)
+        self._trabajo_visible = None
+        # Prefetch: un solo worker aparte para no quitarle hilos a lo que pide el usuario
+        self._pool_prefetch = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prefetch")
+        self._prefetch = OrderedDict()   # pid -> _Prefetch, el más reciente al final
+        self._prefetch_pendiente = None  # after() de la última selección
+        self._lock_prefetch = threading.Lock()
+        # Los registros de logging llegan por una cola y se vuelcan en la pestaña Logs
+        self._cola_logs = queue.Queue()
+        self._buffer_logs = deque(maxlen=LOG_MAX_LINEAS)   # [(nivel, texto)]
+        self._handler_logs = QueueHandler(self._cola_logs)
+        self._handler_logs.setFormatter(log.Formatter('%(asctime)s %(levelname)s [%(filename)s] %(message)s', '%H:%M:%S'))
+        # La pestaña filtra por su cuenta, así que le llega todo desde DEBUG
+        self._handler_logs.setLevel(log.DEBUG)
+        _log.agregar_handler(self._handler_logs)
         self._build_ui()
         self._refresh_list()
+        self.protocol("WM_DELETE_WINDOW", self._cerrar)
+        self.after(INTERVALO_COLA_MS, self._procesar_cola_ui)
+        self.after(LOG_INTERVALO_MS, self._volcar_logs)
+        self.after(METRICAS_INTERVALO_MS, self._refrescar_metricas)
         log.debug('Aplicación inicializada correctamente')
 
     # ---------------------- Estilos ----------------------
@@ -100,15 +193,21 @@ class App(tk.Tk):
 
         self.tab_proyectos = tk.Frame(self.tabs, bg="white")
         self.tab_sim = tk.Frame(self.tabs, bg="white")
+        self.tab_lote = tk.Frame(self.tabs, bg="white")
         self.tab_logs = tk.Frame(self.tabs, bg="white")
+        self.tab_metricas = tk.Frame(self.tabs, bg="white")
 
         self.tabs.add(self.tab_proyectos, text="Proyectos")
         self.tabs.add(self.tab_sim, text="Simulación")
+        self.tabs.add(self.tab_lote, text="Lote")
         self.tabs.add(self.tab_logs, text="Logs")
+        self.tabs.add(self.tab_metricas, text="Métricas")
 
         self._build_tab_proyectos()
         self._build_tab_sim()
+        self._build_tab_lote()
         self._build_tab_logs()
+        self._build_tab_metricas()
 
     # ---------------------- Sidebar ----------------------
     def _build_sidebar(self):
@@ -122,19 +221,47 @@ class App(tk.Tk):
         ent = ttk.Entry(search_wrap, textvariable=self.var_search)
         ent.pack(side="left", fill="x", expand=True)
         ttk.Button(search_wrap, text="Buscar", command=self._search, style="Soft.TButton").pack(side="left", padx=6)
+        # Filtrado en vivo mientras se escribe (con debounce)
+        self._busqueda_pendiente = None   # after() programado por la última tecla
+        self._gen_busqueda = 0            # Sube con cada búsqueda nueva; las viejas se abandonan
+        self._indice_busqueda = []        # [(texto en minúsculas, fila)] de todos los proyectos
+        self._ultima_busqueda = None      # Texto de la última búsqueda completa
+        self._resultado_busqueda = []     # Su resultado, para refinar sin volver a recorrer todo
+        self.var_search.trace_add("write", self._al_escribir_busqueda)
 
-        # Treeview listado
+        # Treeview listado (solo se crean las filas cercanas a lo visible)
+        tree_wrap = tk.Frame(self.sidebar, bg=DARK_BG)
+        tree_wrap.pack(fill="both", expand=True, padx=8, pady=8)
         cols = ("id", "nombre", "tipo")
-        self.tree = ttk.Treeview(self.sidebar, columns=cols, show="headings", style="Sidebar.Treeview")
+        self.tree = ttk.Treeview(tree_wrap, columns=cols, show="headings", style="Sidebar.Treeview")
+        self.tree_scroll = ttk.Scrollbar(tree_wrap, orient="vertical", command=self._mover_lista)
+        self.tree.configure(yscrollcommand=self._al_desplazar_lista)
+        self.tree_scroll.pack(side="right", fill="y")
         self.tree.heading("id", text="ID")
         self.tree.heading("nombre", text="Nombre")
         self.tree.heading("tipo", text="Tipo")
         self.tree.column("id", width=50, anchor="w")
         self.tree.column("nombre", width=150, anchor="w")
         self.tree.column("tipo", width=90, anchor="w")
-        self.tree.pack(fill="both", expand=True, padx=8, pady=8)
+        self.tree.pack(side="left", fill="both", expand=True)
         self.tree.bind("<<TreeviewSelect>>", self._on_select)
 
+        # Modelo de la lista: todos los proyectos filtrados, aunque no estén en el widget
+        self._filas_lista = []      # [(id, nombre, tipo)] en orden
+        self._iids_lista = []       # iid de cada fila (el id, con sufijo si se repite)
+        self._alias_iid = {}        # iid -> id de las filas con sufijo
+        self._ventana = (0, 0)      # Filas [inicio, fin) del modelo que existen en el Treeview
+        self._ventana_pendiente = False
+
+        # Vigilancia del CSV: si otro proceso lo reescribe, simulo solo lo que cambió
+        self.var_vigilar = tk.BooleanVar(value=False)
+        tk.Checkbutton(self.sidebar, text="Vigilar cambios en el archivo", variable=self.var_vigilar,
+                       command=self._alternar_vigilancia, fg=DARK_FG, bg=DARK_BG, selectcolor=DARK_BG,
+                       activebackground=DARK_BG, activeforeground=DARK_FG).pack(anchor="w", padx=12, pady=(0,4))
+        self._vigilancia_parar = None   # Event del hilo de vigilancia activo
+        self._vigilante = None          # Vigilante activo, para avisarle de los cambios propios
+        self._vigilancia_resultados = {}  # id -> (proyecto, impacto) pendientes de volcar en la tabla
+
         # Footer hint
         tk.Label(self.sidebar, text="Tip: doble clic para cargar al formulario",
                  fg=MUTED, bg=DARK_BG, font=("", 9)).pack(anchor="w", padx=12, pady=(0,12))
@@ -214,50 +341,343 @@ class App(tk.Tk):
         btns = tk.Frame(inner, bg="white")
         btns.pack(fill="x", pady=(10,6))
         ttk.Button(btns, text="Simular Impacto", style="Primary.TButton", command=self._simular).pack(side="left")
+        ttk.Button(btns, text="Cancelar", style="Soft.TButton", command=self._cancelar_simulaciones).pack(side="left", padx=6)
+        self.var_estado_sim = tk.StringVar(value="")
+        tk.Label(btns, textvariable=self.var_estado_sim, bg="white", fg="#475569").pack(side="right")
+        self.spinner = ttk.Progressbar(btns, mode="indeterminate", length=120)
+        self.spinner.pack(side="right", padx=6)
+        self._spinner_activo = False
 
         self.txt_result = tk.Text(inner, height=14, bg="#f8fafc", relief="flat")
         self.txt_result.pack(fill="both", expand=True, pady=(6,0))
 
+    # ---------------------- Tab Lote ----------------------
+    def _build_tab_lote(self):
+        frm = ttk.LabelFrame(self.tab_lote, text="Simulación por lotes", style="Card.TLabelframe")
+        frm.pack(fill="both", expand=True, padx=4, pady=4)
+        inner = tk.Frame(frm, bg="white")
+        inner.pack(fill="both", expand=True, padx=8, pady=8)
+
+        btns = tk.Frame(inner, bg="white")
+        btns.pack(fill="x", pady=(0,6))
+        ttk.Button(btns, text="Simular seleccionados", style="Primary.TButton",
+                   command=lambda: self._simular_lote(seleccionados=True)).pack(side="left")
+        ttk.Button(btns, text="Simular todos", style="Soft.TButton",
+                   command=lambda: self._simular_lote(seleccionados=False)).pack(side="left", padx=6)
+        ttk.Button(btns, text="Cancelar", style="Soft.TButton", command=self._cancelar_lote).pack(side="left")
+        self.var_lote_estado = tk.StringVar(value="")
+        tk.Label(btns, textvariable=self.var_lote_estado, bg="white", fg="#475569").pack(side="right")
+        self.progreso_lote = ttk.Progressbar(btns, mode="determinate", length=180)
+        self.progreso_lote.pack(side="right", padx=6)
+
+        cuerpo = tk.Frame(inner, bg="white")
+        cuerpo.pack(fill="both", expand=True)
+        cuerpo.columnconfigure(0, weight=3)
+        cuerpo.columnconfigure(1, weight=2)
+        cuerpo.rowconfigure(0, weight=1)
+
+        # Tabla de resultados (ordenable haciendo clic en el encabezado)
+        tabla = tk.Frame(cuerpo, bg="white")
+        tabla.grid(row=0, column=0, sticky="nsew", padx=(0,6))
+        self.tree_lote = ttk.Treeview(tabla, columns=[c[0] for c in COLUMNAS_LOTE], show="headings")
+        for clave, titulo, ancho in COLUMNAS_LOTE:
+            self.tree_lote.heading(clave, text=titulo, command=lambda c=clave: self._ordenar_lote(c))
+            self.tree_lote.column(clave, width=ancho, anchor="w")
+        self.scroll_lote = ttk.Scrollbar(tabla, orient="vertical", command=self.tree_lote.yview)
+        self.tree_lote.configure(yscrollcommand=self._al_desplazar_lote)
+        self.scroll_lote.pack(side="right", fill="y")
+        self.tree_lote.pack(side="left", fill="both", expand=True)
+
+        # Gráfico en un Canvas
+        graf = tk.Frame(cuerpo, bg="white")
+        graf.grid(row=0, column=1, sticky="nsew")
+        self.var_grafico_lote = tk.StringVar(value="dispersion")
+        opciones = tk.Frame(graf, bg="white")
+        opciones.pack(fill="x")
+        for valor, texto in (("dispersion", "Riesgo vs área"), ("histograma", "Histograma de riesgo")):
+            tk.Radiobutton(opciones, text=texto, value=valor, variable=self.var_grafico_lote, bg="white",
+                           command=self._dibujar_grafico_lote).pack(side="left")
+        self.canvas_lote = tk.Canvas(graf, bg="#f8fafc", highlightthickness=0)
+        self.canvas_lote.pack(fill="both", expand=True, pady=(6,0))
+        self.canvas_lote.bind("<Configure>", lambda _e: self._dibujar_grafico_lote())
+
+        # Estado del lote
+        # Resultados en columnas: la fila i de las dos tablas es el mismo proyecto
+        self._lote_proyectos = ProjectTable()
+        self._lote_impactos = ImpactoTable()
+        self._lote_vista = array("l")      # Filas de las tablas en el orden en que se muestran
+        self._lote_nuevos = deque()        # Resultados que deja el hilo del lote
+        self._lote_cancelado = None
+        self._lote_total = 0
+        self._lote_hechos = 0
+        self._lote_errores = 0
+        self._lote_materializadas = 0
+        self._lote_orden = None            # (columna, descendente)
+        self._lote_ultimo_grafico = 0
+
     # ---------------------- Tab Logs ----------------------
     def _build_tab_logs(self):
         wrap = tk.Frame(self.tab_logs, bg="white")
         wrap.pack(fill="both", expand=True, padx=6, pady=6)
-        tk.Label(wrap, text="Eventos recientes", bg="white", fg="#475569").pack(anchor="w")
+        top = tk.Frame(wrap, bg="white")
+        top.pack(fill="x")
+        tk.Label(top, text="Eventos recientes", bg="white", fg="#475569").pack(side="left")
+        self.var_nivel_log = tk.StringVar(value="INFO")
+        cmb = ttk.Combobox(top, textvariable=self.var_nivel_log, values=NIVELES_LOG, state="readonly", width=10)
+        cmb.pack(side="right")
+        cmb.bind("<<ComboboxSelected>>", lambda _e: self._repintar_logs())
+        tk.Label(top, text="Nivel mínimo", bg="white", fg="#475569").pack(side="right", padx=6)
         self.txt_logs = tk.Text(wrap, height=18, bg="#f8fafc", relief="flat")
         self.txt_logs.pack(fill="both", expand=True, pady=6)
 
+    # ---------------------- Tab Métricas ----------------------
+    def _build_tab_metricas(self):
+        wrap = tk.Frame(self.tab_metricas, bg="white")
+        wrap.pack(fill="both", expand=True, padx=6, pady=6)
+        top = tk.Frame(wrap, bg="white")
+        top.pack(fill="x")
+        tk.Label(top, text="Latencias por operación (desde que se abrió la app)", bg="white", fg="#475569").pack(side="left")
+        ttk.Button(top, text="Reiniciar", style="Soft.TButton", command=self._reiniciar_metricas).pack(side="right")
+        self.txt_metricas = tk.Text(wrap, height=18, bg="#f8fafc", relief="flat", font=("Courier", 9))
+        self.txt_metricas.pack(fill="both", expand=True, pady=6)
+
+    def _refrescar_metricas(self):
+        """Repinta la tabla de métricas, solo si la pestaña está a la vista."""
+        if self.tabs.select() == str(self.tab_metricas):
+            self.txt_metricas.delete("1.0", "end")
+            self.txt_metricas.insert("end", registro_metricas.a_texto())
+        self.after(METRICAS_INTERVALO_MS, self._refrescar_metricas)
+
+    def _reiniciar_metricas(self):
+        registro_metricas.reiniciar()
+        self.txt_metricas.delete("1.0", "end")
+        self.txt_metricas.insert("end", registro_metricas.a_texto())
+
     # ---------------------- Helpers ----------------------
     def _log_ui(self, msg: str):
+        # Pasa por logging, así queda en el archivo y llega a la pestaña por la cola
+        log.info(msg)
+
+    def _nivel_log_minimo(self) -> int:
+        return log.getLevelName(self.var_nivel_log.get())
+
+    def _volcar_logs(self):
+        """
+        Pasa los registros acumulados en la cola al buffer circular y los
+        inserta en el Text de una sola vez por tick. El widget nunca guarda
+        más de LOG_MAX_LINEAS líneas.
+        """
+        nuevos = []
         try:
-            self.txt_logs.insert("end", msg + "\n")
-            self.txt_logs.see("end")
-        except:
+            while True:
+                rec = self._cola_logs.get_nowait()
+                nuevos.append((rec.levelno, rec.getMessage()))
+        except queue.Empty:
             pass
+        if nuevos:
+            self._buffer_logs.extend(nuevos)
+            minimo = self._nivel_log_minimo()
+            texto = "".join(t + "\n" for nivel, t in nuevos[-LOG_MAX_LINEAS:] if nivel >= minimo)
+            if texto:
+                self.txt_logs.insert("end", texto)
+                # index("end-1c") cae en la línea vacía que sigue al último "\n"
+                lineas = int(self.txt_logs.index("end-1c").split(".")[0]) - 1
+                if lineas > LOG_MAX_LINEAS:
+                    self.txt_logs.delete("1.0", f"{lineas - LOG_MAX_LINEAS + 1}.0")
+                self.txt_logs.see("end")
+        self.after(LOG_INTERVALO_MS, self._volcar_logs)
 
-    def _refresh_list(self, filtro: str = ""):
+    def _repintar_logs(self):
+        """Vuelve a llenar el Text desde el buffer con el filtro de nivel actual."""
+        minimo = self._nivel_log_minimo()
+        self.txt_logs.delete("1.0", "end")
+        self.txt_logs.insert("end", "".join(t + "\n" for nivel, t in self._buffer_logs if nivel >= minimo))
+        self.txt_logs.see("end")
+
+    def _refresh_list(self):
         log.debug('Actualizando lista de proyectos')
-        for row in self.tree.get_children():
-            self.tree.delete(row)
+        # Guardo el listado en memoria para que la búsqueda no relea el CSV.
+        # Recorro los proyectos de a uno: solo quedan vivas las tres columnas que muestro.
+        self._indice_busqueda = [
+            (f"{p.id} {p.nombre} {p.tipo}".lower(), (p.id, p.nombre, p.tipo)) for p in iterar_proyectos()
+        ]
+        log.info(f'Se encontraron {len(self._indice_busqueda)} proyectos')
+        self._ultima_busqueda = None
+        self._resultado_busqueda = []
+        self._iniciar_busqueda(self.var_search.get().strip())
+
+        self._log_ui(f"Listado actualizado. {len(self._indice_busqueda)} proyectos.")
+
+    def _aplicar_filas(self, filas):
+        """
+        Cambia el listado de la barra lateral. El Treeview solo tiene una
+        ventana de VENTANA_LISTA filas del modelo; la posición de la ventana
+        se conserva (recortada al largo nuevo) y solo se tocan las filas que cambian.
+        Cada fila usa el id del proyecto como iid; si el CSV repite un id, las
+        repeticiones llevan un sufijo ("P1#2") para que Tk no las rechace.
+        """
+        self._filas_lista = filas
+        self._iids_lista, self._alias_iid = self._iids_unicos(filas)
+        inicio = max(0, min(self._ventana[0], len(filas) - VENTANA_LISTA))
+        self._mostrar_ventana(inicio)
+
+    @staticmethod
+    def _iids_unicos(filas):
+        """iid de cada fila y el id real de los iids con sufijo."""
+        usados, alias, repeticiones = set(), {}, {}
+        iids = []
+        for fila in filas:
+            pid = iid = fila[0]
+            if iid in usados:
+                n = repeticiones.get(pid, 1)
+                while iid in usados:
+                    n += 1
+                    iid = f"{pid}#{n}"
+                repeticiones[pid] = n
+                alias[iid] = pid
+            usados.add(iid)
+            iids.append(iid)
+        return iids, alias
+
+    def _pid_de_iid(self, iid: str) -> str:
+        return self._alias_iid.get(iid, iid)
 
-        proyectos = listar_proyectos()
-        log.info(f'Se encontraron {len(proyectos)} proyectos')
+    def _mostrar_ventana(self, inicio: int):
+        """
+        Deja en el Treeview las filas [inicio, inicio + VENTANA_LISTA) del modelo:
+        borra las que sobran, actualiza las que cambiaron y agrega o mueve las
+        que faltan, recorriendo los hijos actuales una sola vez.
+        """
+        fin = min(len(self._filas_lista), inicio + VENTANA_LISTA)
+        deseados = self._iids_lista[inicio:fin]
+        posicion = {iid: i for i, iid in enumerate(deseados)}
 
-        for p in proyectos:
-            if filtro and filtro.lower() not in f"{p.id} {p.nombre} {p.tipo}".lower():
+        existentes = self.tree.get_children()
+        sobrantes = [iid for iid in existentes if iid not in posicion]
+        if sobrantes:
+            self.tree.delete(*sobrantes)
+        # Las que quedan conservan su orden relativo: las recorro con un puntero
+        # y solo muevo las que están fuera de lugar
+        actuales = [iid for iid in existentes if iid in posicion]
+        movidas = set()
+        j = 0
+        for idx, iid in enumerate(deseados):
+            valores = self._filas_lista[inicio + idx]
+            while j < len(actuales) and actuales[j] in movidas:
+                j += 1
+            if j < len(actuales) and actuales[j] == iid:
+                j += 1
+            elif self.tree.exists(iid):
+                self.tree.move(iid, "", idx)
+                movidas.add(iid)
+            else:
+                self.tree.insert("", idx, iid=iid, values=valores)
                 continue
-            self.tree.insert("", "end", values=(p.id, p.nombre, p.tipo))
+            # Tk puede devolver números en lugar de texto, por eso comparo como str
+            if tuple(str(v) for v in self.tree.item(iid, "values")) != tuple(str(v) for v in valores):
+                self.tree.item(iid, values=valores)
+        self._ventana = (inicio, fin)
 
-        self._log_ui(f"Listado actualizado. {len(proyectos)} proyectos.")
+    def _correr_ventana(self, delta: int):
+        """Corre la ventana delta filas sin que se mueva lo que el usuario está viendo."""
+        self._ventana_pendiente = False
+        inicio, fin = self._ventana
+        nuevo = max(0, min(inicio + delta, len(self._filas_lista) - VENTANA_LISTA))
+        if nuevo == inicio:
+            return
+        arriba = inicio + int(round(self.tree.yview()[0] * (fin - inicio)))
+        self._mostrar_ventana(nuevo)
+        inicio, fin = self._ventana
+        self.tree.yview_moveto((arriba - inicio) / max(fin - inicio, 1))
+
+    def _mover_lista(self, *args):
+        """
+        command de la barra de scroll, que representa el listado completo.
+        Arrastrarla lleva la ventana a esa zona; las flechas y páginas
+        desplazan el Treeview y _al_desplazar_lista corre la ventana.
+        """
+        if args[0] != "moveto" or not self._filas_lista:
+            self.tree.yview(*args)
+            return
+        fila = min(int(float(args[1]) * len(self._filas_lista)), len(self._filas_lista) - 1)
+        inicio, fin = self._ventana
+        if not inicio <= fila < fin:
+            self._mostrar_ventana(max(0, min(fila - FILAS_POR_PAGINA, len(self._filas_lista) - VENTANA_LISTA)))
+            inicio, fin = self._ventana
+        self.tree.yview_moveto((fila - inicio) / max(fin - inicio, 1))
+
+    def _al_desplazar_lista(self, primero, ultimo):
+        """
+        yscrollcommand del Treeview: pasa la posición dentro de la ventana a
+        la del listado completo y corre la ventana al acercarse a un borde.
+        """
+        inicio, fin = self._ventana
+        total = len(self._filas_lista)
+        if total:
+            n = fin - inicio
+            self.tree_scroll.set((inicio + float(primero) * n) / total, (inicio + float(ultimo) * n) / total)
+        else:
+            self.tree_scroll.set(primero, ultimo)
+        if self._ventana_pendiente:
+            return
+        if float(ultimo) > 0.9 and fin < total:
+            self._ventana_pendiente = True
+            self.after_idle(self._correr_ventana, FILAS_POR_PAGINA)
+        elif float(primero) < 0.1 and inicio > 0:
+            self._ventana_pendiente = True
+            self.after_idle(self._correr_ventana, -FILAS_POR_PAGINA)
 
     def _search(self):
-        self._refresh_list(self.var_search.get().strip())
+        """Botón Buscar: filtra ya mismo sin esperar el debounce."""
+        if self._busqueda_pendiente is not None:
+            self.after_cancel(self._busqueda_pendiente)
+            self._busqueda_pendiente = None
+        self._iniciar_busqueda(self.var_search.get().strip())
+
+    def _al_escribir_busqueda(self, *_args):
+        """Cada tecla reprograma la búsqueda y deja obsoleta la que esté en curso."""
+        self._gen_busqueda += 1
+        if self._busqueda_pendiente is not None:
+            self.after_cancel(self._busqueda_pendiente)
+        self._busqueda_pendiente = self.after(DEBOUNCE_BUSQUEDA_MS, self._search)
+
+    def _iniciar_busqueda(self, texto: str):
+        """
+        Filtra el listado en memoria. Si el texto nuevo contiene al de la última
+        búsqueda, sus resultados son un subconjunto de los anteriores, así que
+        solo refino esos en lugar de recorrer todos los proyectos.
+        """
+        self._gen_busqueda += 1
+        texto = texto.lower()
+        if self._ultima_busqueda is not None and self._ultima_busqueda in texto:
+            base = self._resultado_busqueda
+        else:
+            base = self._indice_busqueda
+        self._filtrar_por_partes(self._gen_busqueda, texto, base, 0, [])
+
+    def _filtrar_por_partes(self, gen: int, texto: str, base, inicio: int, encontrados):
+        """
+        Revisa BUSQUEDA_POR_TICK filas y se reprograma con after() para no
+        congelar la ventana con listados grandes. Si llegó otra búsqueda
+        mientras tanto (gen distinto), abandona esta.
+        """
+        if gen != self._gen_busqueda:
+            return
+        fin = min(len(base), inicio + BUSQUEDA_POR_TICK)
+        encontrados.extend(e for e in base[inicio:fin] if texto in e[0])
+        if fin < len(base):
+            self.after(1, self._filtrar_por_partes, gen, texto, base, fin, encontrados)
+            return
+        self._ultima_busqueda = texto
+        self._resultado_busqueda = encontrados
+        self._aplicar_filas([fila for _, fila in encontrados])
 
     def _current_id_from_tree(self):
         sel = self.tree.selection()
         if not sel:
             return None
-        values = self.tree.item(sel[0], "values")
-        return values[0] if values else None
+        # El iid de cada fila es el id del proyecto (con sufijo si está repetido)
+        return self._pid_de_iid(sel[0])
 
     def _fill_form(self, p):
         self.var_id.set(p.id)
@@ -277,6 +697,8 @@ class App(tk.Tk):
         p = obtener_proyecto(pid)
         if p:
             self._fill_form(p)
+            self._cancelar_prefetch_pendiente()
+            self._prefetch_pendiente = self.after(DEBOUNCE_PREFETCH_MS, self._prefetch_simulacion, p)
 
     def _on_row_double(self, _evt):
         self._on_select(_evt)
@@ -296,7 +718,8 @@ class App(tk.Tk):
                 intensidad=int(self.var_intensidad.get() or 5),
             )
             
-            crear_proyecto(data)
+            p = crear_proyecto(data)
+            self._avisar_cambio_propio(p.id, p)
             self._refresh_list()
             self._log_ui(f"Proyecto {data['id']} creado.")
             messagebox.showinfo("OK", f"Proyecto {data['id']} creado exitosamente")
@@ -322,10 +745,16 @@ class App(tk.Tk):
             "ubicacion": self.var_ubicacion.get().strip(),
             "intensidad": self.var_intensidad.get().strip(),
         }
-        ok = actualizar_proyecto(pid, cambios)
+        try:
+            ok = actualizar_proyecto(pid, cambios)
+        except ValueError as e:
+            messagebox.showerror("Error de validación", str(e))
+            return
+        self._descartar_prefetch(pid)
         if not ok:
             messagebox.showwarning("No encontrado", f"No existe el proyecto {pid}")
         else:
+            self._avisar_cambio_propio(pid, obtener_proyecto(pid))
             self._refresh_list()
             self._log_ui(f"Proyecto {pid} actualizado.")
             messagebox.showinfo("OK", f"Proyecto {pid} actualizado")
@@ -335,7 +764,9 @@ class App(tk.Tk):
         if not pid:
             messagebox.showinfo("Info", "Selecciona un proyecto o escribe un ID")
             return
+        self._descartar_prefetch(pid)
         if eliminar_proyecto(pid):
+            self._avisar_cambio_propio(pid, None)
             self._refresh_list()
             self._log_ui(f"Proyecto {pid} eliminado.")
             messagebox.showinfo("Eliminado", f"Proyecto {pid} eliminado")
@@ -348,15 +779,169 @@ class App(tk.Tk):
         if not pid:
             messagebox.showinfo("Info", "Selecciona un proyecto o escribe un ID")
             return
-        imp = simular_proyecto(pid)
+        # Si la selección todavía no lanzó su prefetch, ya no hace falta
+        self._cancelar_prefetch_pendiente()
+        # La simulación corre en un worker; aquí solo preparo la vista
+        trabajo = _TrabajoSimulacion(next(self._contador_trabajos), pid)
+        self._trabajos[trabajo.num] = trabajo
+        self._trabajo_visible = trabajo
+        self.tabs.select(self.tab_sim)
+        self.txt_result.delete("1.0", tk.END)
+        self.txt_result.insert(tk.END, f"Simulando proyecto {pid}...\n")
+        trabajo.futuro = self._pool.submit(en_contexto(self._ejecutar_simulacion), trabajo)
+        self._actualizar_estado_sim()
+
+    def _ejecutar_simulacion(self, trabajo: _TrabajoSimulacion):
+        """Corre en un hilo del pool. Nunca toca widgets: todo va por la cola."""
+        if trabajo.cancelado.is_set():
+            return
+        try:
+            imp = self._resultado_prefetch(trabajo.pid)
+            if imp is None:
+                imp = simular_proyecto(
+                    trabajo.pid,
+                    lambda cat, frag: self._en_ui(self._recomendacion_en_vivo, trabajo, cat, frag)
+                )
+        except Exception as e:
+            log.error(f'Error inesperado al simular proyecto {trabajo.pid}: {e}')
+            self._en_ui(self._simulacion_fallida, trabajo, e)
+            return
+        self._en_ui(self._simulacion_terminada, trabajo, imp)
+
+    def _cancelar_prefetch_pendiente(self):
+        if self._prefetch_pendiente is not None:
+            self.after_cancel(self._prefetch_pendiente)
+            self._prefetch_pendiente = None
+
+    def _prefetch_simulacion(self, p):
+        """
+        Lanza en segundo plano la simulación del proyecto seleccionado, porque
+        casi siempre lo siguiente es pulsar "Simular Impacto". Las especulaciones
+        de otras filas que todavía no arrancaron se cancelan. El resultado queda
+        solo en memoria: se guarda recién cuando el usuario pide simular.
+        """
+        self._prefetch_pendiente = None
+        clave = astuple(p)
+        with self._lock_prefetch:
+            previo = self._prefetch.get(p.id)
+            if previo is not None and previo.clave == clave and not previo.futuro.cancelled():
+                self._prefetch.move_to_end(p.id)
+                return
+            for pid, entrada in list(self._prefetch.items()):
+                if entrada.futuro.cancel():
+                    del self._prefetch[pid]
+            self._prefetch[p.id] = _Prefetch(clave, self._pool_prefetch.submit(simular_proyecto, p.id, None, False))
+            self._prefetch.move_to_end(p.id)
+            while len(self._prefetch) > PREFETCH_MAX:
+                self._prefetch.popitem(last=False)
+        log.debug(f'Prefetch de simulación lanzado para proyecto {p.id}')
+
+    def _descartar_prefetch(self, pid: str):
+        """Olvida la simulación especulativa de un proyecto que cambió o se borró."""
+        with self._lock_prefetch:
+            entrada = self._prefetch.pop(pid, None)
+        if entrada is not None:
+            entrada.futuro.cancel()
+
+    def _resultado_prefetch(self, pid: str):
+        """
+        Corre en el worker. Si hay una simulación especulativa de este proyecto
+        hecha con sus datos actuales, devuelve su resultado (esperándola si
+        todavía está en curso). Si no, devuelve None.
+        """
+        with self._lock_prefetch:
+            entrada = self._prefetch.get(pid)
+        if entrada is None or entrada.futuro.cancelled():
+            return None
+        p = obtener_proyecto(pid)
+        if p is None or astuple(p) != entrada.clave:
+            self._descartar_prefetch(pid)
+            return None
+        try:
+            imp = entrada.futuro.result()
+        except Exception as e:
+            log.warning(f'Prefetch de {pid} falló, se simula de nuevo: {e}')
+            return None
+        if imp is not None:
+            log.debug(f'Usando simulación prefetch para proyecto {pid}')
+            # El usuario la pidió: recién ahora se guarda
+            guardar_impacto(imp)
+        return imp
+
+    def _en_ui(self, fn, *args):
+        """Encola una función para que la ejecute el hilo de Tk."""
+        self._cola_ui.put((fn, args))
+
+    def _procesar_cola_ui(self):
+        """
+        Ejecuta en el hilo de Tk lo que dejaron los workers y se vuelve a programar.
+        Un callback que falla se registra y no corta a los demás ni al ciclo.
+        """
+        try:
+            while True:
+                try:
+                    fn, args = self._cola_ui.get_nowait()
+                except queue.Empty:
+                    break
+                try:
+                    fn(*args)
+                except Exception:
+                    log.exception('Error al ejecutar %s en la interfaz', getattr(fn, '__name__', fn))
+        finally:
+            self.after(INTERVALO_COLA_MS, self._procesar_cola_ui)
+
+    def _actualizar_estado_sim(self):
+        en_curso = len(self._trabajos)
+        if en_curso and not self._spinner_activo:
+            self.spinner.start(15)
+        elif not en_curso and self._spinner_activo:
+            self.spinner.stop()
+        self._spinner_activo = bool(en_curso)
+        self.var_estado_sim.set(f"{en_curso} simulación(es) en curso" if en_curso else "")
+
+    def _cancelar_simulaciones(self):
+        """
+        Cancela las simulaciones en curso. Las que todavía no empezaron no se
+        ejecutan; las que ya están llamando a la IA terminan en su hilo pero
+        su resultado se descarta.
+        """
+        if not self._trabajos:
+            return
+        for trabajo in self._trabajos.values():
+            trabajo.cancelado.set()
+            trabajo.futuro.cancel()
+        self._log_ui(f"Se cancelaron {len(self._trabajos)} simulación(es).")
+        self._trabajos.clear()
+        if self._trabajo_visible is not None:
+            self.txt_result.insert(tk.END, "\n[Simulación cancelada]\n")
+            self._trabajo_visible = None
+        self._actualizar_estado_sim()
+
+    def _simulacion_fallida(self, trabajo: _TrabajoSimulacion, error: Exception):
+        if self._trabajos.pop(trabajo.num, None) is None:
+            return
+        self._actualizar_estado_sim()
+        messagebox.showerror("Error", f"Error inesperado al simular {trabajo.pid}: {error}")
+
+    def _simulacion_terminada(self, trabajo: _TrabajoSimulacion, imp):
+        # Si se canceló mientras corría, descarto el resultado
+        if self._trabajos.pop(trabajo.num, None) is None:
+            return
+        self._actualizar_estado_sim()
+        pid = trabajo.pid
         if not imp:
             messagebox.showwarning("No encontrado", f"No existe el proyecto {pid}")
             return
+        self._log_ui(f"Simulación {pid}: riesgo {imp.riesgo_total:.1f}%")
+        # Solo pinto el resultado de la última simulación lanzada
+        if trabajo is not self._trabajo_visible:
+            return
+        self._trabajo_visible = None
 
-        self.tabs.select(self.tab_sim)
         self.txt_result.delete("1.0", tk.END)
         self.txt_result.insert(tk.END, f"Proyecto: {imp.proyecto_id}\n")
-        self.txt_result.insert(tk.END, f"Impacto (riesgo): {imp.riesgo_total:.1f}%\n\n")
+        self.txt_result.insert(tk.END, f"Impacto (riesgo): {imp.riesgo_total:.1f}%\n")
+        self.txt_result.insert(tk.END, f"Origen de las métricas: {imp.origen}\n\n")
         self.txt_result.insert(tk.END, "Puntajes (100=mejor)\n")
         self.txt_result.insert(tk.END, f"  • Aire: {imp.calidad_aire:.1f}\n")
         self.txt_result.insert(tk.END, f"  • Agua: {imp.calidad_agua:.1f}\n")
@@ -367,7 +952,333 @@ class App(tk.Tk):
             for k, v in imp.recomendaciones.items():
                 self.txt_result.insert(tk.END, f"  - {k}: {v}\n")
 
-        self._log_ui(f"Simulación {pid}: riesgo {imp.riesgo_total:.1f}%")
+    def _recomendacion_en_vivo(self, trabajo: _TrabajoSimulacion, categoria: str, fragmento: str):
+        """Agrega al resultado el texto de la IA en cuanto llega."""
+        if trabajo is not self._trabajo_visible or trabajo.cancelado.is_set():
+            return
+        if categoria != trabajo.categoria_en_vivo:
+            if trabajo.categoria_en_vivo is None:
+                self.txt_result.insert(tk.END, "\nRecomendaciones (en vivo):\n")
+            else:
+                self.txt_result.insert(tk.END, "\n")
+            self.txt_result.insert(tk.END, f"  - {categoria}: ")
+            trabajo.categoria_en_vivo = categoria
+        self.txt_result.insert(tk.END, fragmento)
+        self.txt_result.see(tk.END)
+
+    # ---------------------- Lote ----------------------
+    def _simular_lote(self, seleccionados: bool):
+        if self._lote_cancelado is not None:
+            messagebox.showinfo("Info", "Ya hay una simulación por lotes en curso")
+            return
+        if seleccionados:
+            pids = list(dict.fromkeys(self._pid_de_iid(iid) for iid in self.tree.selection()))
+            if not pids:
+                messagebox.showinfo("Info", "Selecciona uno o más proyectos en la barra izquierda")
+                return
+            total = len(pids)
+        else:
+            pids = None
+            total = len(self._indice_busqueda)
+
+        self._lote_proyectos, self._lote_impactos = ProjectTable(), ImpactoTable()
+        self._lote_vista = array("l")
+        self._lote_nuevos.clear()
+        self._lote_total, self._lote_hechos, self._lote_errores = total, 0, 0
+        self._lote_cancelado = threading.Event()
+        self._pintar_tabla_lote()
+        self._dibujar_grafico_lote()
+        self.progreso_lote.configure(maximum=max(total, 1), value=0)
+        self.var_lote_estado.set(f"0 / {total}")
+        self._log_ui(f"Simulación por lotes iniciada: {total} proyecto(s).")
+        threading.Thread(target=self._ejecutar_lote, args=(pids, self._lote_cancelado),
+                         daemon=True, name="lote").start()
+        self.after(LOTE_INTERVALO_MS, self._actualizar_lote)
+
+    def _ejecutar_lote(self, pids, cancelado: threading.Event):
+        """Corre en un hilo aparte; solo deja resultados en la deque."""
+        lote = simular_lote(pids)
+        try:
+            for p, imp in lote:
+                if cancelado.is_set():
+                    break
+                self._lote_nuevos.append((p, imp))
+        except Exception as e:
+            log.error(f'Error en simulación por lotes: {e}')
+        finally:
+            lote.close()
+            self._lote_nuevos.append(None)  # Marca de fin
+
+    def _cancelar_lote(self):
+        if self._lote_cancelado is not None:
+            self._lote_cancelado.set()
+            self._log_ui("Cancelando simulación por lotes...")
+
+    def _actualizar_lote(self):
+        """Vuelca en la tabla, la barra y el gráfico lo que llegó desde el último tick."""
+        terminado = False
+        nuevas = 0
+        while self._lote_nuevos:
+            item = self._lote_nuevos.popleft()
+            if item is None:
+                terminado = True
+                break
+            p, imp = item
+            self._lote_hechos += 1
+            if imp is None:
+                self._lote_errores += 1
+                continue
+            self._agregar_fila_lote(p, imp)
+            nuevas += 1
+        if nuevas:
+            self._materializar_lote()
+        self.progreso_lote.configure(value=self._lote_hechos)
+        estado = f"{self._lote_hechos} / {self._lote_total}"
+        if self._lote_errores:
+            estado += f" ({self._lote_errores} con error)"
+        self.var_lote_estado.set(estado)
+
+        ahora = time.monotonic() * 1000
+        if terminado or ahora - self._lote_ultimo_grafico >= LOTE_GRAFICO_MS:
+            self._lote_ultimo_grafico = ahora
+            self._dibujar_grafico_lote()
+        if not terminado:
+            self.after(LOTE_INTERVALO_MS, self._actualizar_lote)
+            return
+
+        cancelado = self._lote_cancelado.is_set()
+        self._lote_cancelado = None
+        if self._vigilancia_resultados:
+            self._volcar_resultados_vigilados()
+        elif self._lote_orden is not None:
+            self._aplicar_orden_lote()
+        self._log_ui(f"Simulación por lotes {'cancelada' if cancelado else 'terminada'}: {estado}.")
+
+    def _agregar_fila_lote(self, p, imp):
+        self._lote_vista.append(len(self._lote_proyectos))
+        self._lote_proyectos.agregar(p)
+        self._lote_impactos.agregar(imp)
+
+    def _valores_fila_lote(self, i: int):
+        """Textos de la fila i para el Treeview (el Project y el Impacto se arman recién aquí)."""
+        p, imp = self._lote_proyectos[i], self._lote_impactos[i]
+        valores = (p.id, p.nombre, p.tipo, imp.riesgo_total, imp.calidad_aire, imp.calidad_agua,
+                   imp.biodiversidad, imp.uso_suelo, imp.origen)
+        return tuple(f"{v:.1f}" if isinstance(v, float) else v for v in valores)
+
+    def _pintar_tabla_lote(self):
+        """Vacía la tabla y materializa solo la primera página de filas."""
+        self.tree_lote.delete(*self.tree_lote.get_children())
+        self._lote_materializadas = 0
+        self._materializar_lote()
+
+    def _materializar_lote(self, extra: int = 0):
+        """Inserta filas del modelo hasta completar una página (más `extra`)."""
+        objetivo = min(len(self._lote_vista), max(FILAS_POR_PAGINA, self._lote_materializadas) + extra)
+        for i in self._lote_vista[self._lote_materializadas:objetivo]:
+            self.tree_lote.insert("", "end", values=self._valores_fila_lote(i))
+        self._lote_materializadas = max(self._lote_materializadas, objetivo)
+
+    def _al_desplazar_lote(self, primero, ultimo):
+        self.scroll_lote.set(primero, ultimo)
+        if float(ultimo) > 0.9 and self._lote_materializadas < len(self._lote_vista):
+            self.after_idle(self._materializar_lote, FILAS_POR_PAGINA)
+
+    def _ordenar_lote(self, columna: str):
+        """Clic en un encabezado: ordena por esa columna (otro clic invierte el orden)."""
+        descendente = self._lote_orden == (columna, False)
+        self._lote_orden = (columna, descendente)
+        self._aplicar_orden_lote()
+
+    def _aplicar_orden_lote(self):
+        columna, descendente = self._lote_orden
+        campo = CAMPOS_LOTE[columna]
+        tabla = self._lote_proyectos if campo in dict(ProjectTable.CAMPOS) else self._lote_impactos
+        # Ordeno los números de fila por la columna, sin armar ningún objeto
+        claves = list(tabla.valores(campo))
+        self._lote_vista = array("l", sorted(self._lote_vista, key=claves.__getitem__, reverse=descendente))
+        for clave, titulo, _ in COLUMNAS_LOTE:
+            flecha = (" ▼" if descendente else " ▲") if clave == columna else ""
+            self.tree_lote.heading(clave, text=titulo + flecha)
+        self._pintar_tabla_lote()
+
+    def _dibujar_grafico_lote(self):
+        """
+        Dibuja el gráfico del lote. Para que 100k puntos no congelen la ventana
+        la dispersión se agrupa en celdas de LOTE_CELDA_PX píxeles: se dibuja un
+        rectángulo por celda ocupada (más oscuro cuantos más puntos tenga).
+        """
+        c = self.canvas_lote
+        c.delete("all")
+        ancho, alto = c.winfo_width(), c.winfo_height()
+        m = 30  # Margen para los ejes
+        if ancho <= 2 * m or alto <= 2 * m:
+            return
+        c.create_line(m, alto - m, ancho - m // 2, alto - m, fill=MUTED)
+        c.create_line(m, m // 2, m, alto - m, fill=MUTED)
+        c.create_text(m - 4, m // 2, text="100", anchor="e", fill=MUTED, font=("", 8))
+        c.create_text(m - 4, alto - m, text="0", anchor="e", fill=MUTED, font=("", 8))
+        if not self._lote_impactos:
+            c.create_text(ancho // 2, alto // 2, text="Sin resultados", fill=MUTED)
+            return
+        w, h = ancho - m - m // 2, alto - m - m // 2
+        # Leo las columnas directo de las tablas (memoryview, sin copiar)
+        riesgos = self._lote_impactos.columna("riesgo_total")
+
+        if self.var_grafico_lote.get() == "histograma":
+            cubetas = [0] * 20
+            for r in riesgos:
+                cubetas[min(19, int(r // 5))] += 1
+            mayor = max(cubetas)
+            paso = w / len(cubetas)
+            for i, n in enumerate(cubetas):
+                if n:
+                    y = alto - m - h * n / mayor
+                    c.create_rectangle(m + i * paso + 1, y, m + (i + 1) * paso - 1, alto - m, fill=ACCENT, width=0)
+            c.create_text(ancho - m // 2, alto - m + 12, text="riesgo %", anchor="e", fill=MUTED, font=("", 8))
+            c.create_text(m, m // 2 - 8, text=f"máx. {mayor}", anchor="w", fill=MUTED, font=("", 8))
+            return
+
+        # Dispersión: x = log10(área), y = riesgo
+        xs = [math.log10(max(a, 0.01)) for a in self._lote_proyectos.columna("area_ha")]
+        xmin, xmax = min(xs), max(xs)
+        rango = (xmax - xmin) or 1.0
+        celdas = {}
+        for x, r in zip(xs, riesgos):
+            cx = int((x - xmin) / rango * (w - 1)) // LOTE_CELDA_PX
+            cy = int((100 - r) / 100 * (h - 1)) // LOTE_CELDA_PX
+            celdas[(cx, cy)] = celdas.get((cx, cy), 0) + 1
+        for (cx, cy), n in celdas.items():
+            color = "#86efac" if n == 1 else ACCENT if n < 10 else ACCENT_H if n < 100 else "#14532d"
+            x0 = m + cx * LOTE_CELDA_PX
+            y0 = m // 2 + cy * LOTE_CELDA_PX
+            c.create_rectangle(x0, y0, x0 + LOTE_CELDA_PX, y0 + LOTE_CELDA_PX, fill=color, width=0)
+        c.create_text(ancho - m // 2, alto - m + 12, text="área (ha, escala log)", anchor="e", fill=MUTED, font=("", 8))
+        c.create_text(m, alto - m + 12, text=f"{10 ** xmin:g}", anchor="w", fill=MUTED, font=("", 8))
+
+    # ---------------------- Vigilancia del archivo ----------------------
+    def _alternar_vigilancia(self):
+        if self.var_vigilar.get():
+            self._vigilancia_parar = threading.Event()
+            self._vigilante = Vigilante()
+            threading.Thread(target=self._vigilar, args=(self._vigilante, self._vigilancia_parar),
+                             daemon=True, name="vigilancia").start()
+            self._log_ui("Vigilancia del archivo activada.")
+        elif self._vigilancia_parar is not None:
+            self._vigilancia_parar.set()
+            self._vigilancia_parar = None
+            self._vigilante = None
+            self._log_ui("Vigilancia del archivo desactivada.")
+
+    def _avisar_cambio_propio(self, pid, p):
+        """Le dice al vigilante que este cambio lo hizo la app, para no volver a simularlo."""
+        if self._vigilante is not None:
+            self._vigilante.ignorar_propio(pid, p)
+
+    def _vigilar(self, vigilante, parar: threading.Event):
+        """Corre en un hilo aparte: toma la foto inicial y simula lo que vaya cambiando."""
+        vigilante.tomar_base()
+
+        def al_cambiar(dif):
+            # La lista se actualiza apenas se detecta el cambio; los resultados llegan después, de a uno
+            self._en_ui(self._aplicar_lista_vigilada, dif)
+            hechos = errores = 0
+            for p, imp in vigilante.aplicar(dif):
+                if parar.is_set():
+                    break   # Al cerrar el generador se cancelan las simulaciones pendientes
+                hechos += 1
+                errores += imp is None
+                self._en_ui(self._aplicar_resultado_vigilado, p, imp)
+            self._en_ui(self._log_ui, f"Archivo modificado: {len(dif.nuevos)} nuevos, {len(dif.modificados)} "
+                                      f"modificados, {len(dif.eliminados)} eliminados; {hechos - errores} resimulados"
+                                      + (f" ({errores} con error)." if errores else "."))
+
+        vigilante.ejecutar(al_cambiar, parar)
+
+    def _aplicar_lista_vigilada(self, dif):
+        """
+        Lleva los cambios detectados a la lista sin releer el CSV: saco los
+        eliminados, reemplazo los modificados en su lugar y agrego los nuevos
+        al final. _aplicar_filas toca solo las filas que cambian.
+        """
+        fuera = set(dif.eliminados)
+        proyectos = {p.id: p for p in dif.proyectos}
+        indice = []
+        for entrada in self._indice_busqueda:
+            pid = entrada[1][0]
+            if pid in fuera:
+                continue
+            p = proyectos.pop(pid, None)
+            indice.append(entrada if p is None else (f"{p.id} {p.nombre} {p.tipo}".lower(), (p.id, p.nombre, p.tipo)))
+        indice.extend((f"{p.id} {p.nombre} {p.tipo}".lower(), (p.id, p.nombre, p.tipo)) for p in proyectos.values())
+        self._indice_busqueda = indice
+        self._ultima_busqueda = None
+        self._resultado_busqueda = []
+        self._iniciar_busqueda(self.var_search.get().strip())
+
+        # Los eliminados salen también de la tabla del lote (si no hay un lote corriendo)
+        for pid in fuera:
+            self._vigilancia_resultados.pop(pid, None)
+        if fuera and self._lote_cancelado is None and self._lote_proyectos:
+            ids = self._lote_proyectos.columna("id")
+            quedan = [i for i in self._lote_vista if ids[i] not in fuera]
+            if len(quedan) < len(self._lote_vista):
+                self._lote_proyectos = ProjectTable.desde(self._lote_proyectos[i] for i in quedan)
+                self._lote_impactos = ImpactoTable.desde(self._lote_impactos[i] for i in quedan)
+                self._lote_vista = array("l", range(len(quedan)))
+                self._repintar_lote_vigilado()
+
+    def _aplicar_resultado_vigilado(self, p, imp):
+        """
+        Junta los resultados que van llegando y los vuelca en la tabla del lote
+        cuando Tk queda libre: así una tanda grande no repinta la tabla por cada uno.
+        """
+        if imp is None:
+            return
+        if not self._vigilancia_resultados:
+            self.after_idle(self._volcar_resultados_vigilados)
+        self._vigilancia_resultados[p.id] = (p, imp)
+
+    def _volcar_resultados_vigilados(self):
+        # La tabla del lote solo la toco si no hay un lote corriendo; si lo hay,
+        # los resultados esperan y se vuelcan cuando termine
+        if not self._vigilancia_resultados or self._lote_cancelado is not None:
+            return
+        impactos, self._vigilancia_resultados = self._vigilancia_resultados, {}
+        # Los que ya estaban se pisan en su fila; los nuevos van al final
+        for p, imp in impactos.values():
+            i = self._lote_proyectos.posicion(p.id)
+            if i is None:
+                self._agregar_fila_lote(p, imp)
+            else:
+                self._lote_proyectos.reemplazar(i, p)
+                self._lote_impactos.reemplazar(i, imp)
+        self._repintar_lote_vigilado()
+
+    def _repintar_lote_vigilado(self):
+        if self._lote_orden is not None:
+            self._aplicar_orden_lote()
+        else:
+            self._pintar_tabla_lote()
+        self._dibujar_grafico_lote()
+
+    def _cerrar(self):
+        """Cancela lo pendiente y cierra sin esperar a las llamadas a la IA en curso."""
+        if self._vigilancia_parar is not None:
+            self._vigilancia_parar.set()
+        if self._lote_cancelado is not None:
+            self._lote_cancelado.set()
+        for trabajo in self._trabajos.values():
+            trabajo.cancelado.set()
+            trabajo.futuro.cancel()
+        self._cancelar_prefetch_pendiente()
+        with self._lock_prefetch:
+            for entrada in self._prefetch.values():
+                entrada.futuro.cancel()
+        self._pool.shutdown(wait=False)
+        self._pool_prefetch.shutdown(wait=False)
+        _log.quitar_handler(self._handler_logs)
+        self.destroy()
 
 if __name__ == "__main__":
     log.info('Iniciando aplicación Simulador Ambiental')
@@ -0,0 +1,365 @@
+"""
+Benchmarks reproducibles del simulador.
+Genera portafolios sintéticos (1k, 10k y 100k proyectos por defecto) en una
+carpeta temporal y mide:
+    - store: latencia de cada operación (create, create_many, read_all,
+      iter_all, read_by_id, update, delete, save/read_impacto)
+    - simulación con fórmulas: por proyecto (escalar) y en lote (simular_lote)
+    - camino de IA: GeminiService contra el modelo falso con latencia inyectada
+Los resultados se guardan en JSON y con --comparar se marcan las regresiones
+contra una corrida anterior. Con --arranque solo se revisa que importar
+cli.py y app.py entre en el presupuesto de ARRANQUE_PRESUPUESTO_MS.
+
+    python benchmark.py --salida base.json
+    python benchmark.py --salida nuevo.json --comparar base.json
+    python benchmark.py --arranque
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, List
+from src.models import Project
+from src.tablas import ImpactoTable
+from src import store, simulation, crud_service
+from src.gemini_service import GeminiService, LimitadorTokenBucket
+from src.gemini_fake import ModeloGeminiFalso
+from src.indice_vecinos import IndiceVecinos
+import src.logger_base as _log
+from src.constants import TIPOS_PROYECTO, ARRANQUE_PRESUPUESTO_MS, STORE_SHARDS
+
+log = _log.log
+
+TAMANOS = [1000, 10000, 100000]
+SEMILLA = 42
+TOLERANCIA = 0.20   # Un 20% más lento que la base cuenta como regresión
+
+
+def generar_proyectos(n: int, semilla: int = SEMILLA) -> List[Project]:
+    """Portafolio sintético determinista: misma semilla, mismos proyectos."""
+    rng = random.Random(f"{semilla}:{n}")
+    return [
+        Project(
+            id=f"B{i:06d}",
+            nombre=f"Proyecto {i}",
+            tipo=rng.choice(TIPOS_PROYECTO),
+            area_ha=round(10 ** rng.uniform(-1, 3), 2),
+            duracion_meses=rng.randint(1, 60),
+            ubicacion=rng.choice(["", "Lima", "Cusco", "Arequipa"]),
+            intensidad=rng.randint(1, 10),
+        )
+        for i in range(n)
+    ]
+
+
+def medir(fn: Callable, repeticiones: int) -> Dict[str, float]:
+    """Ejecuta fn varias veces y resume las latencias en milisegundos."""
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        fn()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    tiempos.sort()
+    return {
+        "repeticiones": repeticiones,
+        "mediana_ms": round(statistics.median(tiempos), 4),
+        "p95_ms": round(tiempos[min(len(tiempos) - 1, int(0.95 * len(tiempos)))], 4),
+        "media_ms": round(statistics.mean(tiempos), 4),
+    }
+
+
+def medir_throughput(fn: Callable[[], int]) -> Dict[str, float]:
+    """Ejecuta fn una vez (devuelve cuántos elementos procesó) y calcula elementos/s."""
+    inicio = time.perf_counter()
+    n = fn()
+    segundos = time.perf_counter() - inicio
+    return {
+        "elementos": n,
+        "segundos": round(segundos, 4),
+        "por_segundo": round(n / segundos, 2) if segundos else 0.0,
+    }
+
+
+def medir_memoria(fn: Callable) -> Dict[str, float]:
+    """Pico de memoria (KiB) mientras se arma y se mantiene vivo lo que devuelve fn."""
+    tracemalloc.start()
+    try:
+        resultado = fn()
+        _, pico = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del resultado
+    return {"pico_kb": round(pico / 1024, 1)}
+
+
+def bench_store(proyectos: List[Project], repeticiones: int) -> Dict[str, Dict]:
+    """Latencias de store sobre un CSV con todos los proyectos."""
+    n = len(proyectos)
+    res = {}
+    res["create_many"] = medir_throughput(lambda: store.create_many(proyectos))
+    res["read_all"] = medir(store.read_all, max(1, repeticiones // 5))
+    res["iter_all"] = medir(lambda: sum(1 for _ in store.iter_all()), max(1, repeticiones // 5))
+    res["read_tabla"] = medir(store.read_tabla, max(1, repeticiones // 5))
+    res["memoria_read_all"] = medir_memoria(store.read_all)
+    res["memoria_iter_all"] = medir_memoria(lambda: sum(1 for _ in store.iter_all()))
+    res["memoria_read_tabla"] = medir_memoria(store.read_tabla)
+
+    # Busco ids repartidos por todo el archivo (el costo depende de la posición)
+    rng = random.Random(SEMILLA)
+    ids = [proyectos[rng.randrange(n)].id for _ in range(repeticiones)]
+    it = iter(ids)
+    res["read_by_id"] = medir(lambda: store.read_by_id(next(it)), repeticiones)
+    res["read_by_id_inexistente"] = medir(lambda: store.read_by_id("NO-EXISTE"), max(1, repeticiones // 5))
+
+    nuevos = generar_proyectos(repeticiones, semilla=SEMILLA + 1)
+    for p in nuevos:
+        p.id = "N" + p.id
+    it_nuevos = iter(nuevos)
+    res["create"] = medir(lambda: store.create(next(it_nuevos)), repeticiones)
+
+    it = iter(ids)
+    res["update"] = medir(lambda: store.update(next(it), {"intensidad": 7}), max(1, repeticiones // 5))
+    # Borro los recién creados para que el portafolio original quede igual
+    borrables = iter(p.id for p in nuevos)
+    res["delete"] = medir(lambda: store.delete(next(borrables)), max(1, repeticiones // 5))
+
+    impactos = [simulation.simular(p) for p in proyectos[:repeticiones]]
+    it_imp = iter(impactos)
+    res["save_impacto"] = medir(lambda: store.save_impacto(next(it_imp)), len(impactos))
+    it_pid = iter(p.id for p in proyectos[:repeticiones])
+    res["read_impacto"] = medir(lambda: store.read_impacto(next(it_pid)), len(impactos))
+    res["memoria_impactos_lista"] = medir_memoria(lambda: [simulation.simular(p) for p in proyectos[:repeticiones]])
+    res["memoria_impactos_tabla"] = medir_memoria(
+        lambda: ImpactoTable.desde(simulation.simular(p) for p in proyectos[:repeticiones]))
+    return res
+
+
+def bench_formulas(proyectos: List[Project], max_lote: int) -> Dict[str, Dict]:
+    """Throughput de la simulación sin IA."""
+    res = {}
+
+    def escalar_formulas():
+        for p in proyectos:
+            simulation._calcular_con_formulas(p)
+        return len(proyectos)
+    res["formulas_escalar"] = medir_throughput(escalar_formulas)
+
+    def escalar_simular():
+        for p in proyectos:
+            simulation.simular(p)
+        return len(proyectos)
+    res["simular_escalar"] = medir_throughput(escalar_simular)
+
+    # simular_lote lee del CSV y guarda cada resultado, así que lo limito
+    ids = [p.id for p in proyectos[:max_lote]]
+    res["simular_lote"] = medir_throughput(lambda: sum(1 for _ in crud_service.simular_lote(ids)))
+    return res
+
+
+def bench_ia(proyectos: List[Project], llamadas: int, hilos: int, latencia_ms: float) -> Dict:
+    """
+    Camino de IA completo (métricas + recomendaciones, como en simulation._simular)
+    contra el modelo falso. El limitador se agranda para medir el servicio y no la cuota.
+    """
+    modelo = ModeloGeminiFalso(latencia="lognormal", latencia_media=latencia_ms / 1000,
+                               latencia_dispersion=0.5, semilla=SEMILLA)
+    servicio = GeminiService("falso", model=modelo)
+    servicio.limitador = LimitadorTokenBucket(por_minuto=1e9, rafaga=10 ** 6)
+
+    def una(p: Project) -> float:
+        inicio = time.perf_counter()
+        m = servicio.calcular_impacto_ambiental(p.tipo, p.nombre, p.area_ha, p.duracion_meses,
+                                                p.intensidad, p.ubicacion)
+        servicio.generar_recomendaciones(p.tipo, p.nombre, p.area_ha, p.duracion_meses, p.intensidad,
+                                         m["calidad_aire"], m["calidad_agua"], m["biodiversidad"],
+                                         m["uso_suelo"], m["riesgo_total"])
+        return (time.perf_counter() - inicio) * 1000
+
+    muestra = proyectos[:llamadas]
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=hilos) as executor:
+        tiempos = sorted(executor.map(una, muestra))
+    segundos = time.perf_counter() - inicio
+    return {
+        "simulaciones": len(muestra),
+        "hilos": hilos,
+        "latencia_modelo_ms": latencia_ms,
+        "por_segundo": round(len(muestra) / segundos, 2),
+        "mediana_ms": round(statistics.median(tiempos), 4),
+        "p95_ms": round(tiempos[min(len(tiempos) - 1, int(0.95 * len(tiempos)))], 4),
+        "llamadas_modelo": modelo.llamadas,
+    }
+
+
+def ejecutar(args) -> Dict:
+    """Corre todos los benchmarks en una carpeta temporal y devuelve el informe."""
+    directorio = tempfile.mkdtemp(prefix="bench_simulacion_")
+    rutas = (store.CSV_PATH, store.RESULTADOS_PATH, store.SHARDS, simulation._indice_vecinos)
+    store.CSV_PATH = os.path.join(directorio, "proyectos.csv")
+    store.RESULTADOS_PATH = os.path.join(directorio, "resultados.sqlite")
+    store.SHARDS = args.shards
+    # Sin índice persistente para que una corrida no influya en la siguiente
+    simulation._indice_vecinos = IndiceVecinos(path=None)
+    servicio_original = simulation._gemini_service
+    # Store y fórmulas se miden sin IA; el camino de IA usa su propio servicio falso
+    simulation.usar_servicio_gemini(False)
+    # Los logs DEBUG/INFO de cada operación dominarían las mediciones
+    nivel = logging.getLogger().level
+    logging.getLogger().setLevel(logging.WARNING)
+
+    informe = {
+        "meta": {
+            "fecha": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "plataforma": platform.platform(),
+            "semilla": SEMILLA,
+            "tamanos": args.tamanos,
+            "shards": args.shards,
+        },
+        "resultados": {},
+    }
+    try:
+        for n in args.tamanos:
+            print(f"Tamaño {n}...", file=sys.stderr)
+            for archivo in store.rutas() + [store.RESULTADOS_PATH]:
+                if os.path.exists(archivo):
+                    os.remove(archivo)
+            proyectos = generar_proyectos(n)
+            for op, datos in bench_store(proyectos, args.repeticiones).items():
+                informe["resultados"][f"store.{op}@{n}"] = datos
+            for op, datos in bench_formulas(proyectos, args.max_lote).items():
+                informe["resultados"][f"simulacion.{op}@{n}"] = datos
+        print("Camino de IA (modelo falso)...", file=sys.stderr)
+        informe["resultados"]["ia.simular"] = bench_ia(
+            generar_proyectos(args.llamadas_ia), args.llamadas_ia, args.hilos_ia, args.latencia_ia_ms
+        )
+    finally:
+        store.CSV_PATH, store.RESULTADOS_PATH, store.SHARDS, simulation._indice_vecinos = rutas
+        simulation.usar_servicio_gemini(servicio_original)
+        logging.getLogger().setLevel(nivel)
+        shutil.rmtree(directorio, ignore_errors=True)
+    return informe
+
+
+def medir_arranque(modulo: str, repeticiones: int = 5) -> Dict:
+    """
+    Importa el módulo en un proceso nuevo con `python -X importtime` y
+    devuelve la mediana del tiempo acumulado (ms) y los imports más caros
+    de la última corrida.
+    """
+    raiz = os.path.dirname(os.path.abspath(__file__))
+    tiempos = []
+    for _ in range(repeticiones):
+        proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {modulo}"],
+                              cwd=raiz, capture_output=True, text=True, check=True)
+        # Formato de cada línea: "import time: propio | acumulado | nombre" (en µs)
+        filas = []
+        for linea in proc.stderr.splitlines():
+            if not linea.startswith("import time:") or "|" not in linea:
+                continue
+            _, acumulado, nombre = linea[len("import time:"):].split("|")
+            if acumulado.strip().isdigit():
+                filas.append((int(acumulado), nombre.rstrip()))
+        total = next(us for us, nombre in filas if nombre.strip() == modulo)
+        tiempos.append(total / 1000)
+    # Los imports de primer nivel del módulo (dos espacios de sangría) ordenados por costo
+    directos = sorted(((us, n.strip()) for us, n in filas if n.startswith("   ") and not n.startswith("    ")),
+                      reverse=True)
+    return {
+        "mediana_ms": round(statistics.median(tiempos), 1),
+        "presupuesto_ms": ARRANQUE_PRESUPUESTO_MS[modulo],
+        "mas_caros": [{"modulo": n, "ms": round(us / 1000, 1)} for us, n in directos[:5]],
+    }
+
+
+def chequear_arranque() -> int:
+    """Falla (código 1) si cli.py o app.py tardan en importarse más que su presupuesto."""
+    codigo = 0
+    for modulo in ARRANQUE_PRESUPUESTO_MS:
+        datos = medir_arranque(modulo)
+        ok = datos["mediana_ms"] <= datos["presupuesto_ms"]
+        print(f"{modulo}: {datos['mediana_ms']} ms (presupuesto {datos['presupuesto_ms']} ms) "
+              f"{'OK' if ok else 'EXCEDIDO'}", file=sys.stderr)
+        for caro in datos["mas_caros"]:
+            print(f"    {caro['modulo']:<30} {caro['ms']:>7} ms", file=sys.stderr)
+        if not ok:
+            codigo = 1
+    return codigo
+
+
+def comparar(actual: Dict, base: Dict, tolerancia: float) -> List[str]:
+    """
+    Devuelve las regresiones: mediana_ms más alta o por_segundo más bajo
+    que la base en más de `tolerancia` (0.2 = 20%).
+    """
+    regresiones = []
+    for clave, datos in actual["resultados"].items():
+        previo = base.get("resultados", {}).get(clave)
+        if not previo:
+            continue
+        if "mediana_ms" in datos and previo.get("mediana_ms"):
+            cambio = datos["mediana_ms"] / previo["mediana_ms"] - 1
+            if cambio > tolerancia:
+                regresiones.append(f"{clave}: mediana {previo['mediana_ms']} -> {datos['mediana_ms']} ms (+{cambio:.0%})")
+        if "por_segundo" in datos and previo.get("por_segundo"):
+            cambio = 1 - datos["por_segundo"] / previo["por_segundo"]
+            if cambio > tolerancia:
+                regresiones.append(f"{clave}: {previo['por_segundo']} -> {datos['por_segundo']} /s (-{cambio:.0%})")
+    return regresiones
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmarks del simulador de impacto ambiental")
+    parser.add_argument("--tamanos", type=int, nargs="+", default=TAMANOS, help="Tamaños de los portafolios sintéticos")
+    parser.add_argument("--repeticiones", type=int, default=50, help="Repeticiones por operación de store")
+    parser.add_argument("--max-lote", type=int, default=2000, help="Proyectos máximos para simular_lote")
+    parser.add_argument("--llamadas-ia", type=int, default=200, help="Simulaciones contra el modelo falso")
+    parser.add_argument("--hilos-ia", type=int, default=8)
+    parser.add_argument("--latencia-ia-ms", type=float, default=50.0, help="Latencia media del modelo falso")
+    parser.add_argument("--shards", type=int, default=STORE_SHARDS,
+                        help="Archivos en que se reparten los proyectos (1 = CSV único)")
+    parser.add_argument("--salida", help="Archivo JSON donde guardar los resultados (por defecto stdout)")
+    parser.add_argument("--comparar", help="Resultados anteriores (JSON) contra los que buscar regresiones")
+    parser.add_argument("--tolerancia", type=float, default=TOLERANCIA, help="Empeoramiento permitido (0.2 = 20%%)")
+    parser.add_argument("--arranque", action="store_true",
+                        help="Solo verificar el tiempo de import de cli.py y app.py contra su presupuesto")
+    args = parser.parse_args(argv)
+
+    if args.arranque:
+        return chequear_arranque()
+
+    informe = ejecutar(args)
+    texto = json.dumps(informe, ensure_ascii=False, indent=2)
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            f.write(texto + "\n")
+        print(f"Resultados guardados en {args.salida}", file=sys.stderr)
+    else:
+        print(texto)
+
+    if args.comparar:
+        with open(args.comparar, "r", encoding="utf-8") as f:
+            base = json.load(f)
+        regresiones = comparar(informe, base, args.tolerancia)
+        if regresiones:
+            print(f"{len(regresiones)} regresiones respecto de {args.comparar}:", file=sys.stderr)
+            for r in regresiones:
+                print(f"  - {r}", file=sys.stderr)
+            return 1
+        print(f"Sin regresiones respecto de {args.comparar}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,10 +1,19 @@
+import argparse
+import csv
 import json
+import sys
+from dataclasses import asdict
 from src.crud_service import (
     init, crear_proyecto, listar_proyectos, obtener_proyecto,
-    actualizar_proyecto, eliminar_proyecto, simular_proyecto
+    actualizar_proyecto, eliminar_proyecto, simular_proyecto,
+    iterar_proyectos, simular_lote
 )
 import src.logger_base as _log
-from src.constants import TIPOS_PROYECTO
+from src.constants import TIPOS_PROYECTO, SIMULACION_LOTE_HILOS, VIGILANCIA_INTERVALO_S
+from src import bulk_io
+from src import cambios as registro_cambios
+from src.metricas import registro as registro_metricas
+from src import trazas
 
 log = _log.log
 
@@ -16,6 +25,7 @@ MENU = f"""
 4) Actualizar proyecto
 5) Eliminar proyecto
 6) Simular impacto
+7) Ver métricas
 0) Salir
 """
 
@@ -25,7 +35,46 @@ def pedir(msg, cast=str, default=None):
         return default
     return cast(v)
 
-def main():
+def impacto_a_dict(imp):
+    """Resultado de una simulación en el formato que muestra la CLI."""
+    return {
+        "proyecto_id": imp.proyecto_id,
+        "scores": {
+            "aire": imp.calidad_aire,
+            "agua": imp.calidad_agua,
+            "biodiversidad": imp.biodiversidad,
+            "uso_suelo": imp.uso_suelo
+        },
+        "riesgo_total": imp.riesgo_total,
+        "origen": imp.origen,
+        "recomendaciones": imp.recomendaciones
+    }
+
+def imprimir_en_vivo():
+    """
+    Devuelve un callback que imprime las recomendaciones de la IA
+    en stdout a medida que llegan, con un encabezado por categoría.
+    """
+    estado = {"categoria": None}
+
+    def al_recibir(categoria, fragmento):
+        if categoria != estado["categoria"]:
+            if estado["categoria"] is None:
+                print("Recomendaciones (en vivo):")
+            else:
+                print()
+            print(f"  - {categoria}: ", end="")
+            estado["categoria"] = categoria
+        print(fragmento, end="", flush=True)
+
+    def terminar():
+        if estado["categoria"] is not None:
+            print()
+
+    al_recibir.terminar = terminar
+    return al_recibir
+
+def modo_interactivo():
     log.info('Iniciando aplicación CLI del Simulador de Impacto Ambiental')
     init()
     
@@ -85,13 +134,8 @@ def main():
             campo = pedir("campo a cambiar (nombre,tipo,area_ha,duracion_meses,ubicacion,intensidad)")
             valor = pedir("nuevo valor")
             
-            # intento de casteo rápido
+            # crud_service valida el proyecto como quedaría y convierte el valor al tipo del campo
             try:
-                if campo in ("area_ha",): 
-                    valor = float(valor)
-                if campo in ("duracion_meses","intensidad"): 
-                    valor = int(valor)
-                
                 log.debug(f'Actualizando proyecto {pid}, campo {campo} = {valor}')
                 resultado = actualizar_proyecto(pid, {campo: valor})
                 
@@ -103,8 +147,8 @@ def main():
                     print("Fallo")
                     
             except ValueError as e:
-                log.error(f'Error de conversión de tipo al actualizar proyecto {pid}: {e}')
-                print("Error: Valor numérico inválido")
+                log.error(f'Error de validación al actualizar proyecto {pid}: {e}')
+                print(f"Error: {e}")
             except Exception as e:
                 log.error(f'Error inesperado al actualizar proyecto {pid}: {e}')
                 print("Error inesperado al actualizar")
@@ -126,25 +170,20 @@ def main():
             pid = pedir("id")
             log.debug(f'Iniciando simulación para proyecto: {pid}')
             
-            imp = simular_proyecto(pid)
+            en_vivo = imprimir_en_vivo()
+            imp = simular_proyecto(pid, en_vivo)
+            en_vivo.terminar()
             if imp:
                 log.info(f'Simulación completada para proyecto {pid}. Riesgo total: {imp.riesgo_total:.1f}%')
-                resultado = {
-                    "proyecto_id": imp.proyecto_id,
-                    "scores": {
-                        "aire": imp.calidad_aire,
-                        "agua": imp.calidad_agua,
-                        "biodiversidad": imp.biodiversidad,
-                        "uso_suelo": imp.uso_suelo
-                    },
-                    "riesgo_total": imp.riesgo_total,
-                    "recomendaciones": imp.recomendaciones
-                }
-                print(json.dumps(resultado, indent=2, ensure_ascii=False))
+                print(json.dumps(impacto_a_dict(imp), indent=2, ensure_ascii=False))
             else:
                 log.warning(f'Proyecto {pid} no encontrado para simulación')
                 print("Proyecto no encontrado")
                 
+        elif op == "7":
+            log.info('Usuario seleccionó: Ver métricas')
+            print(registro_metricas.a_texto())
+
         elif op == "0":
             log.info('Usuario seleccionó salir. Finalizando aplicación CLI')
             print("¡Hasta luego!")
@@ -154,13 +193,330 @@ def main():
             log.warning(f'Opción inválida ingresada: {op}')
             print("Opción inválida")
 
+# ---------------------- Modo no interactivo ----------------------
+
+class Salida:
+    """
+    Escribe registros en stdout a medida que están listos.
+    - json: un arreglo JSON que se va escribiendo elemento por elemento
+    - jsonl: un objeto JSON por línea
+    - csv: encabezado con las claves del primer registro; los valores
+      anidados (dicts) se escriben como JSON dentro de la celda
+    Cada registro se hace flush para que los pipes lo reciban enseguida.
+    """
+
+    def __init__(self, formato: str, stream=None, arreglo: bool = True):
+        self.formato = formato
+        self.stream = stream or sys.stdout
+        self.arreglo = arreglo      # False = un único objeto (p. ej. "get" en json)
+        self.cantidad = 0
+        self._csv = None
+
+    def escribir(self, registro: dict) -> None:
+        if self.formato == "jsonl":
+            self.stream.write(json.dumps(registro, ensure_ascii=False) + "\n")
+        elif self.formato == "csv":
+            plano = {k: json.dumps(v, ensure_ascii=False) if isinstance(v, dict) else v
+                     for k, v in _aplanar(registro).items()}
+            if self._csv is None:
+                self._csv = csv.DictWriter(self.stream, fieldnames=list(plano), extrasaction="ignore")
+                self._csv.writeheader()
+            self._csv.writerow(plano)
+        else:
+            texto = json.dumps(registro, ensure_ascii=False, indent=2)
+            if self.arreglo:
+                texto = ("[\n" if self.cantidad == 0 else ",\n") + texto
+            self.stream.write(texto)
+        self.cantidad += 1
+        self.stream.flush()
+
+    def cerrar(self) -> None:
+        if self.formato == "json":
+            if self.arreglo:
+                self.stream.write("[]\n" if self.cantidad == 0 else "\n]\n")
+            elif self.cantidad:
+                self.stream.write("\n")
+        self.stream.flush()
+
+def _aplanar(registro: dict) -> dict:
+    """Sube un nivel los dicts de puntajes (scores.aire -> scores_aire) para CSV."""
+    plano = {}
+    for k, v in registro.items():
+        if k == "scores" and isinstance(v, dict):
+            plano.update({f"{k}_{sub}": val for sub, val in v.items()})
+        else:
+            plano[k] = v
+    return plano
+
+def _parsear_cambios(pares):
+    """Convierte ["campo=valor", ...] en un dict para actualizar_proyecto."""
+    cambios = {}
+    for par in pares:
+        if "=" not in par:
+            raise ValueError(f"Cambio inválido '{par}', usa campo=valor")
+        campo, valor = par.split("=", 1)
+        cambios[campo.strip()] = valor.strip()
+    return cambios
+
+def cmd_create(args, salida):
+    data = {
+        "id": args.id,
+        "nombre": args.nombre,
+        "tipo": args.tipo,
+        "area_ha": args.area_ha,
+        "duracion_meses": args.duracion_meses,
+        "ubicacion": args.ubicacion,
+        "intensidad": args.intensidad,
+    }
+    p = crear_proyecto(data)
+    salida.escribir(asdict(p))
+    return 0
+
+def cmd_list(args, salida):
+    for p in iterar_proyectos():
+        salida.escribir(asdict(p))
+    return 0
+
+def cmd_get(args, salida):
+    p = obtener_proyecto(args.id)
+    if not p:
+        print(f"No existe el proyecto {args.id}", file=sys.stderr)
+        return 1
+    salida.escribir(asdict(p))
+    return 0
+
+def cmd_update(args, salida):
+    if not actualizar_proyecto(args.id, _parsear_cambios(args.cambios)):
+        print(f"No existe el proyecto {args.id}", file=sys.stderr)
+        return 1
+    p = obtener_proyecto(args.id)
+    if p is None:
+        # Otro proceso lo borró entre la actualización y la lectura
+        print(f"El proyecto {args.id} ya no existe", file=sys.stderr)
+        return 1
+    salida.escribir(asdict(p))
+    return 0
+
+def cmd_delete(args, salida):
+    if not eliminar_proyecto(args.id):
+        print(f"No existe el proyecto {args.id}", file=sys.stderr)
+        return 1
+    salida.escribir({"id": args.id, "eliminado": True})
+    return 0
+
+def cmd_simulate(args, salida):
+    if not args.all and not args.ids:
+        print("Indica uno o más ids o usa --all", file=sys.stderr)
+        return 2
+    errores = 0
+    # Varios ids o --all: en paralelo, escribiendo cada resultado cuando termina
+    for p, imp in simular_lote(None if args.all else args.ids, max_hilos=args.hilos):
+        if imp is None:
+            errores += 1
+            print(f"Falló la simulación de {p.id}", file=sys.stderr)
+            continue
+        salida.escribir(impacto_a_dict(imp))
+    if not args.all and salida.cantidad + errores < len(set(args.ids)):
+        print("Algunos proyectos no existen", file=sys.stderr)
+        return 1
+    return 1 if errores else 0
+
+def _abrir(ruta, modo):
+    """Abre un archivo de texto, o devuelve stdin/stdout si la ruta es '-'."""
+    if ruta == "-":
+        return sys.stdin if "r" in modo else sys.stdout
+    return open(ruta, modo, newline="", encoding="utf-8")
+
+def cmd_import(args, salida):
+    fuente = _abrir(args.archivo, "r")
+    errores = open(args.errores, "w", encoding="utf-8") if args.errores else None
+    try:
+        resumen = bulk_io.importar(
+            fuente, args.formato, errores, args.bloque,
+            lambda r: print(f"Leídos {r['leidos']}, importados {r['importados']}, "
+                            f"rechazados {r['rechazados']}", file=sys.stderr)
+        )
+    finally:
+        if fuente is not sys.stdin:
+            fuente.close()
+        if errores:
+            errores.close()
+    salida.escribir(resumen)
+    return 1 if resumen["rechazados"] else 0
+
+def cmd_export(args, salida):
+    destino = _abrir(args.archivo, "w")
+    try:
+        bulk_io.exportar(destino, args.formato,
+                         lambda n: print(f"Exportados {n}", file=sys.stderr))
+    finally:
+        if destino is not sys.stdout:
+            destino.close()
+    return 0
+
+def cmd_cambios(args, salida):
+    if args.consumidor:
+        # Desde el checkpoint del consumidor; lo avanzo recién después de escribir todo
+        eventos, cp = registro_cambios.leer_consumidor(args.consumidor, args.limite)
+        for evento in eventos:
+            salida.escribir(evento)
+        registro_cambios.confirmar(args.consumidor, cp)
+        print(f"{len(eventos)} cambios; checkpoint de {args.consumidor} en {cp['seq']}", file=sys.stderr)
+        return 0
+    for evento in registro_cambios.leer(args.desde, args.limite):
+        salida.escribir(evento)
+    return 0
+
+def cmd_trazas_chrome(args, salida):
+    n = trazas.exportar_chrome(args.destino, args.origen)
+    salida.escribir({"eventos": n, "destino": args.destino})
+    return 0
+
+def cmd_vigilar(args, salida):
+    # Solo lo importo acá: el resto de los comandos no lo necesita
+    from src.vigilancia import Vigilante, Diferencias
+    vigilante = Vigilante(args.intervalo)
+    n = vigilante.tomar_base()
+    print(f"Vigilando {n} proyectos cada {args.intervalo:g} s (Ctrl+C para terminar)", file=sys.stderr)
+
+    def al_cambiar(dif):
+        for pid in dif.eliminados:
+            print(f"Proyecto eliminado: {pid}", file=sys.stderr)
+        for p, imp in vigilante.aplicar(dif, args.hilos):
+            if imp is None:
+                print(f"Falló la simulación de {p.id}", file=sys.stderr)
+                continue
+            salida.escribir(impacto_a_dict(imp))
+
+    try:
+        if args.inicial:
+            al_cambiar(Diferencias(nuevos=[p.id for p in iterar_proyectos()]))
+        vigilante.ejecutar(al_cambiar)
+    except KeyboardInterrupt:
+        print("Vigilancia terminada", file=sys.stderr)
+    return 0
+
+def construir_parser():
+    parser = argparse.ArgumentParser(
+        description="Simulador de Impacto Ambiental. Sin subcomando abre el menú interactivo."
+    )
+    formato = argparse.ArgumentParser(add_help=False)
+    formato.add_argument("--format", dest="formato", choices=("json", "jsonl", "csv"), default="json",
+                         help="Formato de salida (por defecto json)")
+    parser.add_argument("--metricas", choices=("texto", "json", "prometheus"),
+                        help="Al terminar, muestra en stderr las métricas de latencia del comando")
+    parser.add_argument("--trazas", nargs="?", const=trazas.TRAZAS_PATH, metavar="ARCHIVO",
+                        help="Guarda trazas por simulación (JSONL con eventos de Chrome, por defecto data/trazas.jsonl)")
+    sub = parser.add_subparsers(dest="comando")
+
+    p = sub.add_parser("create", parents=[formato], help="Crear un proyecto")
+    p.add_argument("--id", required=True)
+    p.add_argument("--nombre", required=True)
+    p.add_argument("--tipo", required=True, choices=TIPOS_PROYECTO)
+    p.add_argument("--area-ha", dest="area_ha", type=float, required=True)
+    p.add_argument("--duracion-meses", dest="duracion_meses", type=int, required=True)
+    p.add_argument("--ubicacion", default="")
+    p.add_argument("--intensidad", type=int, default=5)
+    p.set_defaults(fn=cmd_create, arreglo=False)
+
+    p = sub.add_parser("list", parents=[formato], help="Listar proyectos")
+    p.set_defaults(fn=cmd_list, arreglo=True)
+
+    p = sub.add_parser("get", parents=[formato], help="Ver un proyecto")
+    p.add_argument("id")
+    p.set_defaults(fn=cmd_get, arreglo=False)
+
+    p = sub.add_parser("update", parents=[formato], help="Actualizar campos (campo=valor ...)")
+    p.add_argument("id")
+    p.add_argument("cambios", nargs="+", metavar="campo=valor")
+    p.set_defaults(fn=cmd_update, arreglo=False)
+
+    p = sub.add_parser("delete", parents=[formato], help="Eliminar un proyecto")
+    p.add_argument("id")
+    p.set_defaults(fn=cmd_delete, arreglo=False)
+
+    p = sub.add_parser("simulate", parents=[formato], help="Simular uno o más proyectos")
+    p.add_argument("ids", nargs="*")
+    p.add_argument("--all", action="store_true", help="Simular todos los proyectos")
+    p.add_argument("--hilos", type=int, default=SIMULACION_LOTE_HILOS, help="Simulaciones en paralelo")
+    p.set_defaults(fn=cmd_simulate, arreglo=True)
+
+    p = sub.add_parser("import", help="Importar proyectos en bloque desde CSV/JSONL")
+    p.add_argument("archivo", nargs="?", default="-", help="Archivo a importar ('-' = stdin)")
+    p.add_argument("--format", dest="formato", choices=bulk_io.FORMATOS, default="csv")
+    p.add_argument("--errores", help="Archivo JSONL donde guardar los registros rechazados")
+    p.add_argument("--bloque", type=int, default=bulk_io.TAM_BLOQUE, help="Proyectos por bloque de escritura")
+    p.set_defaults(fn=cmd_import, arreglo=False, salida="json")
+
+    p = sub.add_parser("export", help="Exportar proyectos con su último resultado")
+    p.add_argument("archivo", nargs="?", default="-", help="Archivo de salida ('-' = stdout)")
+    p.add_argument("--format", dest="formato", choices=bulk_io.FORMATOS, default="jsonl")
+    p.set_defaults(fn=cmd_export, arreglo=False, salida=None)
+
+    p = sub.add_parser("cambios", parents=[formato], help="Ver el registro de cambios de proyectos")
+    p.add_argument("--desde", type=int, default=0, help="Solo los cambios con secuencia mayor")
+    p.add_argument("--consumidor", help="Leer desde el checkpoint de este consumidor y avanzarlo")
+    p.add_argument("--limite", type=int, help="Máximo de cambios a devolver")
+    p.set_defaults(fn=cmd_cambios, arreglo=True)
+
+    p = sub.add_parser("vigilar", parents=[formato],
+                       help="Vigilar el CSV y simular solo los proyectos nuevos o modificados")
+    p.add_argument("--intervalo", type=float, default=VIGILANCIA_INTERVALO_S, help="Segundos entre revisiones")
+    p.add_argument("--hilos", type=int, default=SIMULACION_LOTE_HILOS, help="Simulaciones en paralelo")
+    p.add_argument("--inicial", action="store_true", help="Simular todos los proyectos al empezar")
+    p.set_defaults(fn=cmd_vigilar, arreglo=True)
+
+    p = sub.add_parser("trazas-chrome", parents=[formato], help="Convertir las trazas (JSONL) en un .json para chrome://tracing/Perfetto")
+    p.add_argument("destino", help="Archivo .json a generar")
+    p.add_argument("--origen", default=trazas.TRAZAS_PATH, help="Trazas a convertir (por defecto data/trazas.jsonl)")
+    p.set_defaults(fn=cmd_trazas_chrome, arreglo=False)
+
+    return parser
+
+def main(argv=None):
+    args = construir_parser().parse_args(argv)
+    if args.trazas:
+        trazas.activar(args.trazas)
+    if args.comando is None:
+        modo_interactivo()
+        return 0
+    log.info(f'CLI no interactiva: {args.comando}')
+    init()
+    # import/export usan --format para los datos; su resumen (si hay) va en JSON
+    salida = Salida(getattr(args, "salida", args.formato) or "jsonl", arreglo=args.arreglo)
+    try:
+        return args.fn(args, salida)
+    except ValueError as e:
+        log.error(f'Error de validación en {args.comando}: {e}')
+        print(f"Error de validación: {e}", file=sys.stderr)
+        return 1
+    finally:
+        salida.cerrar()
+        if args.metricas:
+            imprimir_metricas(args.metricas)
+
+def imprimir_metricas(formato: str) -> None:
+    """Vuelca en stderr el registro de métricas del proceso."""
+    if formato == "json":
+        texto = json.dumps(registro_metricas.a_dict(), ensure_ascii=False, indent=2)
+    elif formato == "prometheus":
+        texto = registro_metricas.a_prometheus()
+    else:
+        texto = registro_metricas.a_texto()
+    print(texto, file=sys.stderr)
+
 if __name__ == "__main__":
     try:
-        main()
+        codigo = main()
         log.info('Aplicación CLI finalizada correctamente')
+        sys.exit(codigo)
+    except BrokenPipeError:
+        # El otro lado del pipe (p. ej. head) cerró antes de terminar
+        sys.exit(0)
     except KeyboardInterrupt:
         log.info('Aplicación CLI interrumpida por el usuario (Ctrl+C)')
         print("\nAplicación interrumpida")
     except Exception as e:
         log.critical(f'Error crítico en aplicación CLI: {e}')
-        print(f"Error crítico: {e}")
\ No newline at end of file
+        print(f"Error crítico: {e}", file=sys.stderr)
+        sys.exit(1)
\ No newline at end of file
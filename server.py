@@ -0,0 +1,392 @@
+"""
+Servidor HTTP/JSON local para que otras herramientas usen el simulador.
+Expone las operaciones de crud_service como endpoints JSON. Las
+simulaciones corren en un pool de trabajadores que ya arranca con el
+servicio de Gemini inicializado, las conexiones son keep-alive (HTTP/1.1)
+y se pueden mandar varias operaciones en una sola petición.
+
+Endpoints:
+    GET    /salud
+    GET    /metricas
+    GET    /metricas/prometheus
+    GET    /proyectos
+    POST   /proyectos
+    GET    /proyectos/<id>
+    PATCH  /proyectos/<id>
+    DELETE /proyectos/<id>
+    POST   /proyectos/<id>/simular
+    GET    /proyectos/<id>/impacto
+    POST   /simulaciones        {"ids": [...]}
+    POST   /lote                [{"metodo": "GET", "ruta": "/proyectos/P1", "cuerpo": {...}}, ...]
+    GET    /cambios?desde=N&limite=M
+"""
+import argparse
+import json
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import asdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Set, Tuple
+from urllib.parse import parse_qs, unquote, urlsplit
+from src.crud_service import (
+    init, crear_proyecto, listar_proyectos, obtener_proyecto,
+    actualizar_proyecto, eliminar_proyecto, simular_proyecto, ultimo_impacto
+)
+from src.gemini_service import HistogramaLatencias
+from src import simulation
+from src import cambios as registro_cambios
+from src.metricas import registro as registro_metricas
+from src import trazas
+import src.logger_base as _log
+from src.constants import (
+    SERVIDOR_HOST, SERVIDOR_PUERTO, SERVIDOR_HILOS, SERVIDOR_KEEPALIVE, SERVIDOR_LOTE_MAX
+)
+
+log = _log.log
+
+
+class ErrorHTTP(Exception):
+    """Error que se devuelve al cliente con su código de estado."""
+
+    def __init__(self, estado: int, mensaje: str):
+        super().__init__(mensaje)
+        self.estado = estado
+
+
+class TextoPlano(str):
+    """Respuesta que se envía como text/plain en lugar de JSON."""
+
+
+class Metricas:
+    """Peticiones atendidas, errores, throughput y latencias por ruta."""
+
+    def __init__(self):
+        self.inicio = time.monotonic()
+        self.peticiones = 0
+        self.errores = 0
+        self.por_ruta: Dict[str, int] = {}
+        self._ultimas = deque()     # Instantes de las peticiones del último minuto
+        self._latencias: Dict[str, HistogramaLatencias] = {}
+        self._lock = threading.Lock()
+
+    def registrar(self, ruta: str, estado: int, segundos: float) -> None:
+        ahora = time.monotonic()
+        with self._lock:
+            self.peticiones += 1
+            if estado >= 500:
+                self.errores += 1
+            self.por_ruta[ruta] = self.por_ruta.get(ruta, 0) + 1
+            self._ultimas.append(ahora)
+            while self._ultimas and ahora - self._ultimas[0] > 60:
+                self._ultimas.popleft()
+            hist = self._latencias.setdefault(ruta, HistogramaLatencias())
+        hist.registrar(segundos)
+
+    def resumen(self) -> Dict:
+        """Percentiles en milisegundos (null hasta tener suficientes muestras)."""
+        ahora = time.monotonic()
+        with self._lock:
+            while self._ultimas and ahora - self._ultimas[0] > 60:
+                self._ultimas.popleft()
+            activo = ahora - self.inicio
+            datos = {
+                "activo_segundos": round(activo, 1),
+                "peticiones": self.peticiones,
+                "errores": self.errores,
+                "por_segundo_total": round(self.peticiones / activo, 2) if activo else 0.0,
+                "por_segundo_ultimo_minuto": round(len(self._ultimas) / min(60.0, activo), 2) if activo else 0.0,
+                "por_ruta": dict(self.por_ruta),
+            }
+            latencias = dict(self._latencias)
+
+        def ms(valor):
+            return round(valor * 1000, 1) if valor is not None else None
+
+        datos["latencia_ms"] = {
+            ruta: {f"p{p}": ms(hist.percentil(p)) for p in (50, 95, 99)}
+            for ruta, hist in latencias.items()
+        }
+        return datos
+
+
+class Servidor(ThreadingHTTPServer):
+    """ThreadingHTTPServer con el pool de simulación y las métricas compartidas."""
+
+    daemon_threads = True
+
+    def __init__(self, direccion, hilos: int = SERVIDOR_HILOS):
+        super().__init__(direccion, Manejador)
+        self.metricas = Metricas()
+        self.pool = ThreadPoolExecutor(max_workers=hilos, thread_name_prefix='servidor')
+        self.hilos = hilos
+        # Simulaciones encargadas y sin terminar, para cancelarlas al cerrar
+        self._pendientes: Set[Future] = set()
+        self._lock_pendientes = threading.Lock()
+        self._calentar()
+
+    def _calentar(self) -> None:
+        """Crea el servicio de Gemini y arranca todos los trabajadores antes de aceptar peticiones."""
+        inicio = time.perf_counter()
+        servicio = simulation._get_gemini_service()
+        barrera = threading.Barrier(self.hilos)
+        # Cada tarea espera a las demás, así el pool levanta todos sus hilos
+        for futuro in [self.pool.submit(barrera.wait) for _ in range(self.hilos)]:
+            futuro.result()
+        log.info('Pool de %d trabajadores listo en %.2fs (%s Gemini)',
+                 self.hilos, time.perf_counter() - inicio, "con" if servicio else "sin")
+
+    def simular(self, pid: str) -> Future:
+        """Encarga la simulación de un proyecto al pool (con la traza actual)."""
+        futuro = self.pool.submit(trazas.en_contexto(simular_proyecto), pid)
+        with self._lock_pendientes:
+            self._pendientes.add(futuro)
+        futuro.add_done_callback(self._terminada)
+        return futuro
+
+    def _terminada(self, futuro: Future) -> None:
+        with self._lock_pendientes:
+            self._pendientes.discard(futuro)
+
+    def server_close(self) -> None:
+        super().server_close()
+        # shutdown(cancel_futures=True) recién existe desde Python 3.9: cancelo a mano
+        # las que todavía no empezaron; las que ya corren terminan en su hilo
+        with self._lock_pendientes:
+            pendientes = list(self._pendientes)
+        for futuro in pendientes:
+            futuro.cancel()
+        self.pool.shutdown(wait=False)
+
+
+def _impacto_a_dict(imp) -> Optional[Dict]:
+    return asdict(imp) if imp is not None else None
+
+
+def _simular(servidor: Servidor, pid: str) -> Dict:
+    impacto = servidor.simular(pid).result()
+    if impacto is None:
+        raise ErrorHTTP(404, f"No existe el proyecto {pid}")
+    return _impacto_a_dict(impacto)
+
+
+def despachar(servidor: Servidor, metodo: str, ruta: str, cuerpo) -> Tuple[int, object]:
+    """Resuelve una operación y devuelve (estado, respuesta). Lanza ErrorHTTP si falla."""
+    partes = [unquote(p) for p in urlsplit(ruta).path.strip("/").split("/") if p]
+
+    if partes == ["salud"] and metodo == "GET":
+        return 200, {"estado": "ok", "gemini": simulation._get_gemini_service() is not None}
+    if partes == ["metricas"] and metodo == "GET":
+        return 200, {"http": servidor.metricas.resumen(), "internas": registro_metricas.a_dict()}
+    if partes == ["metricas", "prometheus"] and metodo == "GET":
+        return 200, TextoPlano(registro_metricas.a_prometheus())
+
+    if partes == ["proyectos"]:
+        if metodo == "GET":
+            return 200, [asdict(p) for p in listar_proyectos()]
+        if metodo == "POST":
+            if not isinstance(cuerpo, dict):
+                raise ErrorHTTP(400, "El cuerpo debe ser un objeto JSON con el proyecto")
+            p = crear_proyecto(cuerpo)
+            if p is None:
+                raise ErrorHTTP(400, "No se pudo crear el proyecto (ver logs)")
+            return 201, asdict(p)
+
+    if len(partes) == 2 and partes[0] == "proyectos":
+        pid = partes[1]
+        if metodo == "GET":
+            p = obtener_proyecto(pid)
+            if p is None:
+                raise ErrorHTTP(404, f"No existe el proyecto {pid}")
+            return 200, asdict(p)
+        if metodo in ("PATCH", "PUT"):
+            if not isinstance(cuerpo, dict):
+                raise ErrorHTTP(400, "El cuerpo debe ser un objeto JSON con los cambios")
+            # Los cambios inválidos salen como ValueError, que _atender responde con 400
+            if not actualizar_proyecto(pid, cuerpo):
+                raise ErrorHTTP(404, f"No existe el proyecto {pid}")
+            p = obtener_proyecto(pid)
+            if p is None:
+                raise ErrorHTTP(404, f"No existe el proyecto {pid}")
+            return 200, asdict(p)
+        if metodo == "DELETE":
+            if not eliminar_proyecto(pid):
+                raise ErrorHTTP(404, f"No existe el proyecto {pid}")
+            return 200, {"eliminado": pid}
+
+    if len(partes) == 3 and partes[0] == "proyectos":
+        pid = partes[1]
+        if partes[2] == "simular" and metodo == "POST":
+            return 200, _simular(servidor, pid)
+        if partes[2] == "impacto" and metodo == "GET":
+            imp = ultimo_impacto(pid)
+            if imp is None:
+                raise ErrorHTTP(404, f"El proyecto {pid} no tiene simulaciones guardadas")
+            return 200, _impacto_a_dict(imp)
+
+    if partes == ["cambios"] and metodo == "GET":
+        consulta = parse_qs(urlsplit(ruta).query)
+        try:
+            desde = int(consulta.get("desde", ["0"])[0])
+            limite = int(consulta.get("limite", [str(SERVIDOR_LOTE_MAX)])[0])
+        except ValueError:
+            raise ErrorHTTP(400, '"desde" y "limite" deben ser enteros')
+        # El cliente guarda el último seq recibido y lo manda como "desde" la próxima vez
+        return 200, list(registro_cambios.leer(desde, min(limite, SERVIDOR_LOTE_MAX)))
+
+    if partes == ["simulaciones"] and metodo == "POST":
+        ids = cuerpo.get("ids") if isinstance(cuerpo, dict) else None
+        if not isinstance(ids, list) or not ids:
+            raise ErrorHTTP(400, 'Falta la lista "ids"')
+        if len(ids) > SERVIDOR_LOTE_MAX:
+            raise ErrorHTTP(413, f"Máximo {SERVIDOR_LOTE_MAX} proyectos por petición")
+        # Todas se encargan al pool a la vez y se responden en el orden pedido
+        futuros = [servidor.simular(str(pid)) for pid in ids]
+        resultados = []
+        for pid, futuro in zip(ids, futuros):
+            try:
+                imp = futuro.result()
+                resultados.append({"id": pid, "impacto": _impacto_a_dict(imp),
+                                   "error": None if imp else "No existe el proyecto"})
+            except Exception as e:
+                log.error('Error al simular %s desde el servidor: %s', pid, e)
+                resultados.append({"id": pid, "impacto": None, "error": str(e)})
+        return 200, resultados
+
+    if partes == ["lote"] and metodo == "POST":
+        if not isinstance(cuerpo, list):
+            raise ErrorHTTP(400, "El cuerpo debe ser una lista de operaciones")
+        if len(cuerpo) > SERVIDOR_LOTE_MAX:
+            raise ErrorHTTP(413, f"Máximo {SERVIDOR_LOTE_MAX} operaciones por lote")
+        respuestas = []
+        for op in cuerpo:
+            if not isinstance(op, dict) or "ruta" not in op:
+                respuestas.append({"estado": 400, "error": 'Cada operación necesita "ruta"'})
+                continue
+            sub_metodo = str(op.get("metodo", "GET")).upper()
+            if urlsplit(op["ruta"]).path.strip("/") == "lote":
+                respuestas.append({"estado": 400, "error": "No se pueden anidar lotes"})
+                continue
+            try:
+                estado, datos = despachar(servidor, sub_metodo, op["ruta"], op.get("cuerpo"))
+                respuestas.append({"estado": estado, "datos": datos})
+            except ErrorHTTP as e:
+                respuestas.append({"estado": e.estado, "error": str(e)})
+            except ValueError as e:
+                respuestas.append({"estado": 400, "error": str(e)})
+        return 200, respuestas
+
+    raise ErrorHTTP(404, f"Ruta no encontrada: {metodo} {ruta}")
+
+
+def _ruta_metrica(ruta: str) -> str:
+    """Agrupa /proyectos/<id>/... en una sola ruta para las métricas."""
+    partes = urlsplit(ruta).path.strip("/").split("/")
+    if partes[0] not in ("salud", "metricas", "proyectos", "simulaciones", "lote", "cambios"):
+        return "/desconocida"   # Para que rutas inventadas no llenen las métricas
+    if len(partes) >= 2 and partes[0] == "proyectos":
+        partes[1] = "{id}"
+    return "/" + "/".join(partes)
+
+
+class Manejador(BaseHTTPRequestHandler):
+    # HTTP/1.1 mantiene la conexión abierta entre peticiones (keep-alive)
+    protocol_version = "HTTP/1.1"
+    timeout = SERVIDOR_KEEPALIVE
+    server_version = "SimulacionAmbiental/1.0"
+
+    def _atender(self, metodo: str) -> None:
+        inicio = time.perf_counter()
+        try:
+            cuerpo = self._leer_cuerpo()
+            # Cada petición es la raíz de su propia traza
+            with trazas.span(f"http.{metodo} {_ruta_metrica(self.path)}"):
+                estado, datos = despachar(self.server, metodo, self.path, cuerpo)
+        except ErrorHTTP as e:
+            estado, datos = e.estado, {"error": str(e)}
+        except ValueError as e:
+            estado, datos = 400, {"error": str(e)}
+        except Exception as e:
+            log.error('Error en %s %s: %s', metodo, self.path, e)
+            estado, datos = 500, {"error": "Error interno del servidor"}
+        self._responder(estado, datos)
+        self.server.metricas.registrar(f"{metodo} {_ruta_metrica(self.path)}", estado,
+                                       time.perf_counter() - inicio)
+
+    def _leer_cuerpo(self):
+        try:
+            largo = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            largo = -1
+        if largo < 0:
+            # No sé dónde termina el cuerpo: si sigo con la conexión, la próxima
+            # petición se leería desde los bytes que quedaron sin consumir
+            self.close_connection = True
+            raise ErrorHTTP(400, "Content-Length inválido")
+        if not largo:
+            return None
+        try:
+            return json.loads(self.rfile.read(largo))
+        except ValueError as e:
+            self.close_connection = True
+            raise ErrorHTTP(400, f"JSON inválido: {e}")
+
+    def _responder(self, estado: int, datos) -> None:
+        if isinstance(datos, TextoPlano):
+            contenido, tipo = datos.encode("utf-8"), "text/plain; version=0.0.4; charset=utf-8"
+        else:
+            contenido, tipo = json.dumps(datos, ensure_ascii=False).encode("utf-8"), "application/json; charset=utf-8"
+        self.send_response(estado)
+        self.send_header("Content-Type", tipo)
+        # Con Content-Length el cliente sabe dónde termina y puede reutilizar la conexión
+        self.send_header("Content-Length", str(len(contenido)))
+        if self.close_connection:
+            self.send_header("Connection", "close")
+        self.end_headers()
+        self.wfile.write(contenido)
+
+    def do_GET(self):
+        self._atender("GET")
+
+    def do_POST(self):
+        self._atender("POST")
+
+    def do_PATCH(self):
+        self._atender("PATCH")
+
+    def do_PUT(self):
+        self._atender("PUT")
+
+    def do_DELETE(self):
+        self._atender("DELETE")
+
+    def log_message(self, formato, *args):
+        # Las peticiones van al log del sistema y no a stderr
+        log.debug('%s %s', self.address_string(), formato % args)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Servidor HTTP/JSON local del simulador")
+    parser.add_argument("--host", default=SERVIDOR_HOST)
+    parser.add_argument("--puerto", type=int, default=SERVIDOR_PUERTO)
+    parser.add_argument("--hilos", type=int, default=SERVIDOR_HILOS, help="Trabajadores del pool de simulación")
+    parser.add_argument("--trazas", nargs="?", const=trazas.TRAZAS_PATH, metavar="ARCHIVO",
+                        help="Guarda trazas de cada petición (formato Chrome/Perfetto)")
+    args = parser.parse_args(argv)
+    if args.trazas:
+        trazas.activar(args.trazas)
+
+    init()
+    servidor = Servidor((args.host, args.puerto), args.hilos)
+    log.info('Servidor escuchando en http://%s:%d', args.host, servidor.server_address[1])
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        log.info('Servidor detenido por el usuario (Ctrl+C)')
+    finally:
+        servidor.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+"""
+Importación y exportación masiva de proyectos en streaming.
+Lee CSV o JSONL (de un archivo o de stdin) por bloques, valida cada
+registro con las mismas reglas que crear_proyecto y escribe los
+errores en un archivo aparte. La exportación recorre los proyectos
+de uno en uno junto con su último resultado, con memoria constante.
+"""
+import csv
+import itertools
+import json
+from dataclasses import asdict
+from typing import Callable, Dict, IO, Iterator, List, Optional, Tuple
+from src.models import Project
+from src.tablas import ProjectTable
+from src import store
+from src import cambios as registro_cambios
+from src.crud_service import _validar_proyecto
+from src.constants import CAMBIOS_ACTIVOS
+import src.logger_base as _log
+
+log = _log.log
+
+FORMATOS = ("csv", "jsonl")
+TAM_BLOQUE = 1000
+
+# Columnas de la exportación: las del proyecto y luego las del resultado
+COLUMNAS_IMPACTO = ["calidad_aire", "calidad_agua", "biodiversidad", "uso_suelo",
+                    "riesgo_total", "origen", "recomendaciones"]
+
+
+def _leer_registros(fuente: IO[str], formato: str) -> Iterator[Tuple[int, Dict]]:
+    """Devuelve (número de línea, registro) de uno en uno."""
+    if formato == "csv":
+        reader = csv.DictReader(fuente)
+        for row in reader:
+            yield reader.line_num, row
+    else:
+        for num, linea in enumerate(fuente, start=1):
+            if not linea.strip():
+                continue
+            try:
+                registro = json.loads(linea)
+            except ValueError as e:
+                yield num, {"_error": f"JSON inválido: {e}", "_linea": linea.rstrip("\n")}
+                continue
+            if not isinstance(registro, dict):
+                registro = {"_error": "Cada línea debe ser un objeto JSON", "_linea": linea.rstrip("\n")}
+            yield num, registro
+
+
+def _a_proyecto(registro: Dict) -> Project:
+    """Convierte un registro ya validado en Project (con los tipos correctos)."""
+    return Project(
+        id=str(registro["id"]).strip(),
+        nombre=str(registro["nombre"]).strip(),
+        tipo=registro["tipo"],
+        area_ha=float(registro["area_ha"]),
+        duracion_meses=int(registro["duracion_meses"]),
+        ubicacion=str(registro.get("ubicacion") or ""),
+        intensidad=int(registro.get("intensidad") or 5),
+    )
+
+
+def importar(
+    fuente: IO[str],
+    formato: str = "csv",
+    errores: Optional[IO[str]] = None,
+    tam_bloque: int = TAM_BLOQUE,
+    al_progresar: Optional[Callable[[Dict[str, int]], None]] = None
+) -> Dict[str, int]:
+    """
+    Importa proyectos desde un stream CSV o JSONL.
+
+    Args:
+        fuente: Archivo (o stdin) abierto en modo texto
+        formato: "csv" o "jsonl"
+        errores: Archivo donde se escribe un JSON por registro rechazado
+                 ({"linea", "registro", "error"}); None para no guardarlos
+        tam_bloque: Cuántos proyectos válidos se escriben al CSV de una vez
+        al_progresar: Callback que recibe el resumen tras cada bloque
+
+    Returns:
+        Resumen con 'leidos', 'importados' y 'rechazados'
+    """
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato inválido: {formato}. Usa {', '.join(FORMATOS)}")
+    log.info('Iniciando importación masiva (%s)', formato)
+
+    # Los duplicados los revisa store con el lock de escritura tomado (otro proceso
+    # puede estar creando proyectos a la vez); conocidos recuerda los ids ya leídos
+    conocidos = store.IdsConocidos()
+    resumen = {"leidos": 0, "importados": 0, "rechazados": 0}
+    bloque: List[Tuple[int, Dict, Project]] = []
+
+    def rechazar(num: int, registro: Dict, error: str):
+        resumen["rechazados"] += 1
+        if errores is not None:
+            errores.write(json.dumps({"linea": num, "registro": registro, "error": error},
+                                     ensure_ascii=False, default=str) + "\n")
+
+    def volcar():
+        if bloque:
+            # El cambio se registra con el lock del archivo tomado, así el orden del
+            # registro es el mismo que el de la escritura
+            def registrar(nuevos: List[Project]):
+                registro_cambios.registrar_muchos("create", ((p.id, None, p) for p in nuevos))
+
+            repetidos = {id(p) for p in store.create_many_sin_duplicados(
+                (p for _, _, p in bloque), conocidos,
+                al_escribir=registrar if CAMBIOS_ACTIVOS else None)}
+            for num, registro, p in bloque:
+                if id(p) in repetidos:
+                    rechazar(num, registro, f"Ya existe un proyecto con ID: {p.id}")
+                else:
+                    resumen["importados"] += 1
+            bloque.clear()
+        if al_progresar:
+            al_progresar(dict(resumen))
+
+    for num, registro in _leer_registros(fuente, formato):
+        resumen["leidos"] += 1
+        if "_error" in registro:
+            rechazar(num, registro.get("_linea"), registro["_error"])
+            continue
+        # Las celdas vacías cuentan como no informadas (así aplica el valor por defecto)
+        # y _validar_proyecto espera textos en id, nombre y ubicación
+        registro = {k: v for k, v in registro.items() if k is not None and v not in (None, "")}
+        registro["id"] = str(registro.get("id", ""))
+        registro["nombre"] = str(registro.get("nombre", ""))
+        if "ubicacion" in registro:
+            registro["ubicacion"] = str(registro["ubicacion"])
+        error = _validar_proyecto(registro)
+        if error is None:
+            try:
+                p = _a_proyecto(registro)
+            except (ValueError, TypeError, KeyError) as e:
+                error = f"Datos inválidos: {e}"
+        if error is not None:
+            rechazar(num, registro, error)
+            continue
+        bloque.append((num, registro, p))
+        if len(bloque) >= tam_bloque:
+            volcar()
+    volcar()
+
+    log.info('Importación terminada: %s', resumen)
+    return resumen
+
+
+def exportar(
+    destino: IO[str],
+    formato: str = "jsonl",
+    al_progresar: Optional[Callable[[int], None]] = None,
+    cada: int = TAM_BLOQUE
+) -> int:
+    """
+    Exporta cada proyecto junto con su último resultado de simulación
+    (campos vacíos/null si nunca se simuló). Lee y escribe de a bloques de
+    `cada` proyectos: cada bloque va en una ProjectTable (los Project se arman
+    al escribir cada fila) y sus resultados salen de una sola consulta, así
+    que la memoria no depende de cuántos haya.
+    Devuelve la cantidad de proyectos exportados.
+    """
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato inválido: {formato}. Usa {', '.join(FORMATOS)}")
+    log.info('Iniciando exportación masiva (%s)', formato)
+    writer = None
+    if formato == "csv":
+        writer = csv.DictWriter(destino, fieldnames=store.CSV_FIELDS + COLUMNAS_IMPACTO)
+        writer.writeheader()
+
+    n = 0
+    proyectos = store.iter_all()
+    with store.resultados() as con:
+        while True:
+            bloque = ProjectTable.desde(itertools.islice(proyectos, cada))
+            if not bloque:
+                break
+            impactos = store.read_impactos(bloque.columna("id"), con)
+            for p in bloque:
+                imp = impactos.get(p.id)
+                if formato == "csv":
+                    fila = store.proyecto_a_fila(p)
+                    if imp is not None:
+                        fila.update({k: getattr(imp, k) for k in COLUMNAS_IMPACTO})
+                        fila["recomendaciones"] = json.dumps(imp.recomendaciones, ensure_ascii=False)
+                    writer.writerow(fila)
+                else:
+                    registro = asdict(p)
+                    registro["impacto"] = asdict(imp) if imp is not None else None
+                    destino.write(json.dumps(registro, ensure_ascii=False) + "\n")
+            n += len(bloque)
+            if al_progresar and len(bloque) == cada:
+                al_progresar(n)
+    destino.flush()
+    if al_progresar:
+        al_progresar(n)
+    log.info('Exportación terminada: %d proyectos', n)
+    return n
@@ -0,0 +1,204 @@
+"""
+Registro de cambios (change feed) de los proyectos.
+Cada alta, modificación o baja que pasa por crud_service (o por la
+importación masiva) deja una línea en data/cambios.jsonl con un número de
+secuencia creciente y el proyecto antes y después del cambio:
+
+    {"seq": 12, "ts": 1718000000.0, "op": "update", "id": "P1",
+     "antes": {...}, "despues": {...}}
+
+Así quien sincroniza con otro sistema lee solo lo nuevo desde su último
+checkpoint en vez de reexportar todos los proyectos. Los checkpoints se
+guardan por consumidor (nombre) con la secuencia y la posición en bytes
+del archivo, para retomar con un seek sin releer lo ya procesado.
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+from dataclasses import asdict
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from src.models import Project
+import src.logger_base as _log
+
+log = _log.log
+
+try:
+    import fcntl  # Solo en Linux/macOS
+except ImportError:
+    fcntl = None
+
+CAMBIOS_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "cambios.jsonl")
+CHECKPOINTS_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "cambios_checkpoints.json")
+
+OPERACIONES = ("create", "update", "delete")
+
+# Última secuencia escrita por este proceso y el tamaño del archivo en ese momento:
+# si el archivo no creció desde entonces, no hace falta releer su final
+_ultima = (0, -1)
+_lock_local = threading.Lock()
+
+
+def _leer_ultima_secuencia(f) -> int:
+    """Lee el seq de la última línea completa del archivo (abierto en binario)."""
+    fin = f.seek(0, os.SEEK_END)
+    bloque = 4096
+    while True:
+        inicio = max(0, fin - bloque)
+        f.seek(inicio)
+        lineas = f.read(fin - inicio).split(b"\n")
+        # Si el bloque no empieza en 0 la primera línea puede estar cortada
+        for linea in reversed(lineas if inicio == 0 else lineas[1:]):
+            try:
+                return json.loads(linea)["seq"]
+            except (ValueError, KeyError):
+                continue    # Línea vacía o a medio escribir
+        if inicio == 0:
+            return 0
+        bloque *= 2
+
+
+def registrar_muchos(op: str, cambios: Iterable[Tuple[str, Optional[Project], Optional[Project]]]) -> int:
+    """
+    Agrega varios cambios de una vez (un lock y una escritura).
+    Cada cambio es (id, antes, despues). Devuelve la última secuencia asignada.
+    """
+    global _ultima
+    if op not in OPERACIONES:
+        raise ValueError(f"Operación inválida: {op}")
+    ahora = time.time()
+    with _lock_local, open(CAMBIOS_PATH, "ab") as f:
+        # El lock exclusivo serializa las secuencias entre procesos
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            tamano = os.fstat(f.fileno()).st_size
+            if tamano == _ultima[1]:
+                seq = _ultima[0]
+            else:
+                with open(CAMBIOS_PATH, "rb") as lectura:
+                    seq = _leer_ultima_secuencia(lectura)
+            lineas = []
+            for pid, antes, despues in cambios:
+                seq += 1
+                lineas.append(json.dumps({
+                    "seq": seq, "ts": ahora, "op": op, "id": pid,
+                    "antes": asdict(antes) if antes is not None else None,
+                    "despues": asdict(despues) if despues is not None else None,
+                }, ensure_ascii=False).encode("utf-8") + b"\n")
+            if lineas:
+                f.write(b"".join(lineas))
+                f.flush()
+            _ultima = (seq, os.fstat(f.fileno()).st_size)
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    if lineas:
+        log.debug("Cambios registrados: %d %s (hasta seq %d)", len(lineas), op, seq)
+    return seq
+
+
+def registrar(op: str, pid: str, antes: Optional[Project], despues: Optional[Project]) -> int:
+    """Agrega un cambio al registro y devuelve su número de secuencia."""
+    return registrar_muchos(op, [(pid, antes, despues)])
+
+
+def _recorrer(desde: int, offset: int) -> Iterator[Tuple[Dict, int]]:
+    """Eventos con seq > desde a partir del byte offset, junto con el offset que sigue a cada uno."""
+    if not os.path.exists(CAMBIOS_PATH):
+        return
+    with open(CAMBIOS_PATH, "rb") as f:
+        if offset > os.fstat(f.fileno()).st_size:
+            offset = 0  # El archivo se recreó: el offset guardado ya no sirve
+        f.seek(offset)
+        posicion = offset
+        for linea in f:
+            if not linea.endswith(b"\n"):
+                break   # Línea a medio escribir: la tomo en la próxima lectura
+            posicion += len(linea)
+            try:
+                evento = json.loads(linea)
+            except ValueError:
+                log.warning("Línea inválida en %s (byte %d), omitiendo", CAMBIOS_PATH, posicion - len(linea))
+                continue
+            if evento["seq"] > desde:
+                yield evento, posicion
+
+
+def leer(desde: int = 0, limite: Optional[int] = None) -> Iterator[Dict]:
+    """Recorre los cambios con secuencia mayor que `desde` (como mucho `limite`)."""
+    for n, (evento, _) in enumerate(_recorrer(desde, 0)):
+        if limite is not None and n >= limite:
+            return
+        yield evento
+
+
+def _cargar_checkpoints() -> Dict[str, Dict]:
+    try:
+        with open(CHECKPOINTS_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (IOError, ValueError) as e:
+        log.error("Error al leer checkpoints de cambios: %s", e)
+        return {}
+
+
+def checkpoint(consumidor: str) -> Dict:
+    """Último checkpoint confirmado del consumidor ({"seq", "offset"})."""
+    return _cargar_checkpoints().get(consumidor, {"seq": 0, "offset": 0})
+
+
+def leer_consumidor(consumidor: str, limite: Optional[int] = None) -> Tuple[List[Dict], Dict]:
+    """
+    Cambios nuevos para el consumidor desde su checkpoint y el checkpoint que
+    los cubre. El checkpoint no avanza hasta llamar a confirmar(), así que si
+    el consumidor falla a mitad vuelve a recibirlos (al menos una vez).
+    """
+    cp = checkpoint(consumidor)
+    eventos: List[Dict] = []
+    nuevo = dict(cp)
+    for evento, posicion in _recorrer(cp["seq"], cp["offset"]):
+        if limite is not None and len(eventos) >= limite:
+            break
+        eventos.append(evento)
+        nuevo = {"seq": evento["seq"], "offset": posicion}
+    return eventos, nuevo
+
+
+def confirmar(consumidor: str, cp: Dict) -> None:
+    """
+    Guarda el checkpoint del consumidor. El archivo se reemplaza de forma
+    atómica y con un lock entre procesos, así dos consumidores que confirman
+    a la vez no pisan el checkpoint del otro.
+    """
+    with _lock_local, open(CHECKPOINTS_PATH + ".lock", "a") as bloqueo:
+        if fcntl is not None:
+            fcntl.flock(bloqueo.fileno(), fcntl.LOCK_EX)
+        try:
+            checkpoints = _cargar_checkpoints()
+            checkpoints[consumidor] = {"seq": cp["seq"], "offset": cp["offset"]}
+            # Temporal con nombre único en la misma carpeta (os.replace no cruza discos)
+            fd, temporal = tempfile.mkstemp(dir=os.path.dirname(CHECKPOINTS_PATH),
+                                            prefix=".cambios_checkpoints-", suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump(checkpoints, f, ensure_ascii=False, indent=2)
+                # mkstemp crea el archivo con 0600; le dejo los permisos que tenía el original
+                try:
+                    modo = os.stat(CHECKPOINTS_PATH).st_mode & 0o777
+                except FileNotFoundError:
+                    modo = 0o644
+                os.chmod(temporal, modo)
+                os.replace(temporal, CHECKPOINTS_PATH)
+            except BaseException:
+                try:
+                    os.remove(temporal)
+                except OSError:
+                    pass
+                raise
+        finally:
+            if fcntl is not None:
+                fcntl.flock(bloqueo.fileno(), fcntl.LOCK_UN)
+    log.debug("Checkpoint de %s en seq %d", consumidor, cp["seq"])
@@ -27,3 +27,81 @@ MSG_ERROR_AREA = f"El área debe ser mayor a {AREA_MIN} hectáreas"
 MSG_ERROR_DURACION = f"La duración debe ser de al menos {DURACION_MIN} mes(es)"
 MSG_ERROR_ID_VACIO = "El ID no puede estar vacío"
 MSG_ERROR_NOMBRE_VACIO = "El nombre no puede estar vacío"
+
+# Campos que se pueden cambiar al actualizar un proyecto (el ID no)
+CAMPOS_EDITABLES = ("nombre", "tipo", "area_ha", "duracion_meses", "ubicacion", "intensidad")
+
+# Control de latencia de las llamadas a Gemini (hedging y timeout adaptativo)
+GEMINI_LATENCIAS_VENTANA = 200      # Cuántas latencias recientes recuerdo
+GEMINI_LATENCIAS_MIN_MUESTRAS = 20  # Muestras necesarias antes de adaptar nada
+GEMINI_HEDGE_PERCENTIL = 95         # Pasado este percentil lanzo una petición duplicada
+GEMINI_HEDGE_MAX_POR_MINUTO = 10    # Máximo de peticiones extra por minuto
+GEMINI_TIMEOUT_FACTOR = 3.0         # El timeout duro es el p99 multiplicado por esto
+GEMINI_TIMEOUT_MIN = 5.0            # Segundos mínimos del timeout duro
+GEMINI_TIMEOUT_MAX = 30.0           # Segundos máximos (y valor inicial) del timeout duro
+
+# Reutilización de resultados de IA para proyectos casi idénticos
+# Distancia normalizada máxima para reutilizar (0 = desactivado). Con 0.05 nunca se
+# cruza un punto de intensidad (1/9 ≈ 0.111): la intensidad tiene que ser la misma,
+# y a igual área se toleran hasta 3 meses de duración, o a igual duración hasta
+# ~40% de área (10 ** 0.15). El tipo y la ubicación tienen que coincidir exactamente.
+VECINOS_DISTANCIA_MAX = 0.05
+VECINOS_K = 3                 # Cuántos vecinos uso para interpolar
+
+# Límite de llamadas a Gemini en el cliente (token bucket) para no pasar la cuota
+GEMINI_LIMITE_POR_MINUTO = 15   # Llamadas por minuto permitidas por la cuota
+GEMINI_RAFAGA = 5               # Llamadas que se pueden hacer seguidas sin esperar
+GEMINI_ESPERA_MAX_LIMITE = 60.0 # Segundos máximos esperando turno antes de usar el fallback
+
+# Backend del modelo de IA: "gemini" usa la API real, "falso" usa el
+# modelo local determinista de src/gemini_fake.py (pruebas de carga sin red)
+GEMINI_BACKEND = "gemini"
+
+# Configuración del modelo falso (ver ModeloGeminiFalso)
+GEMINI_FALSO_CONFIG = {
+    "latencia": "lognormal",     # "fija", "uniforme" o "lognormal"
+    "latencia_media": 0.8,       # Segundos
+    "latencia_dispersion": 0.5,  # Ancho de la uniforme o sigma de la lognormal
+    "tasa_error": 0.0,           # Probabilidad de lanzar una excepción
+    "tasa_malformada": 0.0,      # Probabilidad de devolver texto sin el formato pedido
+    "semilla": 42,
+}
+
+# Simulación por lotes: cuántos proyectos se simulan en paralelo
+SIMULACION_LOTE_HILOS = 4
+
+# Almacenamiento de proyectos (src/store.py)
+STORE_SHARDS = 1              # 1 = un solo proyectos.csv; N > 1 = proyectos-00.csv ... por hash del id
+STORE_HILOS_LECTURA = 4       # Hilos con los que read_all lee los shards en paralelo
+STORE_BLOQUE_LECTURA = 1000   # Filas leídas por vez con el lock compartido (se suelta entre bloques)
+
+# Registro de cambios de proyectos (src/cambios.py, data/cambios.jsonl)
+CAMBIOS_ACTIVOS = True
+
+# Modo vigilancia (src/vigilancia.py): cada cuántos segundos se revisa si cambió el CSV
+VIGILANCIA_INTERVALO_S = 2.0
+
+# Servidor HTTP/JSON local (server.py)
+SERVIDOR_HOST = "127.0.0.1"   # Solo escucha en la máquina local
+SERVIDOR_PUERTO = 8765
+SERVIDOR_HILOS = 4            # Trabajadores del pool que ejecutan las simulaciones
+SERVIDOR_KEEPALIVE = 15       # Segundos que una conexión keep-alive puede quedar inactiva
+SERVIDOR_LOTE_MAX = 100       # Máximo de operaciones por petición /lote o /simulaciones
+
+# Métricas internas (src/metricas.py)
+METRICAS_ACTIVAS = True     # False = los decoradores no miden nada (cero overhead)
+METRICAS_SUBCUBETAS = 32    # Divisiones por potencia de 2 del histograma (~3% de error)
+
+# Trazas por simulación (src/trazas.py). También se activan con --trazas en cli.py/server.py
+TRAZAS_ACTIVAS = False
+
+# Logging (src/logger_base.py)
+LOG_NIVEL = "INFO"              # Nivel general del archivo de logs
+LOG_NIVEL_CONSOLA = "INFO"      # Nivel mínimo que se muestra en consola
+LOG_NIVELES_MODULO = {}         # Niveles por módulo, p. ej. {"simulation": "DEBUG", "store": "WARNING"}
+LOG_MAX_BYTES = 5 * 1024 * 1024 # Tamaño a partir del cual se rota capa_datos.log
+LOG_ARCHIVOS = 5                # Archivos rotados (comprimidos con gzip) que se conservan
+
+# Presupuesto de arranque (ms) al importar cada punto de entrada, medido con
+# `python -X importtime` (ver `python benchmark.py --arranque`)
+ARRANQUE_PRESUPUESTO_MS = {"cli": 150, "app": 250}
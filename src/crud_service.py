@@ -3,33 +3,46 @@ Servicio CRUD para manejar proyectos.
 Aquí están todas las operaciones: crear, leer, actualizar, eliminar y simular.
 También valida los datos antes de guardarlos.
 """
-from typing import Optional, Dict, List
+import math
+from dataclasses import asdict
+from typing import Optional, Dict, List, Callable, Iterable, Iterator, Tuple
 from src.models import Project, Impacto
+from src.tablas import ProjectTable
+from src.metricas import medido
+from src.trazas import en_contexto
 from src import store
+from src import cambios as registro_cambios
 from src import simulation
 import src.logger_base as _log
 from src.constants import (
     TIPOS_PROYECTO, INTENSIDAD_MIN, INTENSIDAD_MAX, AREA_MIN, DURACION_MIN,
     MSG_ERROR_TIPO_INVALIDO, MSG_ERROR_INTENSIDAD, MSG_ERROR_AREA,
-    MSG_ERROR_DURACION, MSG_ERROR_ID_VACIO, MSG_ERROR_NOMBRE_VACIO
+    MSG_ERROR_DURACION, MSG_ERROR_ID_VACIO, MSG_ERROR_NOMBRE_VACIO, SIMULACION_LOTE_HILOS,
+    CAMBIOS_ACTIVOS, CAMPOS_EDITABLES
 )
 
 log = _log.log
 
 def init():
-    """Inicializa el almacenamiento de datos."""
-    store.init_store()
+    """
+    Inicializa el almacenamiento de datos. No toca el disco: store crea
+    el CSV en la primera operación que lo necesita, así el arranque es rápido.
+    """
 
 def _validar_proyecto(data: Dict) -> Optional[str]:
     """
     Valida que los datos del proyecto sean correctos.
     Retorna un mensaje de error si algo está mal, o None si todo está bien.
     """
-    # Valido que el ID y el nombre no estén vacíos
-    if not data.get("id", "").strip():
-        return MSG_ERROR_ID_VACIO
-    if not data.get("nombre", "").strip():
-        return MSG_ERROR_NOMBRE_VACIO
+    # Valido que el ID y el nombre sean textos y no estén vacíos (por la API pueden llegar números)
+    for campo, msg_vacio in (("id", MSG_ERROR_ID_VACIO), ("nombre", MSG_ERROR_NOMBRE_VACIO)):
+        valor = data.get(campo, "")
+        if not isinstance(valor, str):
+            return f"El campo {campo} debe ser texto"
+        if not valor.strip():
+            return msg_vacio
+    if data.get("ubicacion") is not None and not isinstance(data["ubicacion"], str):
+        return "El campo ubicacion debe ser texto"
     
     # Validar tipo
     if data.get("tipo") not in TIPOS_PROYECTO:
@@ -38,7 +51,8 @@ def _validar_proyecto(data: Dict) -> Optional[str]:
     # Validar área
     try:
         area = float(data.get("area_ha", 0))
-        if area < AREA_MIN:
+        # NaN no es menor que nada: sin isfinite pasaría la comparación
+        if not math.isfinite(area) or area < AREA_MIN:
             return MSG_ERROR_AREA
     except (ValueError, TypeError):
         return f"El área debe ser un número válido"
@@ -61,50 +75,204 @@ def _validar_proyecto(data: Dict) -> Optional[str]:
     
     return None
 
+# Tipo de cada campo numérico: desde la CLI, el formulario o la API pueden llegar como texto
+_CONVERSIONES = {"area_ha": float, "duracion_meses": int, "intensidad": int}
+
+def _convertir(data: Dict) -> Dict:
+    """Copia de los datos (ya validados) con cada campo en su tipo y los textos sin espacios de más."""
+    convertidos = {k: _CONVERSIONES[k](v) if k in _CONVERSIONES else v for k, v in data.items()}
+    for campo in ("id", "nombre"):
+        if campo in convertidos:
+            convertidos[campo] = convertidos[campo].strip()
+    if "ubicacion" in convertidos and convertidos["ubicacion"] is None:
+        convertidos["ubicacion"] = ""
+    return convertidos
+
+@medido("crud.crear_proyecto")
 def crear_proyecto(data: Dict) -> Optional[Project]:
     # Validar datos primero
     error = _validar_proyecto(data)
     if error:
-        log.error(f'Validación fallida al crear proyecto: {error}')
+        log.error('Validación fallida al crear proyecto: %s', error)
         raise ValueError(error)
     
     try:
-        p = Project(**data)
-        store.create(p)
-        log.info(f'Proyecto {p.id} creado exitosamente')
+        p = Project(**_convertir(data))
+        # Registro el cambio con el lock tomado para que el orden del feed sea el real
+        with store.bloqueo_escritura(p.id):
+            store.create(p)
+            if CAMBIOS_ACTIVOS:
+                registro_cambios.registrar("create", p.id, None, p)
+        log.info('Proyecto %s creado exitosamente', p.id)
         return p
     except TypeError as e:
-        log.error(f'Error de tipo en datos para crear proyecto: {e}')
+        log.error('Error de tipo en datos para crear proyecto: %s', e)
         raise ValueError(f"Error en los datos del proyecto: {e}")
 
+@medido("crud.listar_proyectos")
 def listar_proyectos() -> List[Project]:
     return store.read_all()
 
+@medido("crud.iterar_proyectos")
+def iterar_proyectos() -> Iterator[Project]:
+    """Recorre los proyectos de uno en uno, con memoria constante."""
+    yield from store.iter_all()
+
+@medido("crud.tabla_proyectos")
+def tabla_proyectos() -> ProjectTable:
+    """Todos los proyectos en columnas, para los listados grandes."""
+    return store.read_tabla()
+
+@medido("crud.obtener_proyecto")
 def obtener_proyecto(pid: str) -> Optional[Project]:
     return store.read_by_id(pid)
 
+def _preparar_cambios(actual: Project, cambios: Dict) -> Dict:
+    """
+    Revisa los cambios contra el proyecto guardado y los devuelve con su tipo.
+    Lanza ValueError si hay campos que no se pueden editar o si el proyecto
+    resultante no pasaría la validación.
+    """
+    # El ID puede venir en el cuerpo (p. ej. un PUT con el proyecto entero) pero no cambiar
+    if "id" in cambios and cambios["id"] != actual.id:
+        raise ValueError("El ID de un proyecto no se puede cambiar")
+    desconocidos = sorted(str(k) for k in cambios if k != "id" and k not in CAMPOS_EDITABLES)
+    if desconocidos:
+        raise ValueError(f"Campos no editables: {', '.join(desconocidos)}. "
+                         f"Se pueden cambiar: {', '.join(CAMPOS_EDITABLES)}")
+
+    # Valido el proyecto como quedaría, no solo los campos sueltos
+    error = _validar_proyecto({**asdict(actual), **cambios})
+    if error:
+        raise ValueError(error)
+
+    return _convertir({k: v for k, v in cambios.items() if k != "id"})
+
+@medido("crud.actualizar_proyecto")
 def actualizar_proyecto(pid: str, cambios: Dict) -> bool:
-    resultado = store.update(pid, cambios)
+    """
+    Aplica los cambios al proyecto. Devuelve False si no existe y lanza
+    ValueError si los cambios no son válidos (el archivo no se toca).
+    """
+    with store.bloqueo_escritura(pid):
+        antes = store.read_by_id(pid)
+        if antes is None:
+            resultado = False
+        else:
+            try:
+                valores = _preparar_cambios(antes, cambios)
+            except ValueError as e:
+                log.error('Validación fallida al actualizar proyecto %s: %s', pid, e)
+                raise
+            resultado = store.update(pid, valores)
+            if resultado and CAMBIOS_ACTIVOS:
+                # Releo en vez de aplicar los cambios a mano: así queda lo que realmente se guardó
+                registro_cambios.registrar("update", pid, antes, store.read_by_id(pid))
     if resultado:
-        log.info(f'Proyecto {pid} actualizado exitosamente')
+        log.info('Proyecto %s actualizado exitosamente', pid)
     else:
-        log.warning(f'No se pudo actualizar el proyecto {pid}')
+        log.warning('No se pudo actualizar el proyecto %s', pid)
     return resultado
 
+@medido("crud.eliminar_proyecto")
 def eliminar_proyecto(pid: str) -> bool:
-    resultado = store.delete(pid)
+    if not CAMBIOS_ACTIVOS:
+        resultado = store.delete(pid)
+    else:
+        with store.bloqueo_escritura(pid):
+            antes = store.read_by_id(pid)
+            resultado = antes is not None and store.delete(pid)
+            if resultado:
+                registro_cambios.registrar("delete", pid, antes, None)
     if resultado:
-        log.info(f'Proyecto {pid} eliminado exitosamente')
+        store.delete_impacto(pid)
+        log.info('Proyecto %s eliminado exitosamente', pid)
     else:
-        log.warning(f'No se pudo eliminar el proyecto {pid}')
+        log.warning('No se pudo eliminar el proyecto %s', pid)
     return resultado
 
-def simular_proyecto(pid: str) -> Optional[Impacto]:
+@medido("crud.ultimo_impacto")
+def ultimo_impacto(pid: str) -> Optional[Impacto]:
+    """Último resultado de simulación guardado para el proyecto, o None."""
+    return store.read_impacto(pid)
+
+@medido("crud.simular_proyecto")
+def simular_proyecto(pid: str, al_recibir: Optional[Callable[[str, str], None]] = None,
+                     guardar: bool = True) -> Optional[Impacto]:
+    # Las llamadas concurrentes con el mismo contenido se agrupan en simulation.simular.
+    # Con guardar=False el resultado no se persiste (p. ej. simulaciones especulativas)
     p = obtener_proyecto(pid)
     if not p:
-        log.error(f'No existe el proyecto {pid} para simular')
+        log.error('No existe el proyecto %s para simular', pid)
         return None
-    impacto = simulation.simular(p)
+    impacto = simulation.simular(p, al_recibir)
     if impacto:
-        log.info(f'Simulación completada para proyecto {pid}. Riesgo total: {impacto.riesgo_total:.1f}%')
-    return impacto
\ No newline at end of file
+        if guardar:
+            store.save_impacto(impacto)
+        log.info('Simulación completada para proyecto %s. Riesgo total: %.1f%%', pid, impacto.riesgo_total)
+    return impacto
+
+def guardar_impacto(impacto: Impacto) -> None:
+    """Persiste un resultado que se simuló con guardar=False y el usuario terminó pidiendo."""
+    store.save_impacto(impacto)
+
+@medido("crud.simular_lote")
+def simular_lote(
+    pids: Optional[Iterable[str]] = None,
+    max_hilos: int = SIMULACION_LOTE_HILOS,
+    proyectos: Optional[Iterable[Project]] = None
+) -> Iterator[Tuple[Project, Optional[Impacto]]]:
+    """
+    Simula varios proyectos en paralelo (todos si pids es None) y va
+    devolviendo (proyecto, impacto) a medida que terminan, no en orden.
+    Si el que llama ya tiene los proyectos, pasarlos en `proyectos` evita
+    recorrer el CSV (pids se ignora en ese caso). Conviene una ProjectTable:
+    arma cada Project recién cuando se encarga su simulación, así solo están
+    vivos los que están en vuelo.
+    Los proyectos se leen del CSV de a poco y nunca hay más de
+    2 * max_hilos simulaciones encargadas, así la memoria no crece con
+    el tamaño del portafolio. Si una simulación falla, su impacto es None.
+    Si se deja de consumir el generador, las simulaciones pendientes se cancelan.
+    """
+    # Solo el lote usa el pool, así que no lo importo al arrancar
+    from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+    buscados = set(pids) if pids is not None and proyectos is None else None
+    encontrados = set()
+    log.info('Iniciando simulación en lote con %d hilos', max_hilos)
+
+    executor = ThreadPoolExecutor(max_workers=max_hilos, thread_name_prefix='lote')
+    futuros: Dict = {}
+
+    def terminados():
+        # Espera a que termine al menos una y devuelve todas las que ya estén listas
+        listos, _ = wait(futuros, return_when=FIRST_COMPLETED)
+        for futuro in listos:
+            p = futuros.pop(futuro)
+            try:
+                impacto = futuro.result()
+            except Exception as e:
+                log.error('Error al simular proyecto %s en lote: %s', p.id, e)
+                impacto = None
+            if impacto:
+                store.save_impacto(impacto)
+            yield p, impacto
+
+    try:
+        for p in (iterar_proyectos() if proyectos is None else proyectos):
+            if buscados is not None:
+                if p.id not in buscados:
+                    continue
+                encontrados.add(p.id)
+            while len(futuros) >= 2 * max_hilos:
+                yield from terminados()
+            futuros[executor.submit(en_contexto(simulation.simular), p)] = p
+        while futuros:
+            yield from terminados()
+    finally:
+        for futuro in futuros:
+            futuro.cancel()
+        executor.shutdown(wait=False)
+
+    if buscados is not None and buscados - encontrados:
+        log.warning('Proyectos no encontrados para simular en lote: %s', sorted(buscados - encontrados))
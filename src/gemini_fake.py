@@ -0,0 +1,178 @@
+"""
+Modelo falso de Gemini para pruebas de carga sin conexión.
+Tiene el mismo generate_content que el SDK, devuelve respuestas con el
+formato real (CALIDAD_AIRE:..., AIRE:...) calculadas a partir de los datos
+del prompt y permite inyectar latencia, errores y respuestas malformadas.
+Todo es determinista según la semilla, así los benchmarks se pueden repetir.
+"""
+import hashlib
+import math
+import random
+import re
+import threading
+import time
+from typing import Dict, Iterator, Optional
+from src.models import Project
+import src.logger_base as _log
+from src.constants import UMBRAL_RECOMENDACION
+
+log = _log.log
+
+# Expresiones para sacar los datos del proyecto de los prompts de GeminiService
+_RE_TIPO = re.compile(r"- Tipo: (\w+)")
+_RE_AREA = re.compile(r"- Área: ([\d.]+) hectáreas")
+_RE_DURACION = re.compile(r"- Duración: (\d+) meses")
+_RE_INTENSIDAD = re.compile(r"- Intensidad del impacto: (\d+)/10")
+_RE_METRICA = {
+    "aire": re.compile(r"- Calidad del Aire: ([\d.]+)"),
+    "agua": re.compile(r"- Calidad del Agua: ([\d.]+)"),
+    "biodiversidad": re.compile(r"- Biodiversidad: ([\d.]+)"),
+    "suelo": re.compile(r"- Uso del Suelo: ([\d.]+)"),
+}
+
+_RECOMENDACIONES = {
+    "aire": "Riego de vías cada 4 horas, barreras vegetales perimetrales y monitoreo trimestral de PM10/PM2.5.",
+    "agua": "Sedimentador de tres etapas, planta modular de tratamiento y análisis mensuales de DBO, DQO y SST.",
+    "biodiversidad": "Inventario de flora y fauna, rescate de especies según lista roja UICN y corredores biológicos.",
+    "suelo": "Estabilización de taludes 2:1, hidrosiembra con especies nativas y terrazas de infiltración.",
+}
+
+
+class _Fragmento:
+    """Imita un chunk/respuesta del SDK: .text y .usage_metadata."""
+
+    def __init__(self, text: str, usage_metadata=None):
+        self.text = text
+        self.usage_metadata = usage_metadata
+
+
+class _Uso:
+    """Imita usage_metadata con una estimación de tokens (≈4 caracteres por token)."""
+
+    def __init__(self, prompt: str, respuesta: str):
+        self.prompt_token_count = max(1, len(prompt) // 4)
+        self.candidates_token_count = max(1, len(respuesta) // 4)
+        self.total_token_count = self.prompt_token_count + self.candidates_token_count
+
+
+class ModeloGeminiFalso:
+    """Sustituto local de genai.GenerativeModel."""
+
+    def __init__(
+        self,
+        latencia: str = "fija",
+        latencia_media: float = 0.0,
+        latencia_dispersion: float = 0.0,
+        tasa_error: float = 0.0,
+        tasa_malformada: float = 0.0,
+        semilla: int = 42
+    ):
+        """
+        Args:
+            latencia: Distribución de la latencia ("fija", "uniforme" o "lognormal")
+            latencia_media: Latencia media en segundos
+            latencia_dispersion: Semiancho de la uniforme o sigma de la lognormal
+            tasa_error: Probabilidad de que la llamada lance una excepción
+            tasa_malformada: Probabilidad de devolver una respuesta sin formato
+            semilla: Semilla para que todo sea reproducible
+        """
+        if latencia not in ("fija", "uniforme", "lognormal"):
+            raise ValueError(f"Distribución de latencia desconocida: {latencia}")
+        self.latencia = latencia
+        self.latencia_media = latencia_media
+        self.latencia_dispersion = latencia_dispersion
+        self.tasa_error = tasa_error
+        self.tasa_malformada = tasa_malformada
+        self.semilla = semilla
+        self.llamadas = 0
+        self._vistos: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _rng(self, prompt: str) -> random.Random:
+        """
+        Generador propio para cada llamada, derivado de la semilla, del prompt
+        y de cuántas veces se vio ese prompt. Así el resultado no depende
+        del orden en que los hilos lleguen.
+        """
+        huella = hashlib.sha1(prompt.encode("utf-8")).hexdigest()
+        with self._lock:
+            self.llamadas += 1
+            n = self._vistos.get(huella, 0)
+            self._vistos[huella] = n + 1
+        return random.Random(f"{self.semilla}:{huella}:{n}")
+
+    def _sortear_latencia(self, rng: random.Random) -> float:
+        """Sortea la latencia de una llamada según la distribución configurada."""
+        if self.latencia == "fija":
+            segundos = self.latencia_media
+        elif self.latencia == "uniforme":
+            segundos = rng.uniform(self.latencia_media - self.latencia_dispersion,
+                                   self.latencia_media + self.latencia_dispersion)
+        else:
+            # Lognormal con la media pedida: mu = ln(media) - sigma²/2
+            sigma = self.latencia_dispersion
+            mu = math.log(max(self.latencia_media, 1e-6)) - sigma ** 2 / 2
+            segundos = rng.lognormvariate(mu, sigma)
+        return max(0.0, segundos)
+
+    def generate_content(self, prompt: str, stream: bool = False):
+        """Misma firma que el SDK: devuelve una respuesta o un iterador de chunks."""
+        rng = self._rng(prompt)
+        if stream:
+            return self._stream(prompt, rng)
+        time.sleep(self._sortear_latencia(rng))
+        texto = self._responder(prompt, rng)
+        return _Fragmento(texto, _Uso(prompt, texto))
+
+    def _stream(self, prompt: str, rng: random.Random) -> Iterator[_Fragmento]:
+        # La mitad de la latencia hasta el primer chunk y el resto repartido entre los demás
+        latencia = self._sortear_latencia(rng)
+        time.sleep(latencia / 2)
+        texto = self._responder(prompt, rng)
+        trozos = [texto[i:i + 40] for i in range(0, len(texto), 40)] or [""]
+        for i, trozo in enumerate(trozos):
+            if i:
+                time.sleep(latencia / 2 / (len(trozos) - 1))
+            uso = _Uso(prompt, texto) if i == len(trozos) - 1 else None
+            yield _Fragmento(trozo, uso)
+
+    def _responder(self, prompt: str, rng: random.Random) -> str:
+        if rng.random() < self.tasa_error:
+            log.debug('Modelo falso: error inyectado')
+            raise RuntimeError("Error simulado de Gemini (503 Service Unavailable)")
+        if rng.random() < self.tasa_malformada:
+            log.debug('Modelo falso: respuesta malformada inyectada')
+            return "Lo siento, no puedo ayudar con eso en este momento."
+        if "RIESGO_TOTAL" in prompt:
+            return self._responder_metricas(prompt, rng)
+        return self._responder_recomendaciones(prompt)
+
+    def _responder_metricas(self, prompt: str, rng: random.Random) -> str:
+        # Parto de las fórmulas de respaldo y agrego un poco de ruido
+        from src.simulation import _calcular_con_formulas
+        p = Project(
+            id="falso",
+            nombre="falso",
+            tipo=_buscar(_RE_TIPO, prompt, "construccion"),
+            area_ha=float(_buscar(_RE_AREA, prompt, "1")),
+            duracion_meses=int(_buscar(_RE_DURACION, prompt, "6")),
+            intensidad=int(_buscar(_RE_INTENSIDAD, prompt, "5")),
+        )
+        base = _calcular_con_formulas(p)
+        valores = {k: max(0.0, min(100.0, v + rng.uniform(-5, 5))) for k, v in base.items()}
+        valores["riesgo_total"] = max(0.0, min(100.0, 100 - sum(
+            valores[k] for k in ("calidad_aire", "calidad_agua", "biodiversidad", "uso_suelo")) / 4))
+        return "\n".join(f"{k.upper()}: {v:.1f}" for k, v in valores.items())
+
+    def _responder_recomendaciones(self, prompt: str) -> str:
+        lineas = []
+        for cat, regex in _RE_METRICA.items():
+            valor = float(_buscar(regex, prompt, "100"))
+            if valor < UMBRAL_RECOMENDACION:
+                lineas.append(f"{cat.upper()}: {_RECOMENDACIONES[cat]}")
+        return "\n".join(lineas)
+
+
+def _buscar(regex, texto: str, defecto: Optional[str]) -> str:
+    m = regex.search(texto)
+    return m.group(1) if m else defecto
@@ -1,28 +1,364 @@
 """
 Servicio de integración con Google Gemini AI para generar recomendaciones.
 """
-import google.generativeai as genai
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 import src.logger_base as _log
-from typing import Dict, Optional
+from src.metricas import medido, registro as registro_metricas
+from src.trazas import trazado, en_contexto
+from typing import Callable, Dict, Optional
+from src.constants import (
+    GEMINI_LATENCIAS_VENTANA, GEMINI_LATENCIAS_MIN_MUESTRAS, GEMINI_HEDGE_PERCENTIL,
+    GEMINI_HEDGE_MAX_POR_MINUTO, GEMINI_TIMEOUT_FACTOR, GEMINI_TIMEOUT_MIN, GEMINI_TIMEOUT_MAX,
+    GEMINI_LIMITE_POR_MINUTO, GEMINI_RAFAGA, GEMINI_ESPERA_MAX_LIMITE
+)
 
 log = _log.log
 
+# Marca que pone el hilo lector cuando el stream terminó bien
+_FIN_STREAM = object()
+
+
+class HistogramaLatencias:
+    """Ventana móvil con las latencias más recientes de generate_content."""
+
+    def __init__(self, tamano: int = GEMINI_LATENCIAS_VENTANA):
+        self._muestras = deque(maxlen=tamano)
+        self._lock = threading.Lock()
+
+    def registrar(self, segundos: float) -> None:
+        with self._lock:
+            self._muestras.append(segundos)
+
+    def percentil(self, p: float) -> Optional[float]:
+        """
+        Devuelve el percentil p (0-100) de las latencias observadas.
+        Si todavía no hay suficientes muestras devuelve None.
+        """
+        with self._lock:
+            if len(self._muestras) < GEMINI_LATENCIAS_MIN_MUESTRAS:
+                return None
+            ordenadas = sorted(self._muestras)
+        idx = min(len(ordenadas) - 1, int(round(p / 100 * (len(ordenadas) - 1))))
+        return ordenadas[idx]
+
+
+class _LimitePorMinuto:
+    """Cuenta eventos en el último minuto para limitar las peticiones duplicadas."""
+
+    def __init__(self, maximo: int):
+        self.maximo = maximo
+        self._eventos = deque()
+        self._lock = threading.Lock()
+
+    def intentar(self) -> bool:
+        ahora = time.monotonic()
+        with self._lock:
+            while self._eventos and ahora - self._eventos[0] > 60:
+                self._eventos.popleft()
+            if len(self._eventos) >= self.maximo:
+                return False
+            self._eventos.append(ahora)
+            return True
+
+
+class LimitadorTokenBucket:
+    """
+    Token bucket para repartir las llamadas según la cuota.
+    Se recargan `por_minuto` fichas por minuto hasta un máximo de `rafaga`;
+    cada llamada gasta una ficha y, si no hay, espera a que se recargue.
+    """
+
+    def __init__(self, por_minuto: float = GEMINI_LIMITE_POR_MINUTO, rafaga: int = GEMINI_RAFAGA):
+        self.tasa = por_minuto / 60.0
+        self.capacidad = max(1, rafaga)
+        self._fichas = float(self.capacidad)
+        self._ultima = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _recargar(self) -> None:
+        ahora = time.monotonic()
+        self._fichas = min(self.capacidad, self._fichas + (ahora - self._ultima) * self.tasa)
+        self._ultima = ahora
+
+    def intentar(self) -> bool:
+        """Gasta una ficha si hay alguna disponible, sin esperar."""
+        with self._lock:
+            self._recargar()
+            if self._fichas >= 1:
+                self._fichas -= 1
+                return True
+            return False
+
+    def adquirir(self, espera_max: float = GEMINI_ESPERA_MAX_LIMITE) -> bool:
+        """
+        Espera hasta tener una ficha. Devuelve False si haría falta
+        esperar más de espera_max segundos.
+        """
+        limite = time.monotonic() + espera_max
+        while True:
+            with self._lock:
+                self._recargar()
+                if self._fichas >= 1:
+                    self._fichas -= 1
+                    return True
+                falta = (1 - self._fichas) / self.tasa if self.tasa > 0 else float('inf')
+            if time.monotonic() + falta > limite:
+                return False
+            time.sleep(falta)
+
+
+class ContabilidadGemini:
+    """
+    Acumula por método y por tipo de proyecto cuántas llamadas se hicieron,
+    cuánto texto y cuántos tokens se enviaron y recibieron y cuánto tardaron.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totales: Dict[tuple, Dict[str, float]] = {}
+
+    def registrar(
+        self,
+        metodo: str,
+        tipo: str,
+        latencia: float,
+        prompt_chars: int,
+        respuesta_chars: int = 0,
+        tokens_prompt: int = 0,
+        tokens_respuesta: int = 0,
+        ok: bool = True
+    ) -> None:
+        with self._lock:
+            t = self._totales.setdefault((metodo, tipo), {
+                'llamadas': 0, 'errores': 0, 'latencia_total': 0.0, 'latencia_max': 0.0,
+                'prompt_chars': 0, 'respuesta_chars': 0, 'tokens_prompt': 0, 'tokens_respuesta': 0,
+            })
+            t['llamadas'] += 1
+            t['errores'] += 0 if ok else 1
+            t['latencia_total'] += latencia
+            t['latencia_max'] = max(t['latencia_max'], latencia)
+            t['prompt_chars'] += prompt_chars
+            t['respuesta_chars'] += respuesta_chars
+            t['tokens_prompt'] += tokens_prompt
+            t['tokens_respuesta'] += tokens_respuesta
+
+    def resumen(self) -> Dict[str, Dict[str, Dict[str, float]]]:
+        """
+        Devuelve los totales agrupados de dos formas:
+        {'por_metodo': {metodo: {...}}, 'por_tipo': {tipo: {...}}}
+        """
+        salida = {'por_metodo': {}, 'por_tipo': {}}
+        with self._lock:
+            items = [(k, dict(v)) for k, v in self._totales.items()]
+        for (metodo, tipo), t in items:
+            for grupo, clave in (('por_metodo', metodo), ('por_tipo', tipo)):
+                acc = salida[grupo].setdefault(clave, {k: 0 for k in t})
+                for k, v in t.items():
+                    acc[k] = max(acc[k], v) if k == 'latencia_max' else acc[k] + v
+        for grupo in salida.values():
+            for acc in grupo.values():
+                acc['latencia_media'] = acc['latencia_total'] / acc['llamadas'] if acc['llamadas'] else 0.0
+        return salida
+
+
+def _uso_tokens(respuesta) -> tuple:
+    """Saca (tokens_prompt, tokens_respuesta) de usage_metadata si la respuesta lo trae."""
+    uso = getattr(respuesta, 'usage_metadata', None)
+    if uso is None:
+        return 0, 0
+    return (getattr(uso, 'prompt_token_count', 0) or 0,
+            getattr(uso, 'candidates_token_count', 0) or 0)
+
+
+# Encabezados de sección que usa Gemini en las recomendaciones
+CATEGORIAS_RECOMENDACION = {
+    'AIRE': 'aire',
+    'AGUA': 'agua',
+    'BIODIVERSIDAD': 'biodiversidad',
+    'SUELO': 'suelo'
+}
+
+
+class ParserSeccionesIncremental:
+    """
+    Parsea las secciones AIRE:/AGUA:/... a medida que llega el texto.
+
+    Cada vez que llega texto de una sección llama a al_recibir(categoria, fragmento).
+    Sigue las mismas reglas que _parsear_respuesta: solo cuenta el texto
+    de las líneas que empiezan con un encabezado conocido.
+    """
+
+    def __init__(self, al_recibir: Callable[[str, str], None]):
+        self.al_recibir = al_recibir
+        self._linea = ''          # Inicio de la línea actual, mientras no sé si es encabezado
+        self._categoria = None    # Categoría de la línea actual (si tiene encabezado)
+        self._descartada = False  # La línea actual no es de ninguna sección
+        self._inicio = True       # Todavía no mandé texto de la línea actual
+
+    def alimentar(self, texto: str) -> None:
+        salida = []
+        for c in texto:
+            if c == '\n':
+                self._emitir(salida)
+                salida = []
+                self._linea, self._categoria, self._descartada, self._inicio = '', None, False, True
+                continue
+            if self._categoria:
+                # Igual que el parser normal, ignoro los espacios tras los dos puntos
+                if self._inicio and not salida and c.isspace():
+                    continue
+                salida.append(c)
+                continue
+            if self._descartada:
+                continue
+            self._linea += c
+            cabecera = self._linea.lstrip().upper()
+            for cat_upper, cat_lower in CATEGORIAS_RECOMENDACION.items():
+                if cabecera == cat_upper + ':':
+                    self._categoria = cat_lower
+                    break
+            else:
+                if cabecera and not any((k + ':').startswith(cabecera) for k in CATEGORIAS_RECOMENDACION):
+                    self._descartada = True
+        self._emitir(salida)
+
+    def _emitir(self, salida) -> None:
+        if self._categoria and salida:
+            self.al_recibir(self._categoria, ''.join(salida))
+            self._inicio = False
+
+
 class GeminiService:
     """Servicio para interactuar con la API de Gemini."""
     
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, model=None):
         """
         Inicializa el servicio de Gemini.
         
         Args:
             api_key: Clave de API de Google Gemini
+            model: Backend alternativo con el mismo generate_content que el SDK
+                   (por ejemplo ModeloGeminiFalso para pruebas de carga).
+                   Si es None se usa el modelo real de google.generativeai.
         """
         self.api_key = api_key
-        genai.configure(api_key=api_key)
-        # Usar gemini-2.0-flash que es rápido y está disponible
-        self.model = genai.GenerativeModel('gemini-2.0-flash')
+        if model is None:
+            # Importo el SDK aquí para que el backend falso funcione sin tenerlo instalado
+            import google.generativeai as genai
+            genai.configure(api_key=api_key)
+            # Usar gemini-2.0-flash que es rápido y está disponible
+            model = genai.GenerativeModel('gemini-2.0-flash')
+        self.model = model
+        # Latencias recientes por tipo de llamada (impacto, recomendaciones...) para decidir
+        # cuándo duplicar y cuándo rendirse: cada prompt tiene su propia distribución
+        self.latencias: Dict[str, HistogramaLatencias] = {}
+        self._lock_latencias = threading.Lock()
+        self._hedges = _LimitePorMinuto(GEMINI_HEDGE_MAX_POR_MINUTO)
+        self._executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='gemini')
+        # Cuota en el cliente y contabilidad de consumo
+        self.limitador = LimitadorTokenBucket()
+        self.contabilidad = ContabilidadGemini()
         log.info('Servicio de Gemini AI inicializado')
-    
+
+    def _histograma(self, clase: str) -> HistogramaLatencias:
+        """Histograma de latencias de un tipo de llamada (se crea la primera vez)."""
+        with self._lock_latencias:
+            return self.latencias.setdefault(clase, HistogramaLatencias())
+
+    def _timeout_adaptativo(self, clase: str) -> float:
+        """Timeout duro calculado a partir del p99 observado para ese tipo de llamada."""
+        p99 = self._histograma(clase).percentil(99)
+        if p99 is None:
+            return GEMINI_TIMEOUT_MAX
+        return max(GEMINI_TIMEOUT_MIN, min(GEMINI_TIMEOUT_MAX, p99 * GEMINI_TIMEOUT_FACTOR))
+
+    def _esperar_turno(self) -> None:
+        """Espera a que el limitador permita otra llamada o lanza TimeoutError."""
+        if not self.limitador.adquirir():
+            log.warning('Límite de llamadas a Gemini alcanzado, se usará el fallback')
+            raise TimeoutError('Cuota local de llamadas a Gemini agotada')
+
+    @medido("gemini.generate_content")
+    def _generar(self, prompt: str, metodo: str = '', tipo: str = ''):
+        """
+        Llama a generate_content con límite de cuota, hedging y timeout adaptativo,
+        y registra el consumo de la llamada en la contabilidad.
+        """
+        self._esperar_turno()
+        inicio = time.monotonic()
+        try:
+            respuesta = self._generar_con_hedge(prompt, metodo)
+        except Exception:
+            self.contabilidad.registrar(metodo, tipo, time.monotonic() - inicio, len(prompt), ok=False)
+            raise
+        tokens_prompt, tokens_respuesta = _uso_tokens(respuesta)
+        self.contabilidad.registrar(
+            metodo, tipo, time.monotonic() - inicio, len(prompt),
+            len(getattr(respuesta, 'text', '') or ''), tokens_prompt, tokens_respuesta
+        )
+        return respuesta
+
+    def _generar_con_hedge(self, prompt: str, clase: str = ''):
+        """
+        Llama a generate_content con hedging y timeout adaptativo.
+
+        Si la llamada tarda más que el p95 observado lanzo una petición
+        duplicada (si el cupo por minuto y la cuota lo permiten) y me quedo
+        con la primera que responda bien. Si se supera el timeout duro lanzo
+        TimeoutError para que el llamador use su fallback. Los percentiles
+        salen del histograma de `clase` (el método que hace la llamada).
+        """
+        inicio = time.monotonic()
+        latencias = self._histograma(clase)
+        timeout = self._timeout_adaptativo(clase)
+        espera_hedge = latencias.percentil(GEMINI_HEDGE_PERCENTIL)
+
+        pendientes = {self._executor.submit(en_contexto(self.model.generate_content), prompt)}
+        ultimo_error = None
+        hedge_lanzado = False
+
+        while pendientes:
+            restante = timeout - (time.monotonic() - inicio)
+            if restante <= 0:
+                break
+            limite = restante
+            if not hedge_lanzado and espera_hedge is not None:
+                limite = min(restante, max(0.0, espera_hedge - (time.monotonic() - inicio)))
+
+            listos, pendientes = wait(pendientes, timeout=limite, return_when=FIRST_COMPLETED)
+            for futuro in listos:
+                try:
+                    respuesta = futuro.result()
+                except Exception as e:
+                    ultimo_error = e
+                    continue
+                latencias.registrar(time.monotonic() - inicio)
+                return respuesta
+
+            # Pasó el p95 sin respuesta: intento una petición duplicada
+            if not listos and not hedge_lanzado and espera_hedge is not None:
+                hedge_lanzado = True
+                if self._hedges.intentar() and self.limitador.intentar():
+                    log.info('Llamada a Gemini supera p95 (%.2fs), lanzando petición duplicada', espera_hedge)
+                    registro_metricas.contar('gemini.hedges')
+                    pendientes.add(self._executor.submit(en_contexto(self.model.generate_content), prompt))
+                else:
+                    log.debug('Cupo de peticiones duplicadas agotado, no se duplica')
+
+        if ultimo_error is not None and not pendientes:
+            raise ultimo_error
+        # Registro el tiempo esperado como muestra censurada (la llamada tardó al menos eso):
+        # si solo contara las que terminan, el p99 saldría de las rápidas y el timeout
+        # se quedaría en el mínimo cortando justo la cola lenta que tiene que medir
+        latencias.registrar(time.monotonic() - inicio)
+        log.warning('Timeout adaptativo de Gemini alcanzado (%.1fs)', timeout)
+        raise TimeoutError(f'Gemini no respondió en {timeout:.1f}s')
+
+    @medido("gemini.generar_recomendaciones")
     def generar_recomendaciones(
         self,
         proyecto_tipo: str,
@@ -34,10 +370,15 @@ class GeminiService:
         calidad_agua: float,
         biodiversidad: float,
         uso_suelo: float,
-        riesgo_total: float
+        riesgo_total: float,
+        al_recibir: Optional[Callable[[str, str], None]] = None
     ) -> Dict[str, str]:
         """
         Genera recomendaciones personalizadas usando Gemini AI.
+
+        Si se pasa al_recibir, la respuesta se pide en modo streaming y cada
+        fragmento de texto se entrega como al_recibir(categoria, fragmento)
+        en cuanto llega, sin esperar la respuesta completa.
         
         Args:
             proyecto_tipo: Tipo de proyecto (construccion, mineria, agricultura)
@@ -50,11 +391,12 @@ class GeminiService:
             biodiversidad: Puntuación biodiversidad (0-100)
             uso_suelo: Puntuación uso del suelo (0-100)
             riesgo_total: Porcentaje de riesgo total
+            al_recibir: Callback opcional para recibir el texto a medida que llega
             
         Returns:
             Diccionario con recomendaciones por categoría
         """
-        log.info(f'Generando recomendaciones con IA para proyecto tipo {proyecto_tipo}')
+        log.info('Generando recomendaciones con IA para proyecto tipo %s', proyecto_tipo)
         
         prompt = self._construir_prompt_recomendaciones(
             proyecto_tipo, proyecto_nombre, area_ha, duracion_meses, intensidad,
@@ -62,17 +404,91 @@ class GeminiService:
         )
         
         try:
-            response = self.model.generate_content(prompt)
-            recomendaciones = self._parsear_respuesta(response.text)
-            log.info(f'Recomendaciones generadas exitosamente: {len(recomendaciones)} categorías')
+            if al_recibir is not None:
+                texto = self._generar_stream(prompt, al_recibir, proyecto_tipo)
+            else:
+                texto = self._generar(prompt, 'generar_recomendaciones', proyecto_tipo).text
+            recomendaciones = self._parsear_respuesta(texto)
+            log.info('Recomendaciones generadas exitosamente: %s categorías', len(recomendaciones))
             return recomendaciones
             
         except Exception as e:
-            log.error(f'Error al generar recomendaciones con Gemini: {e}')
+            log.error('Error al generar recomendaciones con Gemini: %s', e)
             return self._recomendaciones_fallback(
                 calidad_aire, calidad_agua, biodiversidad, uso_suelo
             )
     
+    def _leer_stream(self, prompt: str, cola: queue.Queue, abandonado: threading.Event) -> None:
+        """
+        Corre en un hilo del executor: recorre el stream y pasa cada chunk a la cola.
+        Al final pone _FIN_STREAM, o la excepción si el stream falló.
+        """
+        try:
+            for chunk in self.model.generate_content(prompt, stream=True):
+                if abandonado.is_set():
+                    return  # El llamador ya se rindió: dejo de consumir el stream
+                cola.put(chunk)
+        except Exception as e:
+            cola.put(e)
+            return
+        cola.put(_FIN_STREAM)
+
+    @medido("gemini.generate_content_stream")
+    def _generar_stream(self, prompt: str, al_recibir: Callable[[str, str], None], tipo: str = '') -> str:
+        """
+        Pide la respuesta en streaming y va pasando las secciones al callback.
+        Devuelve el texto completo para parsearlo igual que siempre.
+
+        El stream se lee en un hilo aparte y acá espero cada chunk como mucho
+        hasta el timeout adaptativo de los streams: si se traba lanzo
+        TimeoutError y generar_recomendaciones usa las recomendaciones por fórmulas.
+        """
+        self._esperar_turno()
+        inicio = time.monotonic()
+        limite = inicio + self._timeout_adaptativo('generar_recomendaciones_stream')
+        parser = ParserSeccionesIncremental(al_recibir)
+        partes = []
+        tokens = (0, 0)
+        cola: queue.Queue = queue.Queue()
+        abandonado = threading.Event()
+        self._executor.submit(en_contexto(self._leer_stream), prompt, cola, abandonado)
+        try:
+            while True:
+                try:
+                    chunk = cola.get(timeout=max(0.0, limite - time.monotonic()))
+                except queue.Empty:
+                    # Muestra censurada, igual que en _generar_con_hedge
+                    self._histograma('generar_recomendaciones_stream').registrar(time.monotonic() - inicio)
+                    log.warning('Stream de Gemini sin terminar en %.1fs, se abandona', limite - inicio)
+                    raise TimeoutError(f'El stream de Gemini no terminó en {limite - inicio:.1f}s')
+                if chunk is _FIN_STREAM:
+                    break
+                if isinstance(chunk, Exception):
+                    raise chunk
+                # El último chunk suele traer el usage_metadata de toda la respuesta
+                tokens = _uso_tokens(chunk) if getattr(chunk, 'usage_metadata', None) else tokens
+                try:
+                    texto = chunk.text
+                except ValueError:
+                    # Algunos chunks (p. ej. solo metadatos) no traen texto
+                    continue
+                if not partes:
+                    log.debug('Primer fragmento de Gemini en %.2fs', time.monotonic() - inicio)
+                partes.append(texto)
+                parser.alimentar(texto)
+        except Exception:
+            abandonado.set()
+            self.contabilidad.registrar('generar_recomendaciones', tipo, time.monotonic() - inicio,
+                                        len(prompt), sum(map(len, partes)), ok=False)
+            raise
+        latencia = time.monotonic() - inicio
+        # Un stream completo tarda más que una llamada normal: va en su propio histograma
+        self._histograma('generar_recomendaciones_stream').registrar(latencia)
+        texto = ''.join(partes)
+        self.contabilidad.registrar('generar_recomendaciones', tipo, latencia, len(prompt), len(texto), *tokens)
+        return texto
+
+    @medido("gemini.calcular_impacto_ambiental")
     def calcular_impacto_ambiental(
         self,
         proyecto_tipo: str,
@@ -103,7 +519,7 @@ class GeminiService:
                 'riesgo_total': float (0-100)
             }
         """
-        log.info(f'Calculando impacto ambiental con IA para proyecto: {proyecto_nombre}')
+        log.info('Calculando impacto ambiental con IA para proyecto: %s', proyecto_nombre)
         
         prompt = self._construir_prompt_impacto(
             proyecto_tipo, proyecto_nombre, area_ha, duracion_meses, 
@@ -111,16 +527,17 @@ class GeminiService:
         )
         
         try:
-            response = self.model.generate_content(prompt)
+            response = self._generar(prompt, 'calcular_impacto_ambiental', proyecto_tipo)
             metricas = self._parsear_metricas(response.text)
-            log.info(f'Métricas calculadas por IA - Riesgo: {metricas.get("riesgo_total", 0):.1f}%')
+            log.info('Métricas calculadas por IA - Riesgo: %.1f%%', metricas.get("riesgo_total", 0))
             return metricas
             
         except Exception as e:
-            log.error(f'Error al calcular impacto con Gemini: {e}')
+            log.error('Error al calcular impacto con Gemini: %s', e)
             # Retornar None para indicar que se debe usar el cálculo por fórmulas
             return None
     
+    @trazado("gemini.prompt_impacto")
     def _construir_prompt_impacto(
         self,
         tipo: str,
@@ -168,6 +585,7 @@ EJEMPLOS DE REFERENCIA:
 
 Responde SOLO con los números en el formato indicado. NO agregues explicaciones."""
 
+    @trazado("gemini.parsear_metricas")
     def _parsear_metricas(self, texto: str) -> Dict[str, float]:
         """
         Parsea las métricas de impacto de la respuesta de Gemini.
@@ -205,21 +623,22 @@ Responde SOLO con los números en el formato indicado. NO agregues explicaciones
                         # Asegurar que esté en rango 0-100
                         valor = max(0.0, min(100.0, valor))
                         metricas[clave_lower] = valor
-                        log.debug(f'Métrica parseada: {clave_lower} = {valor}')
+                        log.debug('Métrica parseada: %s = %s', clave_lower, valor)
                     except (ValueError, IndexError) as e:
-                        log.warning(f'Error al parsear {clave_upper}: {e}')
+                        log.warning('Error al parsear %s: %s', clave_upper, e)
                     break
         
         # Validar que tengamos todas las métricas
         requeridas = ['calidad_aire', 'calidad_agua', 'biodiversidad', 'uso_suelo', 'riesgo_total']
         if not all(k in metricas for k in requeridas):
             faltantes = [k for k in requeridas if k not in metricas]
-            log.error(f'Métricas faltantes en respuesta de Gemini: {faltantes}')
+            log.error('Métricas faltantes en respuesta de Gemini: %s', faltantes)
             return None
         
-        log.debug(f'Métricas parseadas exitosamente: {metricas}')
+        log.debug('Métricas parseadas exitosamente: %s', metricas)
         return metricas
     
+    @trazado("gemini.prompt_recomendaciones")
     def _construir_prompt_recomendaciones(
         self,
         tipo: str,
@@ -270,6 +689,7 @@ SUELO: [recomendación detallada de 4-6 líneas si suelo < 70]
 Si una métrica está por encima de 70, NO incluyas esa categoría.
 Las recomendaciones deben ser exhaustivas y profesionales, aplicables específicamente a proyectos de tipo {tipo} en contexto latinoamericano."""
 
+    @trazado("gemini.parsear_recomendaciones")
     def _parsear_respuesta(self, texto: str) -> Dict[str, str]:
         """
         Parsea la respuesta de Gemini en un diccionario.
@@ -283,19 +703,12 @@ Las recomendaciones deben ser exhaustivas y profesionales, aplicables específic
         recomendaciones = {}
         lineas = texto.strip().split('\n')
         
-        categorias_map = {
-            'AIRE': 'aire',
-            'AGUA': 'agua',
-            'BIODIVERSIDAD': 'biodiversidad',
-            'SUELO': 'suelo'
-        }
-        
         for linea in lineas:
             linea = linea.strip()
             if not linea:
                 continue
                 
-            for cat_upper, cat_lower in categorias_map.items():
+            for cat_upper, cat_lower in CATEGORIAS_RECOMENDACION.items():
                 if linea.upper().startswith(cat_upper + ':'):
                     # Extraer el texto después de "CATEGORIA:"
                     recomendacion = linea[len(cat_upper)+1:].strip()
@@ -303,9 +716,10 @@ Las recomendaciones deben ser exhaustivas y profesionales, aplicables específic
                         recomendaciones[cat_lower] = recomendacion
                     break
         
-        log.debug(f'Recomendaciones parseadas: {list(recomendaciones.keys())}')
+        log.debug('Recomendaciones parseadas: %s', list(recomendaciones.keys()))
         return recomendaciones
     
+    @trazado("gemini.fallback")
     def _recomendaciones_fallback(
         self,
         aire: float,
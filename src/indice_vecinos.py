@@ -0,0 +1,184 @@
+"""
+Índice de proyectos ya evaluados por la IA para reutilizar sus métricas.
+Si un proyecto nuevo es casi igual a otros que Gemini ya calculó
+(mismo tipo, ubicación e intensidad, y área y duración muy parecidas),
+interpolo sus métricas en lugar de volver a llamar a la API.
+
+El tipo y la ubicación no son distancias: el índice está partido por
+(tipo, ubicación) y solo se buscan vecinos dentro de la misma partición,
+porque la IA evalúa muy distinto una mina en la selva que una en el desierto.
+El nombre no entra: no cambia el impacto.
+"""
+import heapq
+import json
+import math
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+from src.models import Project
+import src.logger_base as _log
+from src.constants import VECINOS_DISTANCIA_MAX, VECINOS_K
+
+log = _log.log
+
+# Archivo donde guardo los resultados de IA para no perderlos al cerrar
+INDICE_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "indice_ia.jsonl")
+
+METRICAS = ['calidad_aire', 'calidad_agua', 'biodiversidad', 'uso_suelo', 'riesgo_total']
+
+Punto = Tuple[float, float, float]
+Particion = Tuple[str, str]
+
+
+def particion(p: Project) -> Particion:
+    """Clave exacta del proyecto en el índice: tipo y ubicación (sin mayúsculas ni espacios de más)."""
+    return p.tipo, " ".join(p.ubicacion.split()).casefold()
+
+
+def normalizar(p: Project) -> Punto:
+    """
+    Convierte área, duración e intensidad a un espacio donde las tres
+    pesan parecido. El área va en escala logarítmica como en las fórmulas.
+    Un punto de intensidad mide 1/9 ≈ 0.111, un mes 1/60 ≈ 0.017 y doblar
+    el área log10(2)/3 ≈ 0.100 (ver VECINOS_DISTANCIA_MAX).
+    """
+    return (
+        math.log10(max(p.area_ha, 0.01)) / 3,   # 0.01 ha .. 1000 ha -> -0.67 .. 1
+        p.duracion_meses / 60,                   # 5 años -> 1
+        (p.intensidad - 1) / 9,                  # 1..10 -> 0..1
+    )
+
+
+class _KDTree:
+    """KD-tree mínimo de 3 dimensiones construido de una vez."""
+
+    def __init__(self, puntos: List[Tuple[Punto, int]]):
+        self.raiz = self._construir(puntos, 0)
+
+    def _construir(self, puntos, eje):
+        if not puntos:
+            return None
+        puntos = sorted(puntos, key=lambda x: x[0][eje])
+        medio = len(puntos) // 2
+        sig = (eje + 1) % 3
+        return (puntos[medio], eje,
+                self._construir(puntos[:medio], sig),
+                self._construir(puntos[medio + 1:], sig))
+
+    def cercanos(self, objetivo: Punto, k: int, radio: float) -> List[Tuple[float, int]]:
+        """Devuelve hasta k pares (distancia, índice) dentro del radio, ordenados."""
+        mejores: List[Tuple[float, int]] = []  # heap de (-distancia, índice)
+
+        def visitar(nodo):
+            if nodo is None:
+                return
+            (punto, idx), eje, izq, der = nodo
+            # math.dist recién existe desde Python 3.8
+            d = math.sqrt(sum((a - b) ** 2 for a, b in zip(punto, objetivo)))
+            if d <= radio:
+                if len(mejores) < k:
+                    heapq.heappush(mejores, (-d, idx))
+                elif d < -mejores[0][0]:
+                    heapq.heapreplace(mejores, (-d, idx))
+            diff = objetivo[eje] - punto[eje]
+            cerca, lejos = (izq, der) if diff < 0 else (der, izq)
+            visitar(cerca)
+            # Solo bajo por el otro lado si puede haber algo más cerca
+            limite = radio if len(mejores) < k else min(radio, -mejores[0][0])
+            if abs(diff) <= limite:
+                visitar(lejos)
+
+        visitar(self.raiz)
+        return sorted((-d, idx) for d, idx in mejores)
+
+
+class IndiceVecinos:
+    """Índice por (tipo, ubicación) con las métricas que devolvió la IA."""
+
+    def __init__(self, path: Optional[str] = INDICE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._puntos: Dict[Particion, List[Punto]] = {}
+        self._metricas: Dict[Particion, List[Dict[str, float]]] = {}
+        self._arboles: Dict[Particion, _KDTree] = {}
+        self._cargado = False
+
+    def _cargar(self) -> None:
+        """Carga los resultados guardados la primera vez que se usa el índice."""
+        self._cargado = True
+        if not self.path or not os.path.exists(self.path):
+            return
+        sin_ubicacion = 0
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for linea in f:
+                    try:
+                        reg = json.loads(linea)
+                        if "ubicacion" not in reg:
+                            # Registro de antes de partir por ubicación: no sé dónde era
+                            sin_ubicacion += 1
+                            continue
+                        self._agregar_en_memoria((reg["tipo"], reg["ubicacion"]), tuple(reg["punto"]), reg["metricas"])
+                    except (ValueError, KeyError) as e:
+                        log.warning("Línea inválida en índice de IA, omitiendo: %s", e)
+        except IOError as e:
+            log.error("Error al leer índice de IA: %s", e)
+        if sin_ubicacion:
+            log.info("Índice de IA: %d registros sin ubicación omitidos", sin_ubicacion)
+        log.debug("Índice de IA cargado: %d particiones", len(self._puntos))
+
+    def _agregar_en_memoria(self, clave: Particion, punto: Punto, metricas: Dict[str, float]) -> None:
+        self._puntos.setdefault(clave, []).append(punto)
+        self._metricas.setdefault(clave, []).append({k: float(metricas[k]) for k in METRICAS})
+        # El árbol de esa partición se reconstruye en la próxima consulta
+        self._arboles.pop(clave, None)
+
+    def agregar(self, p: Project, metricas: Dict[str, float]) -> None:
+        """Registra las métricas que calculó la IA para un proyecto."""
+        punto = normalizar(p)
+        clave = particion(p)
+        with self._lock:
+            if not self._cargado:
+                self._cargar()
+            self._agregar_en_memoria(clave, punto, metricas)
+            if self.path:
+                try:
+                    with open(self.path, "a", encoding="utf-8") as f:
+                        f.write(json.dumps({"tipo": clave[0], "ubicacion": clave[1], "punto": punto,
+                                            "metricas": {k: metricas[k] for k in METRICAS}}) + "\n")
+                except IOError as e:
+                    log.error("Error al guardar en índice de IA: %s", e)
+
+    def interpolar(self, p: Project, distancia_max: float = VECINOS_DISTANCIA_MAX,
+                   k: int = VECINOS_K) -> Optional[Dict[str, float]]:
+        """
+        Devuelve métricas interpoladas (ponderadas por inverso de la distancia)
+        de los vecinos del mismo tipo y ubicación, o None si no hay ninguno
+        suficientemente cerca.
+        """
+        if distancia_max <= 0:
+            return None
+        objetivo = normalizar(p)
+        clave = particion(p)
+        with self._lock:
+            if not self._cargado:
+                self._cargar()
+            if clave not in self._puntos:
+                return None
+            arbol = self._arboles.get(clave)
+            if arbol is None:
+                puntos = self._puntos[clave]
+                arbol = self._arboles[clave] = _KDTree([(pt, i) for i, pt in enumerate(puntos)])
+            vecinos = arbol.cercanos(objetivo, k, distancia_max)
+            metricas = self._metricas[clave]
+            candidatos = [(d, metricas[i]) for d, i in vecinos]
+
+        if not candidatos:
+            return None
+        # Si hay uno exacto lo devuelvo tal cual
+        if candidatos[0][0] == 0:
+            return dict(candidatos[0][1])
+        pesos = [1 / d for d, _ in candidatos]
+        total = sum(pesos)
+        log.debug('Interpolando métricas de %s vecino(s), distancia mínima %.4f', len(candidatos), candidatos[0][0])
+        return {clave: sum(w * m[clave] for w, (_, m) in zip(pesos, candidatos)) / total for clave in METRICAS}
@@ -1,23 +1,140 @@
 """
 Configuración del sistema de logging.
 Guarda todos los logs en un archivo y también los muestra en consola.
+
+Los módulos solo dejan el registro en una cola (QueueHandler); un hilo
+aparte (QueueListener) es el que escribe en el archivo y en la consola,
+así el que llama no espera al disco. El archivo rota por tamaño y los
+archivos viejos se comprimen con gzip.
+
+Importar este módulo no abre nada: los handlers reales se crean con el
+primer mensaje que se registra (o al llamar a configurar()).
 """
 import logging as log
 import os
+import threading
+from src.constants import (
+    LOG_NIVEL, LOG_NIVEL_CONSOLA, LOG_NIVELES_MODULO, LOG_MAX_BYTES, LOG_ARCHIVOS
+)
 
 # Calculo la ruta donde se guardará el archivo de logs
 log_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'capa_datos.log')
 
-# Configuro el logger para que guarde en archivo y muestre en consola
-log.basicConfig(
-    level=log.DEBUG,  # Nivel mínimo de logs a guardar
-    format='%(asctime)s: %(levelname)s [%(filename)s:%(lineno)s] %(message)s',
-    datefmt='%I:%M:%S %p',  # Formato de hora: 12:30:45 PM
-    handlers=[
-        log.FileHandler(log_path, encoding='utf-8'),  # Guarda en archivo
-        log.StreamHandler()  # Muestra en consola
-    ]
-)
+FORMATO = '%(asctime)s: %(levelname)s [%(filename)s:%(lineno)s] %(message)s'
+
+
+class FiltroPorModulo(log.Filter):
+    """
+    Aplica el nivel de LOG_NIVELES_MODULO (p. ej. {"store": "WARNING"}) a los
+    registros de ese módulo; el resto usa LOG_NIVEL.
+    """
+
+    def __init__(self, niveles: dict, defecto: int):
+        super().__init__()
+        self.niveles = {m: log.getLevelName(n.upper()) for m, n in niveles.items()}
+        self.defecto = defecto
+
+    def filter(self, record: log.LogRecord) -> bool:
+        return record.levelno >= self.niveles.get(record.module, self.defecto)
+
+
+class _HandlerPerezoso(log.Handler):
+    """Handler provisorio: con el primer registro instala los handlers reales y se lo pasa."""
+
+    def handle(self, record: log.LogRecord) -> bool:
+        configurar()
+        return _en_cola.handle(record)
+
+    def emit(self, record: log.LogRecord) -> None:
+        pass
+
+
+def _nombre_comprimido(nombre: str) -> str:
+    return nombre + ".gz"
+
+
+def _comprimir(origen: str, destino: str) -> None:
+    """Rotador: pasa el archivo que se cierra a gzip y borra el original."""
+    import gzip
+    import shutil
+    with open(origen, 'rb') as f_in, gzip.open(destino, 'wb') as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    os.remove(origen)
+
+
+def _nivel_raiz() -> int:
+    # La raíz deja pasar lo que pida el handler o el módulo más detallado; los filtros hacen el resto
+    extra = [h.level or log.DEBUG for h in log.getLogger().handlers
+             if not isinstance(h, _HandlerPerezoso) and h is not _en_cola]
+    return min([log.getLevelName(LOG_NIVEL.upper())] + extra +
+               [log.getLevelName(n.upper()) for n in LOG_NIVELES_MODULO.values()])
+
+
+def agregar_handler(handler: log.Handler) -> None:
+    """
+    Agrega un handler a la raíz (p. ej. la pestaña Logs de la GUI) y baja el
+    nivel de la raíz hasta el del handler: si no, los registros más detallados
+    que LOG_NIVEL se descartarían antes de llegarle.
+    """
+    raiz = log.getLogger()
+    raiz.addHandler(handler)
+    raiz.setLevel(_nivel_raiz())
+
+
+def quitar_handler(handler: log.Handler) -> None:
+    """Saca un handler agregado con agregar_handler y vuelve a subir el nivel de la raíz."""
+    raiz = log.getLogger()
+    raiz.removeHandler(handler)
+    raiz.setLevel(_nivel_raiz())
+
+
+_escucha = None
+_en_cola = None
+_lock = threading.Lock()
+
+
+def configurar():
+    """Crea el archivo de logs, la cola y el hilo escritor (solo la primera vez)."""
+    global _escucha
+    with _lock:
+        if _escucha is None:
+            _escucha = _crear_handlers()
+    return _escucha
+
+
+def _crear_handlers():
+    global _en_cola
+    import atexit
+    import queue
+    from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+    archivo = RotatingFileHandler(log_path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_ARCHIVOS, encoding='utf-8')
+    archivo.namer = _nombre_comprimido
+    archivo.rotator = _comprimir
+    consola = log.StreamHandler()
+    consola.setLevel(log.getLevelName(LOG_NIVEL_CONSOLA.upper()))
+    formato = log.Formatter(FORMATO, datefmt='%I:%M:%S %p')  # Formato de hora: 12:30:45 PM
+    archivo.setFormatter(formato)
+    consola.setFormatter(formato)
+
+    cola = queue.SimpleQueue()
+    _en_cola = QueueHandler(cola)
+    _en_cola.addFilter(FiltroPorModulo(LOG_NIVELES_MODULO, log.getLevelName(LOG_NIVEL.upper())))
+    raiz = log.getLogger()
+    # Reemplazo al handler provisorio y dejo los que hayan agregado otros (p. ej. la GUI).
+    # Asigno una lista nueva porque puede haber un callHandlers recorriendo la anterior.
+    raiz.handlers = [_en_cola] + [h for h in raiz.handlers if not isinstance(h, _HandlerPerezoso)]
+
+    escucha = QueueListener(cola, archivo, consola, respect_handler_level=True)
+    escucha.start()
+    # Al salir vacío la cola para no perder los últimos mensajes
+    atexit.register(escucha.stop)
+    return escucha
+
+
+# El nivel se fija ya (es gratis); los handlers se crean con el primer mensaje
+log.getLogger().setLevel(_nivel_raiz())
+log.getLogger().addHandler(_HandlerPerezoso())
 
 # Esto es solo para testear si ejecuto este archivo directamente
 if __name__ == '__main__':
@@ -25,4 +142,4 @@ if __name__ == '__main__':
     log.info('Mensaje a nivel de INFO')
     log.warning('Mensaje a nivel de WARNING')
     log.error('Mensaje a nivel de ERROR')
-    log.critical('Mensaje a nivel de CRITICAL')
\ No newline at end of file
+    log.critical('Mensaje a nivel de CRITICAL')
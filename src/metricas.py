@@ -0,0 +1,218 @@
+"""
+Registro de métricas del proceso.
+Lleva contadores y histogramas de latencia de las operaciones calientes
+(crud_service, store, fórmulas y llamadas a Gemini) para ver dónde se va
+el tiempo. Se exporta como texto estilo Prometheus o como JSON.
+"""
+import functools
+import inspect
+import math
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+from src.constants import METRICAS_ACTIVAS, METRICAS_SUBCUBETAS
+from src import trazas
+
+# Percentiles que se publican
+CUANTILES = (50, 90, 99, 99.9)
+
+
+class HistogramaHDR:
+    """
+    Histograma de latencias al estilo HDR: cubetas logarítmicas (potencias de 2)
+    divididas en METRICAS_SUBCUBETAS partes iguales, así el error relativo
+    queda acotado (~3% con 32) sin guardar las muestras.
+    Los valores se registran en segundos y se cuentan en microsegundos.
+    """
+
+    def __init__(self, subcubetas: int = METRICAS_SUBCUBETAS):
+        self.subcubetas = subcubetas
+        self._cubetas: Dict[int, int] = {}
+        self.cantidad = 0
+        self.suma = 0.0
+        self.minimo = math.inf
+        self.maximo = 0.0
+        self._lock = threading.Lock()
+
+    def _indice(self, us: float) -> int:
+        if us < 1:
+            return 0
+        e = int(math.log2(us))
+        sub = int((us / (1 << e) - 1) * self.subcubetas)
+        return 1 + e * self.subcubetas + min(sub, self.subcubetas - 1)
+
+    def _valor(self, indice: int) -> float:
+        """Punto medio de la cubeta, en microsegundos."""
+        if indice == 0:
+            return 0.5
+        e, sub = divmod(indice - 1, self.subcubetas)
+        return (1 << e) * (1 + (sub + 0.5) / self.subcubetas)
+
+    def registrar(self, segundos: float) -> None:
+        indice = self._indice(segundos * 1e6)
+        with self._lock:
+            self._cubetas[indice] = self._cubetas.get(indice, 0) + 1
+            self.cantidad += 1
+            self.suma += segundos
+            self.minimo = min(self.minimo, segundos)
+            self.maximo = max(self.maximo, segundos)
+
+    def percentil(self, p: float) -> Optional[float]:
+        """Percentil p (0-100) en segundos, o None si no hay muestras."""
+        with self._lock:
+            if not self.cantidad:
+                return None
+            objetivo = max(1, math.ceil(p / 100 * self.cantidad))
+            acumulado = 0
+            for indice in sorted(self._cubetas):
+                acumulado += self._cubetas[indice]
+                if acumulado >= objetivo:
+                    return min(self.maximo, max(self.minimo, self._valor(indice) / 1e6))
+        return self.maximo
+
+    def resumen(self) -> Dict[str, float]:
+        datos = {"cantidad": self.cantidad, "suma_s": round(self.suma, 6)}
+        if self.cantidad:
+            datos["min_ms"] = round(self.minimo * 1000, 3)
+            datos["max_ms"] = round(self.maximo * 1000, 3)
+            datos["media_ms"] = round(self.suma / self.cantidad * 1000, 3)
+            for q in CUANTILES:
+                datos[f"p{q:g}_ms"] = round(self.percentil(q) * 1000, 3)
+        return datos
+
+
+class RegistroMetricas:
+    """Contadores y un histograma por operación, seguros entre hilos."""
+
+    def __init__(self):
+        self._contadores: Dict[str, int] = {}
+        self._histogramas: Dict[str, HistogramaHDR] = {}
+        self._errores: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def contar(self, nombre: str, n: int = 1) -> None:
+        with self._lock:
+            self._contadores[nombre] = self._contadores.get(nombre, 0) + n
+
+    def observar(self, operacion: str, segundos: float, error: bool = False) -> None:
+        """Registra la duración de una llamada (y si terminó con excepción)."""
+        with self._lock:
+            hist = self._histogramas.get(operacion)
+            if hist is None:
+                hist = self._histogramas[operacion] = HistogramaHDR()
+            if error:
+                self._errores[operacion] = self._errores.get(operacion, 0) + 1
+        hist.registrar(segundos)
+
+    def reiniciar(self) -> None:
+        with self._lock:
+            self._contadores.clear()
+            self._histogramas.clear()
+            self._errores.clear()
+
+    def a_dict(self) -> Dict:
+        """Snapshot en JSON: contadores y, por operación, latencias en ms y errores."""
+        with self._lock:
+            contadores = dict(self._contadores)
+            histogramas = dict(self._histogramas)
+            errores = dict(self._errores)
+        operaciones = {}
+        for op in sorted(histogramas):
+            operaciones[op] = histogramas[op].resumen()
+            operaciones[op]["errores"] = errores.get(op, 0)
+        return {"contadores": dict(sorted(contadores.items())), "operaciones": operaciones}
+
+    def a_prometheus(self) -> str:
+        """Snapshot en el formato de texto de Prometheus (tipo summary para las latencias)."""
+        snap = self.a_dict()
+        lineas: List[str] = []
+        if snap["contadores"]:
+            lineas.append("# TYPE simulador_eventos_total counter")
+            for nombre, valor in snap["contadores"].items():
+                lineas.append(f'simulador_eventos_total{{evento="{nombre}"}} {valor}')
+        if snap["operaciones"]:
+            lineas.append("# TYPE simulador_operacion_segundos summary")
+            for op, datos in snap["operaciones"].items():
+                for q in CUANTILES:
+                    if f"p{q:g}_ms" in datos:
+                        lineas.append(f'simulador_operacion_segundos{{op="{op}",quantile="{q / 100:g}"}} '
+                                      f'{datos[f"p{q:g}_ms"] / 1000:.6f}')
+                lineas.append(f'simulador_operacion_segundos_sum{{op="{op}"}} {datos["suma_s"]:.6f}')
+                lineas.append(f'simulador_operacion_segundos_count{{op="{op}"}} {datos["cantidad"]}')
+            lineas.append("# TYPE simulador_operacion_errores_total counter")
+            for op, datos in snap["operaciones"].items():
+                lineas.append(f'simulador_operacion_errores_total{{op="{op}"}} {datos["errores"]}')
+        return "\n".join(lineas) + "\n"
+
+    def a_texto(self) -> str:
+        """Tabla legible para la CLI y la GUI."""
+        snap = self.a_dict()
+        lineas = [f"{'operación':<40} {'n':>7} {'p50 ms':>9} {'p99 ms':>9} {'máx ms':>9} {'err':>5}"]
+        for op, d in snap["operaciones"].items():
+            lineas.append(f"{op:<40} {d['cantidad']:>7} {d.get('p50_ms', 0):>9.3f} "
+                          f"{d.get('p99_ms', 0):>9.3f} {d.get('max_ms', 0):>9.3f} {d['errores']:>5}")
+        if snap["contadores"]:
+            lineas.append("")
+            lineas.extend(f"{nombre:<40} {valor:>7}" for nombre, valor in snap["contadores"].items())
+        return "\n".join(lineas)
+
+
+# Registro global del proceso
+registro = RegistroMetricas()
+
+# Operaciones en curso por hilo, para no contar dos veces las llamadas recursivas
+_activas = threading.local()
+
+
+def medido(operacion: str) -> Callable:
+    """
+    Decorador que mide cada llamada a la función en el registro global
+    y, si las trazas están activas, la registra como span.
+    En los generadores mide desde la primera vuelta hasta que se agotan
+    o se cierran, que es cuando realmente se hace el trabajo.
+    """
+    def decorador(fn):
+        if not METRICAS_ACTIVAS:
+            return fn if inspect.isgeneratorfunction(fn) else trazas.trazado(operacion)(fn)
+
+        if inspect.isgeneratorfunction(fn):
+            @functools.wraps(fn)
+            def envoltura_gen(*args, **kwargs):
+                inicio = time.perf_counter()
+                inicio_us = time.time_ns() / 1000
+                error = False
+                try:
+                    yield from fn(*args, **kwargs)
+                except BaseException as e:
+                    error = not isinstance(e, GeneratorExit)
+                    raise
+                finally:
+                    duracion = time.perf_counter() - inicio
+                    registro.observar(operacion, duracion, error)
+                    # El span no puede quedar activo entre vueltas, así que lo registro al final
+                    trazas.registrar(operacion, inicio_us, duracion * 1e6)
+            return envoltura_gen
+
+        @functools.wraps(fn)
+        def envoltura(*args, **kwargs):
+            en_curso = getattr(_activas, "ops", None)
+            if en_curso is None:
+                en_curso = _activas.ops = set()
+            if operacion in en_curso:
+                return fn(*args, **kwargs)
+            en_curso.add(operacion)
+            inicio = time.perf_counter()
+            error = False
+            try:
+                if trazas.activas():
+                    with trazas.span(operacion):
+                        return fn(*args, **kwargs)
+                return fn(*args, **kwargs)
+            except BaseException:
+                error = True
+                raise
+            finally:
+                en_curso.discard(operacion)
+                registro.observar(operacion, time.perf_counter() - inicio, error)
+        return envoltura
+    return decorador
@@ -2,7 +2,7 @@
 Modelos de datos para el Simulador de Impacto Ambiental.
 Aquí definimos las clases principales que usamos en todo el proyecto.
 """
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, fields
 from typing import Dict
 
 @dataclass
@@ -41,3 +41,65 @@ class Impacto:
     
     # Diccionario con las recomendaciones por categoría
     recomendaciones: Dict[str, str] = field(default_factory=dict)
+
+    # De dónde salieron las métricas: "ia", "vecinos" (interpoladas de
+    # proyectos parecidos ya evaluados por la IA) o "formulas"
+    origen: str = "formulas"
+
+
+# Variantes con __slots__: mismos campos, sin un dict por instancia.
+# Sirven cuando hay que tener muchos objetos vivos a la vez.
+
+def _con_slots(cls):
+    """
+    Rehace una dataclass con __slots__ (lo mismo que dataclass(slots=True),
+    que recién existe desde Python 3.10). Los valores por defecto ya quedaron
+    en el __init__ generado, así que los saco de la clase.
+    """
+    nombres = tuple(f.name for f in fields(cls))
+    atributos = {k: v for k, v in cls.__dict__.items() if k not in nombres + ("__dict__", "__weakref__")}
+    atributos["__slots__"] = nombres
+    return type(cls)(cls.__name__, cls.__bases__, atributos)
+
+@_con_slots
+@dataclass
+class ProjectCompacto:
+    """Project con __slots__ (ocupa bastante menos memoria por instancia)."""
+    id: str
+    nombre: str
+    tipo: str
+    area_ha: float
+    duracion_meses: int
+    ubicacion: str = ""
+    intensidad: int = 5
+
+    @classmethod
+    def desde(cls, p: Project) -> "ProjectCompacto":
+        return cls(p.id, p.nombre, p.tipo, p.area_ha, p.duracion_meses, p.ubicacion, p.intensidad)
+
+    def a_project(self) -> Project:
+        return Project(self.id, self.nombre, self.tipo, self.area_ha, self.duracion_meses,
+                       self.ubicacion, self.intensidad)
+
+
+@_con_slots
+@dataclass
+class ImpactoCompacto:
+    """Impacto con __slots__."""
+    proyecto_id: str
+    calidad_aire: float
+    calidad_agua: float
+    biodiversidad: float
+    uso_suelo: float
+    riesgo_total: float
+    recomendaciones: Dict[str, str] = field(default_factory=dict)
+    origen: str = "formulas"
+
+    @classmethod
+    def desde(cls, imp: Impacto) -> "ImpactoCompacto":
+        return cls(imp.proyecto_id, imp.calidad_aire, imp.calidad_agua, imp.biodiversidad,
+                   imp.uso_suelo, imp.riesgo_total, imp.recomendaciones, imp.origen)
+
+    def a_impacto(self) -> Impacto:
+        return Impacto(self.proyecto_id, self.calidad_aire, self.calidad_agua, self.biodiversidad,
+                       self.uso_suelo, self.riesgo_total, self.recomendaciones, self.origen)
@@ -2,16 +2,32 @@
 Aquí está la lógica principal de la simulación.
 Calcula el impacto ambiental usando IA de Gemini o fórmulas matemáticas.
 """
-from typing import Dict
+from dataclasses import astuple
+from typing import Callable, Dict, Optional
 from src.models import Project, Impacto
+from src.metricas import medido, registro as registro_metricas
+from src import trazas
+from src.single_flight import SingleFlight
+from src.indice_vecinos import IndiceVecinos
 import math
+import threading
 import src.logger_base as _log
-from src.constants import TIPOS_PROYECTO, UMBRAL_RECOMENDACION, GEMINI_API_KEY
+from src.constants import (
+    TIPOS_PROYECTO, UMBRAL_RECOMENDACION, GEMINI_API_KEY, GEMINI_BACKEND, GEMINI_FALSO_CONFIG
+)
 
 log = _log.log
 
 # Variable global para reutilizar la conexión con Gemini
 _gemini_service = None
+# Evita que varios hilos (simulación en lote, GUI) creen el servicio a la vez
+_gemini_lock = threading.Lock()
+
+# Simulaciones en curso, para no repetir llamadas idénticas a Gemini
+_vuelos = SingleFlight()
+
+# Proyectos ya evaluados por la IA, para reutilizar métricas de casos casi iguales
+_indice_vecinos = IndiceVecinos()
 
 def _get_gemini_service():
     """
@@ -20,22 +36,48 @@ def _get_gemini_service():
     """
     global _gemini_service
     if _gemini_service is None:
-        try:
-            # Intento importar y crear el servicio de Gemini
-            from src.gemini_service import GeminiService
-            _gemini_service = GeminiService(GEMINI_API_KEY)
-            log.info('Servicio de Gemini inicializado para recomendaciones con IA')
-        except ImportError as e:
-            # Si no está instalada la librería, lo marco como no disponible
-            log.warning(f'No se pudo importar gemini_service: {e}. Instala google-generativeai')
-            _gemini_service = False
-        except Exception as e:
-            log.error(f'Error al inicializar Gemini: {e}')
-            _gemini_service = False
+        with _gemini_lock:
+            if _gemini_service is None:
+                _crear_gemini_service()
     
     # Devuelvo el servicio si existe, sino None
     return _gemini_service if _gemini_service is not False else None
 
+def _crear_gemini_service():
+    """Crea el servicio de Gemini o lo marca como no disponible (False)."""
+    global _gemini_service
+    if GEMINI_BACKEND != "falso" and not GEMINI_API_KEY:
+        # Sin API key ni siquiera importo el SDK: se usan las fórmulas
+        log.info('GEMINI_API_KEY vacía, se usarán las fórmulas de respaldo')
+        _gemini_service = False
+        return
+    try:
+        # Intento importar y crear el servicio de Gemini
+        from src.gemini_service import GeminiService
+        if GEMINI_BACKEND == "falso":
+            from src.gemini_fake import ModeloGeminiFalso
+            _gemini_service = GeminiService(GEMINI_API_KEY, model=ModeloGeminiFalso(**GEMINI_FALSO_CONFIG))
+            log.info('Servicio de Gemini inicializado con el modelo falso local')
+        else:
+            _gemini_service = GeminiService(GEMINI_API_KEY)
+            log.info('Servicio de Gemini inicializado para recomendaciones con IA')
+    except ImportError as e:
+        # Si no está instalada la librería, lo marco como no disponible
+        log.warning(f'No se pudo importar gemini_service: {e}. Instala google-generativeai')
+        _gemini_service = False
+    except Exception as e:
+        log.error(f'Error al inicializar Gemini: {e}')
+        _gemini_service = False
+
+def usar_servicio_gemini(servicio) -> None:
+    """
+    Reemplaza el servicio de IA que usa la simulación.
+    Sirve para inyectar un GeminiService con otro backend (p. ej. el modelo
+    falso en benchmarks). Con None se vuelve a crear el servicio por defecto.
+    """
+    global _gemini_service
+    _gemini_service = servicio
+
 # Estos son los factores base para cada tipo de proyecto
 # Valores más altos = menos impacto
 FACTORES_TIPO = {
@@ -48,19 +90,35 @@ def _clip(x: float, lo=0.0, hi=100.0) -> float:
     """Función helper para mantener un valor entre un rango."""
     return max(lo, min(hi, x))
 
-def simular(p: Project) -> Impacto:
+@medido("simulacion.simular")
+def simular(p: Project, al_recibir: Optional[Callable[[str, str], None]] = None) -> Impacto:
     """
     Función principal que simula el impacto ambiental.
     Intenta usar IA primero, si falla usa fórmulas matemáticas.
+    Si ya hay una simulación en curso con exactamente los mismos datos
+    del proyecto, espera esa y comparte su resultado.
+
+    al_recibir(categoria, fragmento) recibe el texto de las recomendaciones
+    de la IA a medida que llega (solo la llamada que hace el trabajo real).
     """
-    log.info(f'Iniciando simulación para proyecto: {p.id} ({p.tipo})')
-    log.debug(f'Parámetros del proyecto: área={p.area_ha}ha, duración={p.duracion_meses}meses, intensidad={p.intensidad}')
+    return _vuelos.ejecutar(astuple(p), _simular, p, al_recibir)
+
+def _simular(p: Project, al_recibir: Optional[Callable[[str, str], None]] = None) -> Impacto:
+    """Hace la simulación real (IA o fórmulas) de un proyecto."""
+    log.info('Iniciando simulación para proyecto: %s (%s)', p.id, p.tipo)
+    log.debug('Parámetros del proyecto: área=%sha, duración=%smeses, intensidad=%s', p.area_ha, p.duracion_meses, p.intensidad)
     
     # Intento conseguir el servicio de IA
     gemini = _get_gemini_service()
-    metricas = None
-    
-    if gemini:
+    origen = "formulas"
+
+    # Si la IA ya evaluó proyectos casi iguales, reutilizo sus métricas
+    with trazas.span("simulacion.vecinos"):
+        metricas = _indice_vecinos.interpolar(p)
+    if metricas is not None:
+        log.info('Métricas interpoladas de proyectos similares ya evaluados por IA')
+        origen = "vecinos"
+    elif gemini:
         # Si tengo IA disponible, la uso para calcular
         log.info('Calculando métricas de impacto con IA (Gemini)')
         try:
@@ -75,8 +133,11 @@ def simular(p: Project) -> Impacto:
             )
         except Exception as e:
             # Si algo falla con la IA, lo registro y continúo sin ella
-            log.error(f'Error al calcular con IA: {e}')
+            log.error('Error al calcular con IA: %s', e)
             metricas = None
+        if metricas is not None:
+            origen = "ia"
+            _indice_vecinos.agregar(p, metricas)
     
     # Si no tengo IA o falló, uso mis fórmulas matemáticas de respaldo
     if metricas is None:
@@ -90,8 +151,8 @@ def simular(p: Project) -> Impacto:
     suelo = metricas['uso_suelo']
     riesgo = metricas['riesgo_total']
     
-    log.debug(f'Puntuaciones calculadas - Aire: {aire:.1f}, Agua: {agua:.1f}, Biodiversidad: {biod:.1f}, Suelo: {suelo:.1f}')
-    log.debug(f'Riesgo total calculado: {riesgo:.1f}%')
+    log.debug('Puntuaciones calculadas - Aire: %.1f, Agua: %.1f, Biodiversidad: %.1f, Suelo: %.1f', aire, agua, biod, suelo)
+    log.debug('Riesgo total calculado: %.1f%%', riesgo)
 
     # Ahora genero las recomendaciones
     recs: Dict[str,str] = {}
@@ -110,18 +171,20 @@ def simular(p: Project) -> Impacto:
                 calidad_agua=agua,
                 biodiversidad=biod,
                 uso_suelo=suelo,
-                riesgo_total=riesgo
+                riesgo_total=riesgo,
+                al_recibir=al_recibir
             )
         except Exception as e:
             # Si falla la IA, uso recomendaciones básicas predefinidas
-            log.error(f'Error al generar recomendaciones con IA: {e}')
+            log.error('Error al generar recomendaciones con IA: %s', e)
             recs = _generar_recomendaciones_basicas(aire, agua, biod, suelo)
     else:
         # Si no hay IA disponible desde el inicio
         log.info('Generando recomendaciones básicas (sin IA)')
         recs = _generar_recomendaciones_basicas(aire, agua, biod, suelo)
 
-    log.info(f'Simulación completada - Riesgo total: {riesgo:.1f}%, Recomendaciones generadas: {len(recs)}')
+    log.info('Simulación completada - Riesgo total: %.1f%%, Recomendaciones generadas: %s', riesgo, len(recs))
+    registro_metricas.contar(f'simulacion.origen.{origen}')
     
     # Creo y devuelvo el objeto Impacto con todos los resultados
     return Impacto(
@@ -131,9 +194,11 @@ def simular(p: Project) -> Impacto:
         biodiversidad=biod,
         uso_suelo=suelo,
         riesgo_total=riesgo,
-        recomendaciones=recs
+        recomendaciones=recs,
+        origen=origen
     )
 
+@medido("simulacion.formulas")
 def _calcular_con_formulas(p: Project) -> Dict[str, float]:
     """
     Calcula las métricas usando mis propias fórmulas matemáticas.
@@ -141,7 +206,7 @@ def _calcular_con_formulas(p: Project) -> Dict[str, float]:
     """
     # Verifico que el tipo de proyecto sea válido
     if p.tipo not in FACTORES_TIPO:
-        log.warning(f"Tipo de proyecto desconocido: {p.tipo}. Se asumirá 'construccion'.")
+        log.warning("Tipo de proyecto desconocido: %s. Se asumirá 'construccion'.", p.tipo)
     
     # Obtengo los factores base para este tipo de proyecto
     f = FACTORES_TIPO.get(p.tipo, FACTORES_TIPO["construccion"])
@@ -151,7 +216,7 @@ def _calcular_con_formulas(p: Project) -> Dict[str, float]:
     area_factor = 1 + math.log10(max(p.area_ha, 1)) * 0.1  # Área en escala logarítmica
     tiempo_factor = 1 + (p.duracion_meses/12) * 0.05  # Tiempo en años
     
-    log.debug(f'Factores calculados - escala: {escala:.2f}, área: {area_factor:.2f}, tiempo: {tiempo_factor:.2f}')
+    log.debug('Factores calculados - escala: %.2f, área: %.2f, tiempo: %.2f', escala, area_factor, tiempo_factor)
 
     # Calculo las puntuaciones (100 = óptimo, menor impacto)
     # Divido entre los factores para que más intensidad = peor puntuación
@@ -172,6 +237,7 @@ def _calcular_con_formulas(p: Project) -> Dict[str, float]:
         'riesgo_total': riesgo
     }
 
+@trazas.trazado("simulacion.recomendaciones_basicas")
 def _generar_recomendaciones_basicas(aire: float, agua: float, biod: float, suelo: float) -> Dict[str, str]:
     """
     Genera recomendaciones predefinidas cuando no hay IA.
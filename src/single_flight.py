@@ -0,0 +1,64 @@
+"""
+Deduplicación de llamadas idénticas que están en curso (single-flight).
+Si varios hilos piden lo mismo a la vez, solo uno hace el trabajo
+y los demás esperan y reciben el mismo resultado.
+"""
+import threading
+from typing import Any, Callable, Dict, Hashable
+import src.logger_base as _log
+
+log = _log.log
+
+
+class _Llamada:
+    """Una llamada en curso con su resultado (o error) compartido."""
+
+    def __init__(self):
+        self.listo = threading.Event()
+        self.resultado: Any = None
+        self.error: BaseException = None
+        self.esperando = 0
+
+
+class SingleFlight:
+    """Agrupa las llamadas concurrentes que comparten la misma clave."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._en_vuelo: Dict[Hashable, _Llamada] = {}
+
+    def ejecutar(self, clave: Hashable, fn: Callable, *args, **kwargs) -> Any:
+        """
+        Ejecuta fn(*args, **kwargs) salvo que ya haya una llamada con la
+        misma clave en curso; en ese caso espero y devuelvo su resultado.
+        """
+        with self._lock:
+            llamada = self._en_vuelo.get(clave)
+            if llamada is not None:
+                llamada.esperando += 1
+                lider = False
+            else:
+                llamada = _Llamada()
+                self._en_vuelo[clave] = llamada
+                lider = True
+
+        if not lider:
+            log.debug('Llamada idéntica en curso, esperando su resultado')
+            llamada.listo.wait()
+            if llamada.error is not None:
+                raise llamada.error
+            return llamada.resultado
+
+        try:
+            llamada.resultado = fn(*args, **kwargs)
+            return llamada.resultado
+        except BaseException as e:
+            llamada.error = e
+            raise
+        finally:
+            # Saco la clave antes de avisar, así las llamadas nuevas vuelven a calcular
+            with self._lock:
+                del self._en_vuelo[clave]
+            if llamada.esperando:
+                log.debug('Resultado compartido con %s llamada(s) duplicada(s)', llamada.esperando)
+            llamada.listo.set()
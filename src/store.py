@@ -3,127 +3,443 @@ Este archivo maneja todo lo relacionado con guardar y leer datos del CSV.
 Funciona como una mini base de datos para los proyectos.
 """
 import csv
+import itertools
+import json
 import os
-from typing import List, Optional, Dict
-from src.models import Project
+import sqlite3
+import tempfile
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from dataclasses import asdict
+from typing import Callable, Iterable, Iterator, List, Optional, Dict, Tuple
+from src.models import Project, Impacto
+from src.tablas import ProjectTable
+from src.metricas import medido
 import src.logger_base as _log
+from src.constants import STORE_SHARDS, STORE_HILOS_LECTURA, STORE_BLOQUE_LECTURA
 log = _log.log
 
+try:
+    import fcntl  # Solo en Linux/macOS
+except ImportError:
+    fcntl = None
+
 # Ruta donde se guarda el archivo CSV
 CSV_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "proyectos.csv")
 # Columnas que tiene el CSV
 CSV_FIELDS = ["id","nombre","tipo","area_ha","duracion_meses","ubicacion","intensidad"]
+# Último resultado de simulación de cada proyecto. Uso SQLite (viene con Python)
+# porque aquí hace falta buscar por id sin recorrer todo el archivo.
+RESULTADOS_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "resultados.sqlite")
+# Ids por consulta en read_impactos (SQLite anterior a 3.32 acepta hasta 999 parámetros)
+_IDS_POR_CONSULTA = 500
+# Cantidad de archivos en que se reparten los proyectos (1 = el CSV de siempre).
+# Es una variable del módulo para poder cambiarla en ejecución (benchmark.py --shards).
+SHARDS = STORE_SHARDS
+
+# ---------------------- Shards ----------------------
+# Con SHARDS > 1 cada proyecto vive en proyectos-NN.csv según un hash de su id.
+# Así una reescritura toca 1/N de los datos y los escritores de shards
+# distintos no se esperan entre sí (cada shard tiene su propio lock).
+
+def _ruta_shard(k: int) -> str:
+    base, ext = os.path.splitext(CSV_PATH)
+    return f"{base}-{k:02d}{ext}"
+
+def rutas() -> List[str]:
+    """Archivos de datos: el CSV único o uno por shard."""
+    if SHARDS <= 1:
+        return [CSV_PATH]
+    return [_ruta_shard(k) for k in range(SHARDS)]
+
+def ruta_de(pid: str) -> str:
+    """Archivo donde está (o va) el proyecto pid. Uso crc32 porque hash() cambia entre procesos."""
+    if SHARDS <= 1:
+        return CSV_PATH
+    return _ruta_shard(zlib.crc32(pid.encode("utf-8")) % SHARDS)
+
+# ---------------------- Bloqueo entre procesos ----------------------
+# La GUI, la CLI y los procesos por lotes pueden tocar el CSV a la vez.
+# Los lectores toman un lock compartido (pueden leer muchos en paralelo) y
+# los escritores uno exclusivo sobre un archivo aparte (proyectos.csv.lock,
+# uno por shard): no uso el CSV mismo porque las reescrituras lo reemplazan
+# con os.replace. Sin fcntl (Windows) caigo a un lock dentro del proceso,
+# que no protege entre procesos pero sí entre los hilos de la GUI.
+
+_estado_lock = threading.local()
+_locks_locales: Dict[str, threading.RLock] = {}
+
+
+class _EstadoLock:
+    """Lock que tiene tomado el hilo sobre un archivo."""
+    def __init__(self):
+        self.fd = None
+        self.exclusivo = False
+        self.cuenta = 0
+
+
+@contextmanager
+def _bloqueo(exclusivo: bool, ruta: Optional[str] = None):
+    """
+    Toma el lock del archivo de datos `ruta` (por defecto el CSV) en modo
+    compartido o exclusivo mientras dure el with.
+    Es reentrante por hilo: si el hilo ya lo tiene no lo vuelve a pedir.
+    Pedir el exclusivo teniendo el compartido lanza RuntimeError: flock no
+    sube el lock de forma atómica y dos procesos subiendo a la vez se
+    bloquearían entre sí. Hay que soltar el compartido, tomar el exclusivo
+    y volver a leer lo que haga falta.
+    """
+    ruta = ruta or CSV_PATH
+    if fcntl is None:
+        with _locks_locales.setdefault(ruta, threading.RLock()):
+            yield
+        return
+    if not hasattr(_estado_lock, "por_ruta"):
+        _estado_lock.por_ruta = {}
+    est = _estado_lock.por_ruta.setdefault(ruta, _EstadoLock())
+    if est.cuenta:
+        if exclusivo and not est.exclusivo:
+            raise RuntimeError(f"Se pidió el lock exclusivo de {ruta} teniendo el compartido")
+        fd = est.fd
+        est.cuenta += 1
+        try:
+            yield
+        finally:
+            # Con generadores el dueño puede haber soltado el lock antes que yo
+            if est.cuenta and est.fd == fd:
+                est.cuenta -= 1
+        return
+
+    fd = os.open(ruta + ".lock", os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX if exclusivo else fcntl.LOCK_SH)
+        est.fd, est.exclusivo, est.cuenta = fd, exclusivo, 1
+        try:
+            yield
+        finally:
+            est.cuenta = 0
+            fcntl.flock(fd, fcntl.LOCK_UN)
+    finally:
+        os.close(fd)
+
+
+def bloqueo_escritura(pid: str):
+    """
+    Lock exclusivo del archivo donde vive pid, para agrupar varias operaciones
+    (leer, modificar y registrar el cambio) sin que otro proceso se meta en el medio.
+    """
+    return _bloqueo(exclusivo=True, ruta=ruta_de(pid))
+
+
+def _reescribir(rows: Iterable[Dict], ruta: Optional[str] = None) -> None:
+    """
+    Escribe el archivo completo en un temporal de la misma carpeta y lo pone en
+    su lugar con os.replace (atómico): un lector ve el archivo viejo o el
+    nuevo, nunca uno a medio escribir. Hay que llamarla con el lock exclusivo.
+    """
+    ruta = ruta or CSV_PATH
+    carpeta = os.path.dirname(ruta)
+    fd, temporal = tempfile.mkstemp(dir=carpeta, prefix=".proyectos-", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
+            writer.writeheader()
+            writer.writerows(rows)
+            f.flush()
+            os.fsync(f.fileno())
+        # mkstemp crea el archivo con 0600; le dejo los permisos que tenía el original
+        try:
+            modo = os.stat(ruta).st_mode & 0o777
+        except FileNotFoundError:
+            modo = 0o644
+        os.chmod(temporal, modo)
+        os.replace(temporal, ruta)
+    except BaseException:
+        # Si algo falló dejo el CSV como estaba y borro el temporal
+        try:
+            os.remove(temporal)
+        except OSError:
+            pass
+        raise
+
 
 def init_store():
-    """Crea el archivo CSV si no existe."""
+    """Crea el archivo CSV (o los de cada shard) si no existe."""
     try:
-        if not os.path.exists(CSV_PATH):
-            # Creo el archivo con los encabezados
-            with open(CSV_PATH, "w", newline="", encoding="utf-8") as f:
-                writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
-                writer.writeheader()
-            log.info("Archivo de datos creado: %s", CSV_PATH)
+        for ruta in rutas():
+            if not os.path.exists(ruta):
+                with _bloqueo(exclusivo=True, ruta=ruta):
+                    # Vuelvo a mirar: otro proceso pudo crearlo mientras esperaba el lock
+                    if not os.path.exists(ruta):
+                        # Creo el archivo con los encabezados
+                        _reescribir([], ruta)
+                        log.info("Archivo de datos creado: %s", ruta)
     except IOError as e:
         log.error("Error al crear archivo de datos: %s", e)
         raise
 
+def proyecto_a_fila(p: Project) -> Dict:
+    """Convierte un Project en la fila (dict) que se escribe en el CSV."""
+    return {
+        "id": p.id,
+        "nombre": p.nombre,
+        "tipo": p.tipo,
+        "area_ha": p.area_ha,
+        "duracion_meses": p.duracion_meses,
+        "ubicacion": p.ubicacion,
+        "intensidad": p.intensidad
+    }
+
+@medido("store.create")
 def create(p: Project) -> None:
     """Guarda un nuevo proyecto en el CSV."""
     init_store()
     
-    # Verifico que no exista ya un proyecto con ese ID
-    if read_by_id(p.id) is not None:
-        log.warning("Intento de crear proyecto con ID existente: %s", p.id)
-        raise ValueError(f"Ya existe un proyecto con ID: {p.id}")
-    
+    ruta = ruta_de(p.id)
+    # Con el lock exclusivo tomado, nadie puede agregar el mismo ID entre el chequeo y la escritura
+    with _bloqueo(exclusivo=True, ruta=ruta):
+        # Verifico que no exista ya un proyecto con ese ID
+        if read_by_id(p.id) is not None:
+            log.warning("Intento de crear proyecto con ID existente: %s", p.id)
+            raise ValueError(f"Ya existe un proyecto con ID: {p.id}")
+        
+        try:
+            # Abro el archivo en modo append para agregar al final
+            with open(ruta, "a", newline="", encoding="utf-8") as f:
+                writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
+                # Escribo los datos del proyecto como un diccionario
+                writer.writerow(proyecto_a_fila(p))
+            log.debug("Proyecto creado: %s", p.id)
+        except IOError as e:
+            log.error("Error al escribir proyecto %s: %s", p.id, e)
+            raise
+
+@medido("store.create_many")
+def create_many(proyectos: Iterable[Project]) -> int:
+    """
+    Agrega varios proyectos al CSV abriendo el archivo una sola vez.
+    No revisa duplicados: el que llama debe haberlo hecho antes.
+    Devuelve cuántos escribió.
+    """
+    init_store()
+    n = 0
     try:
-        # Abro el archivo en modo append para agregar al final
-        with open(CSV_PATH, "a", newline="", encoding="utf-8") as f:
-            writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
-            # Escribo los datos del proyecto como un diccionario
-            writer.writerow({
-                "id": p.id,
-                "nombre": p.nombre,
-                "tipo": p.tipo,
-                "area_ha": p.area_ha,
-                "duracion_meses": p.duracion_meses,
-                "ubicacion": p.ubicacion,
-                "intensidad": p.intensidad
-            })
-        log.debug("Proyecto creado: %s", p.id)
+        if SHARDS <= 1:
+            with _bloqueo(exclusivo=True), open(CSV_PATH, "a", newline="", encoding="utf-8") as f:
+                writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
+                for p in proyectos:
+                    writer.writerow(proyecto_a_fila(p))
+                    n += 1
+        else:
+            # Agrupo por shard y escribo uno por vez (en orden, sin tener dos locks a la vez)
+            por_shard: Dict[str, List[Dict]] = {}
+            for p in proyectos:
+                por_shard.setdefault(ruta_de(p.id), []).append(proyecto_a_fila(p))
+            for ruta in sorted(por_shard):
+                with _bloqueo(exclusivo=True, ruta=ruta), open(ruta, "a", newline="", encoding="utf-8") as f:
+                    csv.DictWriter(f, fieldnames=CSV_FIELDS).writerows(por_shard[ruta])
+                n += len(por_shard[ruta])
+        log.debug("Proyectos creados en bloque: %d", n)
+        return n
     except IOError as e:
-        log.error("Error al escribir proyecto %s: %s", p.id, e)
+        log.error("Error al escribir proyectos en bloque: %s", e)
         raise
 
-def read_all() -> List[Project]:
-    """Lee todos los proyectos del CSV y los devuelve como lista."""
+class IdsConocidos:
+    """
+    Ids ya guardados en cada archivo de datos y hasta qué byte los leí.
+    create_many_sin_duplicados lo actualiza con el lock exclusivo tomado:
+    si el archivo solo creció lee lo agregado desde entonces, y si se
+    reemplazó (update/delete usan os.replace) lo relee entero.
+    """
+
+    def __init__(self):
+        self._por_ruta: Dict[str, Tuple[Tuple[int, int], int, set]] = {}
+
+    def al_dia(self, ruta: str) -> set:
+        """Ids del archivo al día con lo que hay en disco. Llamar con el lock exclusivo de la ruta."""
+        st = os.stat(ruta)
+        archivo = (st.st_dev, st.st_ino)
+        previo = self._por_ruta.get(ruta)
+        if previo is not None and previo[0] == archivo and previo[1] <= st.st_size:
+            _, offset, ids = previo
+        else:
+            offset, ids = 0, set()
+        with open(ruta, "r", newline="", encoding="utf-8") as f:
+            if offset:
+                # Las filas agregadas después del byte leído (siempre empiezan en un salto de línea)
+                f.seek(offset)
+                reader = csv.DictReader(f, fieldnames=CSV_FIELDS)
+            else:
+                reader = csv.DictReader(f)
+            ids.update(row["id"] for row in reader)
+        self._por_ruta[ruta] = (archivo, st.st_size, ids)
+        return ids
+
+    def escrito(self, ruta: str) -> None:
+        """Anota hasta dónde llega el archivo después de agregarle filas (sus ids ya están en el set)."""
+        archivo, _, ids = self._por_ruta[ruta]
+        self._por_ruta[ruta] = (archivo, os.stat(ruta).st_size, ids)
+
+
+@medido("store.create_many_sin_duplicados")
+def create_many_sin_duplicados(proyectos: Iterable[Project],
+                               conocidos: Optional[IdsConocidos] = None,
+                               al_escribir: Optional[Callable[[List[Project]], None]] = None) -> List[Project]:
+    """
+    Como create_many, pero revisa con el lock exclusivo de cada archivo tomado
+    que los ids no existan (ni se repitan entre los que llegan): así otro
+    proceso no puede crear el mismo id entre el chequeo y la escritura.
+    Devuelve los proyectos que no escribió por estar repetidos. Pasar el mismo
+    `conocidos` en cada llamada evita releer todo el archivo en cada bloque.
+    `al_escribir` recibe los escritos en cada archivo antes de soltar su lock
+    (para registrar el cambio en el mismo orden en que quedó escrito).
+    """
     init_store()
-    items: List[Project] = []
-    
+    conocidos = conocidos or IdsConocidos()
+    por_shard: Dict[str, List[Project]] = {}
+    for p in proyectos:
+        por_shard.setdefault(ruta_de(p.id), []).append(p)
+    repetidos: List[Project] = []
+    try:
+        for ruta in sorted(por_shard):
+            with _bloqueo(exclusivo=True, ruta=ruta):
+                ids = conocidos.al_dia(ruta)
+                nuevos = []
+                for p in por_shard[ruta]:
+                    if p.id in ids:
+                        repetidos.append(p)
+                    else:
+                        ids.add(p.id)
+                        nuevos.append(p)
+                if nuevos:
+                    with open(ruta, "a", newline="", encoding="utf-8") as f:
+                        csv.DictWriter(f, fieldnames=CSV_FIELDS).writerows(proyecto_a_fila(p) for p in nuevos)
+                    conocidos.escrito(ruta)
+                    if al_escribir is not None:
+                        al_escribir(nuevos)
+        log.debug("Proyectos creados en bloque: %d (%d repetidos)",
+                  sum(map(len, por_shard.values())) - len(repetidos), len(repetidos))
+        return repetidos
+    except IOError as e:
+        log.error("Error al escribir proyectos en bloque: %s", e)
+        raise
+
+def _fila_a_proyecto(row: Dict) -> Project:
+    """Convierte una fila del CSV en un Project (lanza ValueError/KeyError si es inválida)."""
+    return Project(
+        id=row["id"],
+        nombre=row["nombre"],
+        tipo=row["tipo"],
+        area_ha=float(row["area_ha"]),  # Convierto a número decimal
+        duracion_meses=int(row["duracion_meses"]),  # Convierto a entero
+        ubicacion=row.get("ubicacion",""),  # Si no existe, uso string vacío
+        intensidad=int(row.get("intensidad",5)),  # Si no existe, uso 5
+    )
+
+def iter_archivo(ruta: str) -> Iterator[Project]:
+    """
+    Recorre los proyectos de un archivo de datos (el CSV o un shard).
+    Leo de a STORE_BLOQUE_LECTURA filas con el lock compartido y lo suelto
+    antes de devolverlas: si el que consume es lento (un lote que simula con
+    la IA, por ejemplo) los escritores no quedan esperando a que termine.
+    Las reescrituras no me afectan porque reemplazan el archivo (sigo leyendo
+    el que abrí); el lock solo evita ver un agregado a medio escribir.
+    """
     try:
-        # Abro el archivo en modo lectura
-        with open(CSV_PATH, "r", encoding="utf-8") as f:
+        with open(ruta, "r", encoding="utf-8") as f:
             reader = csv.DictReader(f)
-            # Leo cada fila del CSV
-            for row in reader:
-                try:
-                    # Creo un objeto Project con los datos de la fila
-                    items.append(Project(
-                        id=row["id"],
-                        nombre=row["nombre"],
-                        tipo=row["tipo"],
-                        area_ha=float(row["area_ha"]),  # Convierto a número decimal
-                        duracion_meses=int(row["duracion_meses"]),  # Convierto a entero
-                        ubicacion=row.get("ubicacion",""),  # Si no existe, uso string vacío
-                        intensidad=int(row.get("intensidad",5)),  # Si no existe, uso 5
-                    ))
-                except (ValueError, KeyError) as e:
-                    # Si hay un error en una fila, la ignoro y sigo con la siguiente
-                    log.warning("Fila inválida en CSV, omitiendo: %s", e)
-                    continue
+            while True:
+                with _bloqueo(exclusivo=False, ruta=ruta):
+                    bloque = list(itertools.islice(reader, STORE_BLOQUE_LECTURA))
+                if not bloque:
+                    break
+                for row in bloque:
+                    try:
+                        yield _fila_a_proyecto(row)
+                    except (ValueError, KeyError) as e:
+                        # Si hay un error en una fila, la ignoro y sigo con la siguiente
+                        log.warning("Fila inválida en CSV, omitiendo: %s", e)
+                        continue
     except IOError as e:
         log.error("Error al leer proyectos: %s", e)
-        return []
-    
+
+@medido("store.iter_all")
+def iter_all() -> Iterator[Project]:
+    """
+    Recorre los proyectos del CSV de uno en uno sin cargarlos todos en memoria.
+    Las filas inválidas se omiten igual que en read_all.
+    """
+    init_store()
+    for ruta in rutas():
+        yield from iter_archivo(ruta)
+
+@medido("store.read_all")
+def read_all() -> List[Project]:
+    """
+    Lee todos los proyectos del CSV y los devuelve como lista.
+    Con shards, los lee en paralelo y los junta en el orden de los shards.
+    """
+    init_store()
+    archivos = rutas()
+    if len(archivos) == 1:
+        items = list(iter_archivo(archivos[0]))
+    else:
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=min(STORE_HILOS_LECTURA, len(archivos))) as pool:
+            items = [p for parte in pool.map(lambda r: list(iter_archivo(r)), archivos) for p in parte]
     log.debug("Leídos %d proyectos del almacenamiento", len(items))
     return items
 
+@medido("store.read_tabla")
+def read_tabla() -> ProjectTable:
+    """Lee todos los proyectos en una ProjectTable (columnas, sin un objeto por fila)."""
+    tabla = ProjectTable()
+    tabla.extender(iter_all())
+    log.debug("Leídos %d proyectos en tabla", len(tabla))
+    return tabla
+
+@medido("store.read_by_id")
 def read_by_id(pid: str) -> Optional[Project]:
     """Busca un proyecto específico por su ID."""
-    # Recorro todos los proyectos hasta encontrar el que coincida
-    for p in read_all():
+    # Recorro su shard hasta encontrar el que coincida (sin leer el resto)
+    init_store()
+    for p in iter_archivo(ruta_de(pid)):
         if p.id == pid:
             return p
     return None  # Si no lo encuentro, devuelvo None
 
+@medido("store.update")
 def update(pid: str, cambios: Dict) -> bool:
     """Actualiza los datos de un proyecto existente."""
     init_store()
     rows = []
     encontrado = False
     
+    ruta = ruta_de(pid)
     try:
-        # Primero leo todos los proyectos
-        with open(CSV_PATH, "r", encoding="utf-8") as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                if row["id"] == pid:
-                    # Encontré el proyecto, actualizo sus campos
-                    encontrado = True
-                    for k, v in cambios.items():
-                        if k in row and k != "id":  # No dejo cambiar el ID
-                            row[k] = str(v)
-                rows.append(row)
-        
-        if not encontrado:
-            log.warning("Proyecto no encontrado para actualizar: %s", pid)
-            return False
-        
-        # Reescribo el archivo con todos los proyectos actualizados
-        with open(CSV_PATH, "w", newline="", encoding="utf-8") as f:
-            writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
-            writer.writeheader()
-            writer.writerows(rows)
+        # Leo y reescribo con el lock exclusivo para no pisar un cambio de otro proceso
+        with _bloqueo(exclusivo=True, ruta=ruta):
+            # Primero leo todos los proyectos (con shards, solo los del suyo)
+            with open(ruta, "r", encoding="utf-8") as f:
+                reader = csv.DictReader(f)
+                for row in reader:
+                    if row["id"] == pid:
+                        # Encontré el proyecto, actualizo sus campos
+                        encontrado = True
+                        for k, v in cambios.items():
+                            if k in row and k != "id":  # No dejo cambiar el ID
+                                row[k] = str(v)
+                    rows.append(row)
+            
+            if not encontrado:
+                log.warning("Proyecto no encontrado para actualizar: %s", pid)
+                return False
+            
+            # Reescribo el archivo con todos los proyectos actualizados
+            _reescribir(rows, ruta)
         
         log.debug("Proyecto %s actualizado: %s", pid, cambios)
         return True
@@ -132,28 +448,29 @@ def update(pid: str, cambios: Dict) -> bool:
         log.error("Error al actualizar proyecto %s: %s", pid, e)
         return False
 
+@medido("store.delete")
 def delete(pid: str) -> bool:
     """Elimina un proyecto del CSV."""
     init_store()
     rows = []
     eliminado = False
     
+    ruta = ruta_de(pid)
     try:
-        # Leo todos los proyectos
-        with open(CSV_PATH, "r", encoding="utf-8") as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                if row["id"] == pid:
-                    # Encontré el que quiero eliminar, no lo agrego a la lista
-                    eliminado = True
-                    continue
-                rows.append(row)
-        
-        # Reescribo el archivo sin el proyecto eliminado
-        with open(CSV_PATH, "w", newline="", encoding="utf-8") as f:
-            writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
-            writer.writeheader()
-            writer.writerows(rows)
+        with _bloqueo(exclusivo=True, ruta=ruta):
+            # Leo todos los proyectos (con shards, solo los del suyo)
+            with open(ruta, "r", encoding="utf-8") as f:
+                reader = csv.DictReader(f)
+                for row in reader:
+                    if row["id"] == pid:
+                        # Encontré el que quiero eliminar, no lo agrego a la lista
+                        eliminado = True
+                        continue
+                    rows.append(row)
+            
+            # Reescribo el archivo sin el proyecto eliminado (si no estaba, no hace falta)
+            if eliminado:
+                _reescribir(rows, ruta)
         
         if eliminado:
             log.debug("Proyecto eliminado: %s", pid)
@@ -163,4 +480,106 @@ def delete(pid: str) -> bool:
         
     except IOError as e:
         log.error("Error al eliminar proyecto %s: %s", pid, e)
-        return False
\ No newline at end of file
+        return False
+
+def repartir(shards: int) -> int:
+    """
+    Pasa los proyectos de la distribución actual a `shards` archivos (1 = volver
+    al CSV único) y borra los archivos que sobran. Después hay que poner el
+    mismo valor en STORE_SHARDS. Conviene correrla sin otros procesos escribiendo.
+    Devuelve cuántos proyectos movió.
+    """
+    global SHARDS
+    proyectos = read_all()
+    anteriores = rutas()
+    SHARDS = shards
+    por_shard: Dict[str, List[Dict]] = {ruta: [] for ruta in rutas()}
+    for p in proyectos:
+        por_shard[ruta_de(p.id)].append(proyecto_a_fila(p))
+    for ruta, filas in por_shard.items():
+        with _bloqueo(exclusivo=True, ruta=ruta):
+            _reescribir(filas, ruta)
+    for ruta in anteriores:
+        if ruta not in por_shard:
+            with _bloqueo(exclusivo=True, ruta=ruta):
+                os.remove(ruta)
+    log.info("Proyectos repartidos en %d archivo(s): %d", len(por_shard), len(proyectos))
+    return len(proyectos)
+
+# ---------------------- Resultados de simulación ----------------------
+
+@contextmanager
+def resultados():
+    """
+    Abre la base de resultados (la crea si no existe) y la cierra al salir.
+    Sirve para hacer muchas consultas con una sola conexión.
+    """
+    con = sqlite3.connect(RESULTADOS_PATH, timeout=30)
+    try:
+        con.execute(
+            "CREATE TABLE IF NOT EXISTS impactos ("
+            "proyecto_id TEXT PRIMARY KEY, datos TEXT NOT NULL, actualizado REAL NOT NULL)"
+        )
+        yield con
+        con.commit()
+    finally:
+        con.close()
+
+@medido("store.save_impacto")
+def save_impacto(imp: Impacto, con: Optional[sqlite3.Connection] = None) -> None:
+    """Guarda (o reemplaza) el último resultado de simulación de un proyecto."""
+    if con is None:
+        with resultados() as con:
+            return save_impacto(imp, con)
+    try:
+        con.execute(
+            "INSERT OR REPLACE INTO impactos (proyecto_id, datos, actualizado) VALUES (?, ?, ?)",
+            (imp.proyecto_id, json.dumps(asdict(imp), ensure_ascii=False), time.time())
+        )
+        log.debug("Resultado guardado para proyecto %s", imp.proyecto_id)
+    except sqlite3.Error as e:
+        log.error("Error al guardar resultado de %s: %s", imp.proyecto_id, e)
+
+@medido("store.read_impacto")
+def read_impacto(pid: str, con: Optional[sqlite3.Connection] = None) -> Optional[Impacto]:
+    """Devuelve el último resultado guardado de un proyecto, o None."""
+    if con is None:
+        with resultados() as con:
+            return read_impacto(pid, con)
+    try:
+        fila = con.execute("SELECT datos FROM impactos WHERE proyecto_id = ?", (pid,)).fetchone()
+    except sqlite3.Error as e:
+        log.error("Error al leer resultado de %s: %s", pid, e)
+        return None
+    return Impacto(**json.loads(fila[0])) if fila else None
+
+@medido("store.read_impactos")
+def read_impactos(pids: Iterable[str], con: Optional[sqlite3.Connection] = None) -> Dict[str, Impacto]:
+    """
+    Últimos resultados de varios proyectos: {id: impacto}, solo los que tienen.
+    Hace una consulta por cada _IDS_POR_CONSULTA ids en lugar de una por proyecto.
+    """
+    if con is None:
+        with resultados() as con:
+            return read_impactos(pids, con)
+    pids = list(dict.fromkeys(pids))
+    impactos: Dict[str, Impacto] = {}
+    try:
+        for i in range(0, len(pids), _IDS_POR_CONSULTA):
+            trozo = pids[i:i + _IDS_POR_CONSULTA]
+            marcas = ",".join("?" * len(trozo))
+            for pid, datos in con.execute(
+                    f"SELECT proyecto_id, datos FROM impactos WHERE proyecto_id IN ({marcas})", trozo):
+                impactos[pid] = Impacto(**json.loads(datos))
+    except sqlite3.Error as e:
+        log.error("Error al leer resultados en bloque: %s", e)
+    return impactos
+
+@medido("store.delete_impacto")
+def delete_impacto(pid: str) -> None:
+    """Borra el resultado guardado de un proyecto (si lo hay)."""
+    try:
+        with resultados() as con:
+            con.execute("DELETE FROM impactos WHERE proyecto_id = ?", (pid,))
+    except sqlite3.Error as e:
+        log.error("Error al borrar resultado de %s: %s", pid, e)
@@ -0,0 +1,225 @@
+"""
+Tablas columnares para los caminos de muchos proyectos.
+En vez de una lista de objetos (cada uno con su dict y sus floats sueltos)
+guardo una columna por campo: los números en arreglos del módulo array,
+los textos en listas y el tipo/origen como categoría (un byte por fila
+que apunta a la lista de valores posibles). Las filas se arman como
+Project o Impacto recién cuando se piden.
+
+Uso array de la biblioteca estándar y no NumPy para no sumar una
+dependencia; memoryview(columna) da acceso sin copias igual que un ndarray.
+"""
+from array import array
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+from src.constants import TIPOS_PROYECTO
+from src.models import Project, Impacto
+
+# Clases de columna: código de array para las numéricas, "s" texto, "c" categoría, "o" objeto
+_TEXTO = "s"
+_CATEGORIA = "c"
+_OBJETO = "o"
+
+
+class _TablaColumnar:
+    """Base: guarda las columnas según CAMPOS y arma filas con FILA."""
+
+    CAMPOS: Tuple[Tuple[str, str], ...] = ()
+    FILA = tuple
+
+    def __init__(self, categorias: Sequence[str] = ()):
+        self._columnas: Dict[str, Union[array, List]] = {}
+        for nombre, clase in self.CAMPOS:
+            if clase in (_TEXTO, _OBJETO):
+                self._columnas[nombre] = []
+            elif clase == _CATEGORIA:
+                self._columnas[nombre] = array("B")
+            else:
+                self._columnas[nombre] = array(clase)
+        self._categorias: List[str] = list(categorias)
+        self._codigos: Dict[str, int] = {c: i for i, c in enumerate(self._categorias)}
+        self._indice: Optional[Dict[str, int]] = None
+        self._filas = 0
+
+    def _codigo(self, valor: str) -> int:
+        codigo = self._codigos.get(valor)
+        if codigo is None:
+            if len(self._categorias) >= 256:
+                raise ValueError("Demasiadas categorías distintas para una columna de un byte")
+            codigo = self._codigos[valor] = len(self._categorias)
+            self._categorias.append(valor)
+        return codigo
+
+    def agregar(self, fila) -> None:
+        """Agrega un objeto (Project/Impacto o su variante compacta) como fila nueva."""
+        for nombre, clase in self.CAMPOS:
+            valor = getattr(fila, nombre)
+            if clase == _CATEGORIA:
+                valor = self._codigo(valor)
+            self._columnas[nombre].append(valor)
+        if self._indice is not None:
+            self._indice[getattr(fila, self.CAMPOS[0][0])] = self._filas
+        self._filas += 1
+
+    def reemplazar(self, i: int, fila) -> None:
+        """Pisa la fila i con los valores de otro objeto (las columnas no cambian de largo)."""
+        if not 0 <= i < self._filas:
+            raise IndexError("Fila fuera de rango")
+        clave = self.CAMPOS[0][0]
+        if self._indice is not None and self._indice.get(self._columnas[clave][i]) == i:
+            del self._indice[self._columnas[clave][i]]
+        for nombre, clase in self.CAMPOS:
+            valor = getattr(fila, nombre)
+            if clase == _CATEGORIA:
+                valor = self._codigo(valor)
+            self._columnas[nombre][i] = valor
+        if self._indice is not None:
+            self._indice[getattr(fila, clave)] = i
+
+    def extender(self, filas: Iterable) -> int:
+        """Agrega todas las filas de un iterable sin armar una lista intermedia."""
+        antes = self._filas
+        for fila in filas:
+            self.agregar(fila)
+        return self._filas - antes
+
+    @classmethod
+    def desde(cls, filas: Iterable) -> "_TablaColumnar":
+        tabla = cls()
+        tabla.extender(filas)
+        return tabla
+
+    def __len__(self) -> int:
+        return self._filas
+
+    def _valor(self, nombre: str, clase: str, i: int):
+        valor = self._columnas[nombre][i]
+        return self._categorias[valor] if clase == _CATEGORIA else valor
+
+    def fila(self, i: int) -> tuple:
+        """Los valores de la fila i como tupla, en el orden de CAMPOS."""
+        return tuple(self._valor(nombre, clase, i) for nombre, clase in self.CAMPOS)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return VistaTabla(self, range(self._filas)[i])
+        if i < 0:
+            i += self._filas
+        if not 0 <= i < self._filas:
+            raise IndexError("Fila fuera de rango")
+        return self.FILA(*self.fila(i))
+
+    def __iter__(self) -> Iterator:
+        for i in range(self._filas):
+            yield self.FILA(*self.fila(i))
+
+    def columna(self, nombre: str) -> Union[memoryview, List]:
+        """
+        Columna completa sin copiar: memoryview para las numéricas y las
+        categorías (códigos), la lista misma para los textos.
+        No hay que modificarla; para eso están agregar/extender.
+        """
+        col = self._columnas[nombre]
+        return memoryview(col) if isinstance(col, array) else col
+
+    def valores(self, nombre: str) -> Iterator:
+        """Recorre una columna ya decodificada (las categorías como texto)."""
+        col = self._columnas[nombre]
+        if dict(self.CAMPOS)[nombre] == _CATEGORIA:
+            categorias = self._categorias
+            return (categorias[c] for c in col)
+        return iter(col)
+
+    @property
+    def categorias(self) -> List[str]:
+        return list(self._categorias)
+
+    def posicion(self, clave: str) -> Optional[int]:
+        """Fila de la clave (primera columna); el índice se arma la primera vez que se pide."""
+        if self._indice is None:
+            self._indice = {c: i for i, c in enumerate(self._columnas[self.CAMPOS[0][0]])}
+        return self._indice.get(clave)
+
+    def buscar(self, clave: str):
+        i = self.posicion(clave)
+        return None if i is None else self[i]
+
+    def bytes_aproximados(self) -> int:
+        """Memoria de las columnas numéricas más los punteros de las listas (sin los str)."""
+        total = 0
+        for col in self._columnas.values():
+            total += col.buffer_info()[1] * col.itemsize if isinstance(col, array) else 8 * len(col)
+        return total
+
+
+class VistaTabla:
+    """
+    Rango de filas de una tabla sin copiar las columnas (lo que devuelve tabla[a:b]).
+    Ve las filas que se agreguen después dentro del rango, no más allá.
+    """
+
+    def __init__(self, tabla: _TablaColumnar, filas: range):
+        self._tabla = tabla
+        self._filas = filas
+
+    def __len__(self) -> int:
+        return len(self._filas)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return VistaTabla(self._tabla, self._filas[i])
+        return self._tabla[self._filas[i]]
+
+    def __iter__(self) -> Iterator:
+        for i in self._filas:
+            yield self._tabla[i]
+
+    def columna(self, nombre: str) -> Union[memoryview, List]:
+        """Memoryview recortada (sin copia) para las numéricas; lista nueva para los textos."""
+        col = self._tabla.columna(nombre)
+        r = self._filas
+        if isinstance(col, memoryview):
+            if r.step > 0:
+                return col[r.start:r.stop:r.step]
+            # En un rango hacia atrás stop puede ser -1, que en un slice significa "el último"
+            return col[r.start:(r.stop if r.stop >= 0 else None):r.step]
+        return [col[i] for i in r]
+
+
+class ProjectTable(_TablaColumnar):
+    """
+    Proyectos en columnas. area_ha va en float64, duracion_meses en int32,
+    intensidad en un byte y el tipo como categoría.
+    """
+
+    CAMPOS = (
+        ("id", _TEXTO),
+        ("nombre", _TEXTO),
+        ("tipo", _CATEGORIA),
+        ("area_ha", "d"),
+        ("duracion_meses", "i"),
+        ("ubicacion", _TEXTO),
+        ("intensidad", "b"),
+    )
+    FILA = Project
+
+    def __init__(self, categorias: Sequence[str] = TIPOS_PROYECTO):
+        super().__init__(categorias)
+
+
+class ImpactoTable(_TablaColumnar):
+    """Resultados de simulación en columnas; el origen va como categoría."""
+
+    CAMPOS = (
+        ("proyecto_id", _TEXTO),
+        ("calidad_aire", "d"),
+        ("calidad_agua", "d"),
+        ("biodiversidad", "d"),
+        ("uso_suelo", "d"),
+        ("riesgo_total", "d"),
+        ("recomendaciones", _OBJETO),
+        ("origen", _CATEGORIA),
+    )
+    FILA = Impacto
+
+    def __init__(self, categorias: Sequence[str] = ("formulas", "vecinos", "ia")):
+        super().__init__(categorias)
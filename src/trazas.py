@@ -0,0 +1,196 @@
+"""
+Trazas por simulación con spans anidados.
+Cada span guarda su traza, su padre y cuánto duró; el span activo vive en
+un contextvar, así que las llamadas anidadas quedan colgando del span que
+las llamó. Para que una tarea en otro hilo siga en la misma traza hay que
+lanzarla con en_contexto(fn).
+
+Los spans se escriben en data/trazas.jsonl, un evento de Chrome por
+línea (JSONL válido: se puede leer línea a línea mientras se escribe).
+Para abrirlos en chrome://tracing o Perfetto, exportar_chrome() arma el
+.json con el objeto {"traceEvents": [...]} que esperan esos visores.
+La escritura la hace un hilo aparte para no meter I/O en el camino de
+la simulación.
+"""
+import atexit
+import contextvars
+import functools
+import itertools
+import json
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+import src.logger_base as _log
+from src.constants import TRAZAS_ACTIVAS
+
+log = _log.log
+
+TRAZAS_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "trazas.jsonl")
+
+# (traza_id, span_id) del span activo en este contexto
+_actual: contextvars.ContextVar = contextvars.ContextVar("span_actual", default=None)
+_ids = itertools.count(1)
+_activas = TRAZAS_ACTIVAS
+_ruta = TRAZAS_PATH
+_cola: "queue.SimpleQueue[Optional[Dict]]" = queue.SimpleQueue()
+_escritor: Optional[threading.Thread] = None
+_lock = threading.Lock()
+
+
+def activar(ruta: Optional[str] = None) -> None:
+    """Empieza a registrar spans (en ruta, o en data/trazas.jsonl)."""
+    global _activas, _ruta
+    _ruta = ruta or TRAZAS_PATH
+    _activas = True
+    log.info('Trazas activadas, se escriben en %s', _ruta)
+
+
+def activas() -> bool:
+    return _activas
+
+
+def _nuevo_id() -> str:
+    # Único dentro del proceso; con el pid alcanza para distinguir corridas
+    return f"{os.getpid():x}-{next(_ids):x}"
+
+
+def _micros() -> float:
+    return time.time_ns() / 1000
+
+
+def _emitir(evento: Dict) -> None:
+    global _escritor
+    if _escritor is None:
+        with _lock:
+            if _escritor is None:
+                _escritor = threading.Thread(target=_escribir, name="trazas", daemon=True)
+                _escritor.start()
+                atexit.register(cerrar)
+    _cola.put(evento)
+
+
+def _escribir() -> None:
+    """Hilo que vacía la cola al archivo. Un None en la cola significa terminar."""
+    hilos_vistos = set()
+    try:
+        with open(_ruta, "a", encoding="utf-8") as f:
+            while True:
+                evento = _cola.get()
+                if evento is None:
+                    break
+                # Un evento de metadatos por hilo para que el visor muestre su nombre
+                if evento["tid"] not in hilos_vistos:
+                    hilos_vistos.add(evento["tid"])
+                    f.write(json.dumps({"name": "thread_name", "ph": "M", "pid": evento["pid"],
+                                        "tid": evento["tid"], "args": {"name": evento.pop("_hilo")}},
+                                       ensure_ascii=False) + "\n")
+                else:
+                    evento.pop("_hilo")
+                f.write(json.dumps(evento, ensure_ascii=False) + "\n")
+                if _cola.empty():
+                    f.flush()
+    except IOError as e:
+        log.error('Error al escribir trazas: %s', e)
+
+
+def exportar_chrome(destino: str, origen: Optional[str] = None) -> int:
+    """
+    Convierte el JSONL de trazas (por defecto el activo) en un .json para
+    chrome://tracing o Perfetto. Las líneas cortadas (p. ej. de un proceso
+    que murió a mitad) se saltean. Devuelve cuántos eventos exportó.
+    """
+    eventos = []
+    with open(origen or _ruta, "r", encoding="utf-8") as f:
+        for linea in f:
+            try:
+                eventos.append(json.loads(linea))
+            except ValueError:
+                continue
+    with open(destino, "w", encoding="utf-8") as f:
+        json.dump({"traceEvents": eventos, "displayTimeUnit": "ms"}, f, ensure_ascii=False)
+    log.info('Exportados %d eventos de trazas a %s', len(eventos), destino)
+    return len(eventos)
+
+
+def cerrar() -> None:
+    """Termina de escribir los spans pendientes (se llama solo al salir)."""
+    global _escritor
+    with _lock:
+        escritor, _escritor = _escritor, None
+    if escritor is not None:
+        _cola.put(None)
+        escritor.join(timeout=5)
+
+
+def _evento(nombre: str, inicio_us: float, duracion_us: float, args: Dict) -> None:
+    hilo = threading.current_thread()
+    _emitir({
+        "name": nombre, "cat": nombre.split(".", 1)[0], "ph": "X",
+        "ts": round(inicio_us, 1), "dur": round(duracion_us, 1),
+        # native_id existe desde Python 3.8; en 3.7 uso el ident de Python
+        "pid": os.getpid(), "tid": getattr(hilo, "native_id", None) or hilo.ident, "_hilo": hilo.name,
+        "args": args,
+    })
+
+
+def registrar(nombre: str, inicio_us: float, duracion_us: float, **datos) -> None:
+    """Registra un span ya terminado, hijo del activo (para código que no puede usar span())."""
+    if not _activas:
+        return
+    padre = _actual.get()
+    traza = padre[0] if padre else _nuevo_id()
+    _evento(nombre, inicio_us, duracion_us,
+            {"traza": traza, "span": _nuevo_id(), "padre": padre[1] if padre else None, **datos})
+
+
+@contextmanager
+def span(nombre: str, **datos):
+    """Abre un span hijo del activo (o una traza nueva si no hay ninguno)."""
+    if not _activas:
+        yield
+        return
+    padre = _actual.get()
+    traza = padre[0] if padre else _nuevo_id()
+    span_id = _nuevo_id()
+    token = _actual.set((traza, span_id))
+    inicio = _micros()
+    error = None
+    try:
+        yield
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        _actual.reset(token)
+        args = {"traza": traza, "span": span_id, "padre": padre[1] if padre else None, **datos}
+        if error:
+            args["error"] = error
+        _evento(nombre, inicio, _micros() - inicio, args)
+
+
+def trazado(nombre: str) -> Callable:
+    """Decorador que envuelve cada llamada a la función en un span."""
+    def decorador(fn):
+        @functools.wraps(fn)
+        def envoltura(*args, **kwargs):
+            if not _activas:
+                return fn(*args, **kwargs)
+            with span(nombre):
+                return fn(*args, **kwargs)
+        return envoltura
+    return decorador
+
+
+def en_contexto(fn: Callable) -> Callable:
+    """
+    Envuelve fn para que corra con el contexto actual (la traza y el span
+    activos). Se usa al encargar trabajo a un ThreadPoolExecutor, que no
+    copia los contextvars por su cuenta.
+    """
+    if not _activas:
+        return fn
+    ctx = contextvars.copy_context()
+    return functools.partial(ctx.run, fn)
@@ -0,0 +1,182 @@
+"""
+Modo vigilancia: detecta cuándo otro proceso reescribe proyectos.csv y
+vuelve a simular solo los proyectos que cambiaron.
+Cada cierto tiempo miro la fecha de modificación, el tamaño y el inodo de
+cada archivo de datos (el CSV o sus shards). Si alguno cambió, lo releo y
+comparo sus filas con la foto anterior por id y por un hash de los campos:
+así salen los proyectos nuevos, los modificados y los eliminados sin
+tener que simular todo otra vez.
+"""
+import hashlib
+import os
+import threading
+from dataclasses import astuple, dataclass, field
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from src.models import Project, Impacto
+from src.tablas import ProjectTable
+from src import store
+from src import crud_service
+import src.logger_base as _log
+from src.constants import VIGILANCIA_INTERVALO_S, SIMULACION_LOTE_HILOS
+
+log = _log.log
+
+
+@dataclass
+class Diferencias:
+    """Ids que cambiaron entre dos revisiones del archivo."""
+    nuevos: List[str] = field(default_factory=list)
+    modificados: List[str] = field(default_factory=list)
+    eliminados: List[str] = field(default_factory=list)
+    # Cómo quedaron los nuevos y los modificados, para mostrarlos y simularlos sin
+    # releer el archivo. En columnas: una reescritura grande puede traer muchos
+    proyectos: ProjectTable = field(default_factory=ProjectTable)
+
+    def __bool__(self) -> bool:
+        return bool(self.nuevos or self.modificados or self.eliminados)
+
+    @property
+    def a_simular(self) -> List[str]:
+        return self.nuevos + self.modificados
+
+
+def _firma(p: Project) -> bytes:
+    """Hash corto de todos los campos del proyecto."""
+    return hashlib.blake2b(repr(astuple(p)).encode("utf-8"), digest_size=8).digest()
+
+
+def _estado_archivo(ruta: str) -> Optional[Tuple[int, int, int]]:
+    # El inodo cambia cuando el archivo se reemplaza con os.replace, aunque coincidan fecha y tamaño
+    try:
+        st = os.stat(ruta)
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_size, st.st_ino
+
+
+class Vigilante:
+    """
+    Guarda la última foto (id -> hash) de cada archivo y calcula las diferencias.
+    Los cambios que hace el mismo proceso se pueden avisar con ignorar_propio()
+    para que no vuelvan como cambios externos.
+    """
+
+    def __init__(self, intervalo: float = VIGILANCIA_INTERVALO_S):
+        self.intervalo = intervalo
+        self._estados: Dict[str, Optional[Tuple[int, int, int]]] = {}
+        self._firmas: Dict[str, Dict[str, bytes]] = {}
+        # id -> hash que dejó este proceso (None si lo borró); lo llenan otros hilos
+        self._propios: Dict[str, Optional[bytes]] = {}
+        self._lock_propios = threading.Lock()
+
+    def tomar_base(self) -> int:
+        """Saca la foto inicial sin reportar nada. Devuelve cuántos proyectos vio."""
+        self._estados.clear()
+        self._firmas.clear()
+        with self._lock_propios:
+            self._propios.clear()
+        self._releer()
+        return sum(len(f) for f in self._firmas.values())
+
+    def revisar(self) -> Diferencias:
+        """Relee solo los archivos que cambiaron desde la revisión anterior y los compara."""
+        dif = self._releer()
+        if dif:
+            log.info("Cambios detectados: %d nuevos, %d modificados, %d eliminados",
+                     len(dif.nuevos), len(dif.modificados), len(dif.eliminados))
+        return dif
+
+    def ignorar_propio(self, pid: str, p: Optional[Project]) -> None:
+        """
+        Avisa que este proceso acaba de guardar el proyecto `p` (None si lo
+        borró). Si la próxima revisión lo encuentra exactamente así no lo
+        reporta; si lo encuentra distinto, otro proceso también lo cambió y sí.
+        Hay que llamarlo después de escribir: si la revisión cae justo entre
+        la escritura y el aviso, el cambio se reporta igual (se simula de más).
+        """
+        with self._lock_propios:
+            self._propios[pid] = None if p is None else _firma(p)
+
+    def _es_propio(self, pid: str, firma: Optional[bytes]) -> bool:
+        # Llamar con _lock_propios tomado; el aviso se usa una sola vez
+        return pid in self._propios and self._propios.pop(pid) == firma
+
+    def _releer(self) -> Diferencias:
+        store.init_store()
+        actuales = store.rutas()
+        # También cuento los archivos que ya no están (p. ej. tras store.repartir)
+        cambiados = [r for r in actuales if _estado_archivo(r) != self._estados.get(r, 0)]
+        cambiados += [r for r in self._estados if r not in actuales]
+
+        # Junto primero la foto anterior de todos los archivos: un proyecto puede cambiar de shard
+        antes: Dict[str, bytes] = {}
+        for ruta in cambiados:
+            antes.update(self._firmas.pop(ruta, {}))
+
+        ahora: Dict[str, bytes] = {}
+        proyectos = ProjectTable()
+        for ruta in cambiados:
+            if ruta not in actuales:
+                self._estados.pop(ruta, None)
+                continue
+            # Tomo el estado antes de leer: si cambia mientras leo, lo vuelvo a ver la próxima vez
+            self._estados[ruta] = _estado_archivo(ruta)
+            firmas = {}
+            for p in store.iter_archivo(ruta):
+                firmas[p.id] = f = _firma(p)
+                if antes.get(p.id) != f:
+                    # Solo guardo los que cambiaron (si el id se repite, vale la última fila)
+                    i = proyectos.posicion(p.id)
+                    if i is None:
+                        proyectos.agregar(p)
+                    else:
+                        proyectos.reemplazar(i, p)
+            self._firmas[ruta] = firmas
+            ahora.update(firmas)
+
+        with self._lock_propios:
+            if self._propios:
+                ids = proyectos.columna("id")
+                quedan = [i for i, pid in enumerate(ids) if not self._es_propio(pid, ahora[pid])]
+                if len(quedan) < len(proyectos):
+                    proyectos = ProjectTable.desde(proyectos[i] for i in quedan)
+                eliminados = [pid for pid in antes if pid not in ahora and not self._es_propio(pid, None)]
+            else:
+                eliminados = [pid for pid in antes if pid not in ahora]
+        ids = proyectos.columna("id")
+        return Diferencias(
+            nuevos=[pid for pid in ids if pid not in antes],
+            modificados=[pid for pid in ids if pid in antes],
+            eliminados=eliminados,
+            proyectos=proyectos,
+        )
+
+    def aplicar(self, dif: Diferencias,
+                max_hilos: int = SIMULACION_LOTE_HILOS) -> Iterator[Tuple[Project, Optional[Impacto]]]:
+        """
+        Borra los resultados de los eliminados y simula los nuevos y modificados
+        (simular_lote ya guarda cada resultado). Devuelve (proyecto, impacto)
+        a medida que terminan. Los proyectos salen de dif.proyectos, que revisar()
+        ya leyó, así que no se vuelve a recorrer el CSV.
+        """
+        for pid in dif.eliminados:
+            store.delete_impacto(pid)
+        if dif.a_simular:
+            yield from crud_service.simular_lote(max_hilos=max_hilos, proyectos=dif.proyectos)
+
+    def ejecutar(self, al_cambiar: Callable[[Diferencias], None],
+                 detener: Optional[threading.Event] = None) -> None:
+        """
+        Revisa cada `intervalo` segundos hasta que se marque `detener` y llama
+        a al_cambiar(dif) cuando algo cambió. Los errores de una revisión se
+        registran y no cortan la vigilancia.
+        """
+        detener = detener or threading.Event()
+        log.info("Vigilando %s cada %.1f s", ", ".join(store.rutas()), self.intervalo)
+        while not detener.wait(self.intervalo):
+            try:
+                dif = self.revisar()
+                if dif:
+                    al_cambiar(dif)
+            except Exception as e:
+                log.error("Error al revisar cambios en los datos: %s", e)
@@ -0,0 +1,74 @@
+import os
+
+import pytest
+
+from src import cambios
+from src.models import Project
+
+
+@pytest.fixture(autouse=True)
+def registro(tmp_path, monkeypatch):
+    monkeypatch.setattr(cambios, "CAMBIOS_PATH", str(tmp_path / "cambios.jsonl"))
+    monkeypatch.setattr(cambios, "CHECKPOINTS_PATH", str(tmp_path / "cambios_checkpoints.json"))
+    monkeypatch.setattr(cambios, "_ultima", (0, -1))
+
+
+def _crear(*ids, nombre="n"):
+    for pid in ids:
+        cambios.registrar("create", pid, None, Project(pid, nombre, "mineria", 1.0, 1))
+
+
+def test_secuencias_consecutivas():
+    _crear("A", "B", "C")
+    assert [e["seq"] for e in cambios.leer()] == [1, 2, 3]
+    assert [e["id"] for e in cambios.leer(desde=1, limite=1)] == ["B"]
+
+
+def test_sin_confirmar_se_vuelven_a_entregar():
+    _crear("A", "B")
+    eventos, cp = cambios.leer_consumidor("c")
+    assert [e["seq"] for e in eventos] == [1, 2]
+    assert cp == {"seq": 2, "offset": os.path.getsize(cambios.CAMBIOS_PATH)}
+    # El consumidor "falló" antes de confirmar: recibe lo mismo otra vez
+    assert cambios.leer_consumidor("c")[0] == eventos
+
+
+def test_confirmar_avanza_solo_a_ese_consumidor():
+    _crear("A", "B")
+    cambios.confirmar("c", cambios.leer_consumidor("c")[1])
+    _crear("C")
+    assert [e["id"] for e in cambios.leer_consumidor("c")[0]] == ["C"]
+    assert [e["id"] for e in cambios.leer_consumidor("otro")[0]] == ["A", "B", "C"]
+    assert cambios.checkpoint("otro") == {"seq": 0, "offset": 0}
+
+
+def test_limite_deja_el_checkpoint_en_el_ultimo_entregado():
+    _crear("A", "B", "C")
+    eventos, cp = cambios.leer_consumidor("c", limite=2)
+    assert [e["seq"] for e in eventos] == [1, 2]
+    cambios.confirmar("c", cp)
+    assert [e["seq"] for e in cambios.leer_consumidor("c")[0]] == [3]
+
+
+def test_linea_a_medio_escribir_se_toma_despues():
+    _crear("A")
+    linea = b'{"seq": 2, "ts": 0, "op": "delete", "id": "A", "antes": null, "despues": null}\n'
+    with open(cambios.CAMBIOS_PATH, "ab") as f:
+        f.write(linea[:20])
+    eventos, cp = cambios.leer_consumidor("c")
+    assert [e["seq"] for e in eventos] == [1]
+    cambios.confirmar("c", cp)
+    with open(cambios.CAMBIOS_PATH, "ab") as f:
+        f.write(linea[20:])
+    assert [e["seq"] for e in cambios.leer_consumidor("c")[0]] == [2]
+
+
+def test_registro_recreado_ignora_el_offset_guardado():
+    _crear("A", "B", "C", nombre="n" * 200)
+    cambios.confirmar("c", cambios.leer_consumidor("c")[1])
+    # Otro registro más corto en el mismo lugar: el offset quedó fuera del archivo
+    os.remove(cambios.CAMBIOS_PATH)
+    cambios._ultima = (0, -1)
+    _crear("X", "Y", "Z", "W")
+    assert cambios.checkpoint("c")["offset"] > os.path.getsize(cambios.CAMBIOS_PATH)
+    assert [e["id"] for e in cambios.leer_consumidor("c")[0]] == ["W"]
@@ -0,0 +1,30 @@
+import pytest
+
+from src.metricas import HistogramaHDR
+
+
+def test_sin_muestras_no_hay_percentil():
+    assert HistogramaHDR().percentil(50) is None
+
+
+def test_percentiles_con_error_relativo_acotado():
+    h = HistogramaHDR(subcubetas=32)
+    for ms in range(1, 1001):
+        h.registrar(ms / 1000)
+    assert h.cantidad == 1000
+    for p, esperado in ((50, 0.500), (90, 0.900), (99, 0.990)):
+        assert h.percentil(p) == pytest.approx(esperado, rel=1 / 32)
+
+
+def test_percentiles_extremos_quedan_entre_minimo_y_maximo():
+    h = HistogramaHDR()
+    for s in (0.003, 0.004, 2.5):
+        h.registrar(s)
+    assert h.percentil(0) >= h.minimo == 0.003
+    assert h.percentil(100) == h.maximo == 2.5
+
+
+def test_muestra_unica_devuelve_su_valor():
+    h = HistogramaHDR()
+    h.registrar(0.1234)
+    assert h.percentil(50) == pytest.approx(0.1234)
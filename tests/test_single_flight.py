@@ -0,0 +1,92 @@
+import threading
+import time
+
+import pytest
+
+from src import simulation
+from src.models import Project
+from src.single_flight import SingleFlight
+
+ESPERA_S = 5
+
+
+def _esperar_duplicadas(sf: SingleFlight, clave, cuantas: int):
+    limite = time.monotonic() + ESPERA_S
+    while time.monotonic() < limite:
+        with sf._lock:
+            llamada = sf._en_vuelo.get(clave)
+            if llamada is not None and llamada.esperando >= cuantas:
+                return
+        time.sleep(0.001)
+    pytest.fail("Las llamadas duplicadas no llegaron a esperar")
+
+
+def _en_hilos(n: int, fn):
+    resultados, errores = [None] * n, [None] * n
+
+    def correr(i):
+        try:
+            resultados[i] = fn()
+        except Exception as e:
+            errores[i] = e
+
+    hilos = [threading.Thread(target=correr, args=(i,)) for i in range(n)]
+    for h in hilos:
+        h.start()
+    return hilos, resultados, errores
+
+
+def test_llamadas_identicas_comparten_resultado():
+    sf, seguir, llamadas = SingleFlight(), threading.Event(), []
+
+    def trabajo():
+        llamadas.append(1)
+        seguir.wait(ESPERA_S)
+        return object()
+
+    hilos, resultados, _ = _en_hilos(5, lambda: sf.ejecutar("k", trabajo))
+    _esperar_duplicadas(sf, "k", 4)
+    seguir.set()
+    for h in hilos:
+        h.join()
+    assert len(llamadas) == 1
+    assert all(r is resultados[0] for r in resultados)
+    # Terminada la llamada, la clave se libera y la siguiente vuelve a calcular
+    sf.ejecutar("k", trabajo)
+    assert len(llamadas) == 2
+
+
+def test_el_error_tambien_se_comparte():
+    sf, seguir = SingleFlight(), threading.Event()
+
+    def trabajo():
+        seguir.wait(ESPERA_S)
+        raise ValueError("falló")
+
+    hilos, _, errores = _en_hilos(3, lambda: sf.ejecutar("k", trabajo))
+    _esperar_duplicadas(sf, "k", 2)
+    seguir.set()
+    for h in hilos:
+        h.join()
+    assert all(isinstance(e, ValueError) for e in errores)
+    assert errores[1] is errores[0]
+
+
+def test_simular_agrupa_proyectos_con_el_mismo_contenido(monkeypatch):
+    seguir, llamadas = threading.Event(), []
+
+    def simular_falso(p, al_recibir=None):
+        llamadas.append(p.id)
+        seguir.wait(ESPERA_S)
+        return object()
+
+    monkeypatch.setattr(simulation, "_simular", simular_falso)
+    p = Project("P1", "n", "mineria", 10.0, 12)
+    clave = (p.id, p.nombre, p.tipo, p.area_ha, p.duracion_meses, p.ubicacion, p.intensidad)
+    hilos, resultados, _ = _en_hilos(4, lambda: simulation.simular(Project(*clave)))
+    _esperar_duplicadas(simulation._vuelos, clave, 3)
+    seguir.set()
+    for h in hilos:
+        h.join()
+    assert llamadas == ["P1"]
+    assert all(r is resultados[0] for r in resultados)
@@ -0,0 +1,51 @@
+import os
+
+import pytest
+
+from src import store
+
+fcntl = pytest.importorskip("fcntl")
+
+
+@pytest.fixture
+def ruta(tmp_path):
+    return str(tmp_path / "proyectos.csv")
+
+
+def _tomado(ruta: str) -> bool:
+    """Prueba el lock desde otra descripción de archivo (flock no la comparte con la del hilo)."""
+    fd = os.open(ruta + ".lock", os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return True
+    finally:
+        os.close(fd)
+    return False
+
+
+def test_bloqueo_exclusivo_es_reentrante(ruta):
+    with store._bloqueo(exclusivo=True, ruta=ruta):
+        with store._bloqueo(exclusivo=True, ruta=ruta):
+            assert _tomado(ruta)
+        # Soltar el interno no suelta el del with de afuera
+        assert _tomado(ruta)
+    assert not _tomado(ruta)
+
+
+def test_compartido_dentro_del_exclusivo(ruta):
+    with store._bloqueo(exclusivo=True, ruta=ruta):
+        with store._bloqueo(exclusivo=False, ruta=ruta):
+            pass
+        assert _tomado(ruta)
+    assert not _tomado(ruta)
+
+
+def test_subir_de_compartido_a_exclusivo_falla(ruta):
+    with store._bloqueo(exclusivo=False, ruta=ruta):
+        with pytest.raises(RuntimeError):
+            with store._bloqueo(exclusivo=True, ruta=ruta):
+                pass
+        # El compartido sigue tomado y se suelta normalmente
+        assert _tomado(ruta)
+    assert not _tomado(ruta)